@@ -0,0 +1,161 @@
+# batch.py
+import concurrent.futures
+import functools
+import io
+import multiprocessing
+import os
+
+import pandas as pd
+
+from ingestion import LAYOUTS, detect_layout, layout_for_file_type, test_rows_frame
+from patient_index import count_repeated_patients, find_repeated_patients
+from phones import LENGTH_REASONS, REASON_EMPTY, phone_reasons
+
+# --- PROCESSAMENTO DE VÁRIOS ARQUIVOS EM PARALELO ---
+# Cada arquivo é enviado ao parser do layout detectado em um processo separado
+# (um por núcleo). Os resultados são unidos em uma única carga: linhas que já
+# vieram de um arquivo anterior são descartadas e as estatísticas são recalculadas
+# sobre o conjunto unido, mantendo também as estatísticas de cada arquivo. Os
+# registros estáticos de teste dos layouts entram uma vez, depois da união.
+STAT_KEYS = ['total', 'unique', 'repeated', 'bad_total', 'bad_empty', 'bad_length']
+
+
+def create_process_pool(max_workers=None):
+    """
+    Cria o pool de processos (um por núcleo). Usa 'spawn' porque o servidor do
+    Streamlit tem várias threads e 'fork' copiaria locks em estado inconsistente.
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+def parse_file(layout_name, data, **options):
+    """Processa o conteúdo de um arquivo com o layout indicado (executado nos workers)."""
+    return LAYOUTS[layout_name].parse(io.BytesIO(data), **options)
+
+def _concat_new_rows(frames):
+    """
+    Concatena os DataFrames na ordem dos arquivos, descartando linhas que já vieram
+    de um arquivo anterior (mesma impressão digital no índice). Repetições dentro do
+    mesmo arquivo têm impressões diferentes e são mantidas.
+    """
+    non_empty = [df for df in frames if not df.empty]
+    if not non_empty:
+        return frames[0] if frames else pd.DataFrame()
+    merged = pd.concat(non_empty)
+    return merged[~merged.index.duplicated()]
+
+def merge_results(results):
+    """Une os resultados (good_df, bad_df, repeated_df, stats) de vários arquivos em uma carga só."""
+    if len(results) == 1:
+        return results[0]
+
+    good_df = _concat_new_rows([result[0] for result in results])
+    bad_df = _concat_new_rows([result[1] for result in results])
+    if {'nome_do_paciente', 'data', 'horario_ajustado'}.issubset(good_df.columns):
+        repeated_df = find_repeated_patients(good_df)
+    else:
+        repeated_df = pd.DataFrame(columns=good_df.columns)
+
+    all_rows = pd.concat([df for df in (good_df, bad_df) if not df.empty], ignore_index=True)
+    phones = all_rows.get('telefone_ajustado', pd.Series(dtype=object))
+    bad_reasons = phone_reasons(bad_df.get('telefone_ajustado', pd.Series(dtype=object)))
+
+    stats = {
+        'total': len(all_rows),
+        'unique': int(phones[phones != ''].nunique()),
+        'repeated': count_repeated_patients(all_rows) if 'data' in all_rows else 0,
+        'bad_total': len(bad_df),
+        'bad_empty': int((bad_reasons == REASON_EMPTY).sum()),
+        'bad_length': int(bad_reasons.isin(LENGTH_REASONS).sum()),
+    }
+    return good_df, bad_df, repeated_df, stats
+
+def add_test_rows(good_df, layouts):
+    """Insere no topo de good_df os registros estáticos de teste dos layouts da carga, uma vez cada."""
+    frames = [test_rows_frame(layout.test_rows) for layout in dict.fromkeys(layouts) if layout.test_rows]
+    if not frames:
+        return good_df
+    test_rows = pd.concat(frames)
+    test_rows = test_rows[~test_rows.index.duplicated()]
+    if good_df.empty:
+        return test_rows
+    columns = list(good_df.columns) + [column for column in test_rows.columns if column not in good_df.columns]
+    return pd.concat([test_rows, good_df])[columns]
+
+def process_uploads(uploaded_files, file_type, cache=None, pool=None, previous=None, on_progress=None):
+    """
+    Processa vários uploads e retorna (good_df, bad_df, repeated_df, stats, file_stats).
+
+    O layout de cada arquivo é detectado no processo principal (só o início do
+    arquivo é lido) e os arquivos que não estão no cache são processados em paralelo
+    no pool. file_stats tem uma linha por arquivo com layout, estatísticas e erro.
+    'previous' (nome do layout, good_df, bad_df) é a carga anterior: arquivos do
+    mesmo layout processados aqui ou no pool reaproveitam as linhas que não mudaram.
+    'on_progress(nome do arquivo, estatísticas parciais)' acompanha a leitura dos
+    arquivos processados no processo principal; os do pool informam as estatísticas
+    do arquivo quando ele termina.
+    """
+    layouts, keys, results, errors = [], [], {}, {}
+    for index, uploaded_file in enumerate(uploaded_files):
+        layout = detect_layout(uploaded_file) or layout_for_file_type(file_type)
+        layouts.append(layout)
+        keys.append(cache.key_for(uploaded_file, layout.name) if cache else None)
+        cached = cache.get(keys[-1]) if cache else None
+        if cached is not None:
+            results[index] = cached
+
+    def parse_options(layout):
+        incremental = previous is not None and previous[0] == layout.name and layout.extract_rows is not None
+        return {'previous': previous[1:]} if incremental else {}
+
+    pending = [index for index in range(len(uploaded_files)) if index not in results]
+    outcomes = {}
+    if len(pending) > 1 and pool is not None:
+        futures = {
+            pool.submit(
+                parse_file, layouts[index].name, uploaded_files[index].getvalue(), **parse_options(layouts[index]),
+            ): index
+            for index in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                outcomes[index] = future.result()
+            except Exception as e:
+                errors[index] = str(e)
+                continue
+            if on_progress is not None and outcomes[index][3]:
+                on_progress(uploaded_files[index].name, outcomes[index][3])
+    else:
+        for index in pending:
+            options = parse_options(layouts[index])
+            if on_progress is not None:
+                options['on_progress'] = functools.partial(on_progress, uploaded_files[index].name)
+            try:
+                outcomes[index] = layouts[index].parse(uploaded_files[index], **options)
+            except Exception as e:
+                errors[index] = str(e)
+
+    for index, result in outcomes.items():
+        results[index] = result
+        if cache:
+            cache.put(keys[index], result)
+
+    if not results:
+        raise ValueError(next(iter(errors.values()), "Nenhum arquivo foi enviado."))
+
+    file_stats = pd.DataFrame([
+        {
+            'arquivo': uploaded_file.name,
+            'layout': layouts[index].label,
+            **{key: int(results[index][3].get(key, 0)) if index in results else 0 for key in STAT_KEYS},
+            'erro': errors.get(index, ''),
+        }
+        for index, uploaded_file in enumerate(uploaded_files)
+    ])
+    good_df, bad_df, repeated_df, stats = merge_results([results[index] for index in sorted(results)])
+    if not (good_df.empty and bad_df.empty):
+        good_df = add_test_rows(good_df, [layouts[index] for index in sorted(results)])
+    return good_df, bad_df, repeated_df, stats, file_stats
@@ -0,0 +1,301 @@
+# dispatch_jobs.py
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from dispatch_ledger import dispatch_keys
+from dispatcher import CHUNK_FAILED, CHUNK_OK, CHUNK_SIZE, dispatch_contacts, sent_positions, split_chunks
+from ingestion import is_test_row
+from local_store import DATA_DIR, connect, signed_int64
+
+# --- JOBS DE DISPARO RETOMÁVEIS ---
+# Cada envio vira um job persistido antes do primeiro POST: os contatos (já com a
+# chave de idempotência de cada um), a divisão em lotes e o estado de cada lote.
+# A cada lote concluído o job grava um checkpoint (estado do lote e cursor = primeiro
+# lote ainda não enviado). Se o envio cair no meio (erro, timeout, sessão ou
+# servidor reiniciado), o job pode ser retomado: só os lotes não enviados saem de
+# novo, com as mesmas chaves, e o webhook descarta o que já tiver recebido.
+#
+# Quem assume um job (claim) recebe um token de dono; só o dono inicia o envio.
+# Assim um job enfileirado no worker que foi retomado por outra sessão enquanto
+# esperava não é enviado duas vezes.
+JOBS_PATH = os.path.join(DATA_DIR, "dispatch_jobs.sqlite3")
+
+JOB_PENDING = 'pendente'
+JOB_QUEUED = 'na_fila'
+JOB_RUNNING = 'em_andamento'
+JOB_INTERRUPTED = 'interrompido'
+JOB_DONE = 'concluido'
+JOB_CANCELLED = 'cancelado'
+CHUNK_PENDING = 'pendente'
+
+# Um job 'na_fila' ou 'em_andamento' sem checkpoint há mais que isto (segundos) é
+# considerado abandonado (sessão encerrada, servidor reiniciado) e pode ser retomado
+STALE_AFTER = 600
+
+
+class DispatchJobStore:
+    """Jobs de disparo persistidos (SQLite), compartilhados entre sessões."""
+
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    appointment_type TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    cursor INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT
+                )
+            """)
+            # Bancos criados antes do token de dono ganham a coluna
+            if 'owner' not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_chunks (
+                    job_id TEXT NOT NULL,
+                    lote INTEGER NOT NULL,
+                    inicio INTEGER NOT NULL,
+                    fim INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    http INTEGER,
+                    erro TEXT NOT NULL DEFAULT '',
+                    segundos REAL,
+                    PRIMARY KEY (job_id, lote)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_contacts (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    row_id INTEGER,
+                    contact TEXT NOT NULL,
+                    PRIMARY KEY (job_id, position)
+                ) WITHOUT ROWID
+            """)
+
+    def create_job(self, contacts, appointment_type, row_ids=None, chunk_size=CHUNK_SIZE):
+        """
+        Persiste um job com os contatos (dicts, na ordem de envio) e retorna o job_id.
+        Cada contato ganha o campo 'idempotency_key': a mesma chave do registro de
+        disparos (dispatch_ledger.dispatch_keys), estável entre jobs, então o webhook
+        também descarta o contato reenviado por um job novo. Os registros de teste
+        podem sair de novo: a chave deles leva o job_id. 'row_ids' (id_linha da
+        carga) permite marcar as linhas como enviadas quando o job termina em outra execução.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        keys = dispatch_keys(pd.DataFrame(contacts), appointment_type) if contacts else pd.Series(dtype=object)
+        if row_ids is not None and contacts:
+            is_test = is_test_row(pd.Index(np.asarray(list(row_ids), dtype=np.uint64)))
+            keys = keys.where(~is_test, dispatch_keys(pd.DataFrame(contacts), f"{appointment_type}|{job_id}"))
+        contacts = [{**contact, 'idempotency_key': key} for contact, key in zip(contacts, keys)]
+        row_ids = [None] * len(contacts) if row_ids is None else signed_int64(list(row_ids)).tolist()
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, appointment_type, total, chunk_size, status, cursor, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                (job_id, appointment_type, len(contacts), chunk_size, JOB_PENDING, now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_chunks (job_id, lote, inicio, fim, status) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, number + 1, start, stop, CHUNK_PENDING)
+                 for number, (start, stop) in enumerate(split_chunks(len(contacts), chunk_size))),
+            )
+            conn.executemany(
+                "INSERT INTO job_contacts VALUES (?, ?, ?, ?)",
+                ((job_id, position, row_id, json.dumps(contact, default=str))
+                 for position, (row_id, contact) in enumerate(zip(row_ids, contacts))),
+            )
+        return job_id
+
+    def job(self, job_id):
+        """Registro do job (dict) ou None."""
+        with connect(self.path) as conn:
+            conn.row_factory = lambda cursor, row: {column[0]: value for column, value in zip(cursor.description, row)}
+            return conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def claim(self, job_id, status=JOB_RUNNING, stale_after=STALE_AFTER, now=None):
+        """
+        Assume o job (status JOB_RUNNING, ou JOB_QUEUED para o worker) e retorna o
+        token de dono. Retorna None se ele já está concluído/cancelado ou nas mãos
+        de outra sessão (checkpoint recente).
+        """
+        now = now or time.time()
+        owner = uuid.uuid4().hex
+        with connect(self.path) as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, updated_at = ? WHERE job_id = ? AND "
+                "(status IN (?, ?) OR (status IN (?, ?) AND updated_at < ?))",
+                (status, owner, now, job_id, JOB_PENDING, JOB_INTERRUPTED, JOB_QUEUED, JOB_RUNNING, now - stale_after),
+            ).rowcount
+        return owner if claimed == 1 else None
+
+    def start(self, job_id, owner):
+        """Passa o job do dono para 'em_andamento'. False se outro assumiu o job nesse meio-tempo."""
+        with connect(self.path) as conn:
+            started = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND owner = ? AND status IN (?, ?)",
+                (JOB_RUNNING, time.time(), job_id, owner, JOB_QUEUED, JOB_RUNNING),
+            ).rowcount
+        return started == 1
+
+    def checkpoint(self, job_id, result):
+        """Grava o resultado de um lote e avança o cursor até o primeiro lote não enviado."""
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE job_chunks SET status = ?, tentativas = tentativas + ?, http = ?, erro = ?, segundos = ? "
+                "WHERE job_id = ? AND lote = ?",
+                (result['status'], result['tentativas'], result['http'], result['erro'], result['segundos'],
+                 job_id, result['lote']),
+            )
+            conn.execute(
+                "UPDATE jobs SET updated_at = ?, cursor = COALESCE("
+                "(SELECT MIN(lote) - 1 FROM job_chunks WHERE job_id = ? AND status != ?), "
+                "(SELECT COUNT(*) FROM job_chunks WHERE job_id = ?)) WHERE job_id = ?",
+                (time.time(), job_id, CHUNK_OK, job_id, job_id),
+            )
+
+    def finish(self, job_id, owner):
+        """
+        Fecha a execução do dono: 'concluido' se todos os lotes saíram, senão
+        'interrompido'. Um job descartado ou assumido por outra sessão nesse
+        meio-tempo não é alterado. Retorna o status do job.
+        """
+        with connect(self.path) as conn:
+            missing = conn.execute(
+                "SELECT COUNT(*) FROM job_chunks WHERE job_id = ? AND status != ?", (job_id, CHUNK_OK),
+            ).fetchone()[0]
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND owner = ? AND status != ?",
+                (JOB_DONE if missing == 0 else JOB_INTERRUPTED, time.time(), job_id, owner, JOB_CANCELLED),
+            )
+            return conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def cancel(self, job_id):
+        """Descarta um job não concluído (os lotes pendentes não serão mais enviados)."""
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status != ?",
+                (JOB_CANCELLED, time.time(), job_id, JOB_DONE),
+            )
+
+    def contacts(self, job_id):
+        """(contatos na ordem do job, id_linha de cada um como uint64 — 0 quando não informado)."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT contact, row_id FROM job_contacts WHERE job_id = ? ORDER BY position", (job_id,),
+            ).fetchall()
+        contacts = [json.loads(contact) for contact, _ in rows]
+        row_ids = np.array([row_id or 0 for _, row_id in rows], dtype=np.int64).view(np.uint64)
+        return contacts, row_ids
+
+    def chunk_results(self, job_id):
+        """Estado de cada lote do job (mesmas colunas do resultado de dispatch_contacts)."""
+        with connect(self.path) as conn:
+            return pd.read_sql_query(
+                "SELECT lote, inicio, fim, fim - inicio AS contatos, status, tentativas, http, erro, segundos "
+                "FROM job_chunks WHERE job_id = ? ORDER BY lote",
+                conn, params=(job_id,),
+            )
+
+    def sent_row_ids(self, job_id):
+        """id_linha (uint64) dos contatos dos lotes já enviados do job."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT p.row_id FROM job_contacts p JOIN job_chunks c ON c.job_id = p.job_id "
+                "AND p.position >= c.inicio AND p.position < c.fim "
+                "WHERE p.job_id = ? AND c.status = ? AND p.row_id IS NOT NULL",
+                (job_id, CHUNK_OK),
+            ).fetchall()
+        return np.array([row_id for row_id, in rows], dtype=np.int64).view(np.uint64)
+
+    def progress(self, job_ids):
+        """
+        Registro de progresso dos jobs (uma linha por job): status e contatos
+        enviados, com falha e pendentes. Só lê as tabelas de jobs e de lotes.
+        """
+        job_ids = list(job_ids)
+        if not job_ids:
+            return pd.DataFrame(columns=['job_id', 'appointment_type', 'status', 'total', 'enviados', 'falhas', 'pendentes'])
+        with connect(self.path) as conn:
+            return pd.read_sql_query(
+                "SELECT j.job_id, j.appointment_type, j.status, j.total, "
+                "COALESCE(SUM(CASE WHEN c.status = ? THEN c.fim - c.inicio END), 0) AS enviados, "
+                "COALESCE(SUM(CASE WHEN c.status = ? THEN c.fim - c.inicio END), 0) AS falhas, "
+                "COALESCE(SUM(CASE WHEN c.status = ? THEN c.fim - c.inicio END), 0) AS pendentes "
+                f"FROM jobs j JOIN job_chunks c USING (job_id) WHERE j.job_id IN ({', '.join('?' * len(job_ids))}) "
+                "GROUP BY j.job_id ORDER BY j.created_at",
+                conn, params=(CHUNK_OK, CHUNK_FAILED, CHUNK_PENDING, *job_ids),
+            )
+
+    def resumable_jobs(self, stale_after=STALE_AFTER, now=None):
+        """Jobs que podem ser retomados (pendentes, interrompidos ou abandonados), com a contagem de enviados."""
+        now = now or time.time()
+        with connect(self.path) as conn:
+            return pd.read_sql_query(
+                "SELECT j.job_id, j.appointment_type, j.status, j.total, j.cursor, j.created_at, j.updated_at, "
+                "COALESCE(SUM(CASE WHEN c.status = ? THEN c.fim - c.inicio END), 0) AS enviados "
+                "FROM jobs j JOIN job_chunks c USING (job_id) "
+                "WHERE j.status IN (?, ?) OR (j.status IN (?, ?) AND j.updated_at < ?) "
+                "GROUP BY j.job_id ORDER BY j.created_at",
+                conn, params=(CHUNK_OK, JOB_PENDING, JOB_INTERRUPTED, JOB_QUEUED, JOB_RUNNING, now - stale_after),
+            )
+
+
+def run_job(store, job_id, owner=None, on_chunk=None, ledger=None, **dispatch_options):
+    """
+    Envia (ou retoma) um job: só os lotes ainda não enviados saem, com checkpoint a
+    cada lote concluído. 'owner' é o token de quem já assumiu o job (ex: ao
+    enfileirar); sem ele o job é assumido aqui. Com 'ledger' os contatos de cada
+    lote enviado (menos os registros de teste) vão para o registro de disparos
+    assim que o lote termina.
+    Retorna (resultado desta execução por lote, contatos enviados nesta execução,
+    id_linha deles) ou None se o job não pôde ser assumido.
+    """
+    job = store.job(job_id)
+    if job is None:
+        return None
+    owner = owner or store.claim(job_id)
+    if owner is None or not store.start(job_id, owner):
+        return None
+    contacts, row_ids = store.contacts(job_id)
+    pending = store.chunk_results(job_id)
+    pending = (pending.loc[pending['status'] != CHUNK_OK, 'lote'] - 1).tolist()
+
+    def checkpoint(result, done, total):
+        store.checkpoint(job_id, result)
+        if ledger is not None and result['status'] == CHUNK_OK:
+            try:
+                start, stop = result['inicio'], result['fim']
+                is_test = is_test_row(pd.Index(row_ids[start:stop]))
+                chunk = [contact for contact, test in zip(contacts[start:stop], is_test) if not test]
+                ledger.record(
+                    pd.DataFrame(chunk), job['appointment_type'], keys=[contact['idempotency_key'] for contact in chunk],
+                )
+            except sqlite3.Error:
+                pass  # o envio vale mesmo sem registro; a chave de idempotência ainda evita duplicatas
+        if on_chunk is not None:
+            on_chunk(result, done, total)
+
+    try:
+        results = dispatch_contacts(
+            contacts, job['appointment_type'], chunk_size=job['chunk_size'], on_chunk=checkpoint,
+            job_id=job_id, chunk_numbers=pending, **dispatch_options,
+        )
+    finally:
+        store.finish(job_id, owner)
+    positions = sent_positions(results)
+    return results, [contacts[position] for position in positions], row_ids[positions]
+
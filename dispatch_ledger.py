@@ -0,0 +1,125 @@
+# dispatch_ledger.py
+import datetime
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from local_store import DATA_DIR, connect
+from session_frames import text_column
+
+# --- REGISTRO DE DISPAROS JÁ ENVIADOS ---
+# Cada contato enviado ao webhook fica registrado pela sua chave de disparo. Antes
+# de um novo envio as linhas selecionadas são cruzadas em bloco com o registro, e
+# as que já foram enviadas (por esta ou por outra sessão, deste ou de outro
+# arquivo) saem da carga.
+#
+# A chave depende do layout da linha: agendamentos (consultas, serviços) são
+# identificados por telefone, data e horário; a autorização não tem agendamento,
+# então usa telefone, terapia e a data da carga (a mesma autorização não sai duas
+# vezes no dia, e uma nova autorização para o mesmo telefone não fica bloqueada).
+LEDGER_PATH = os.path.join(DATA_DIR, "dispatches.sqlite3")
+APPOINTMENT_KEY = ['telefone_ajustado', 'data', 'horario_ajustado']
+AUTORIZACAO_KEY = ['telefone_ajustado', 'terapia']
+SENT_COLUMN = 'Já enviado'
+
+# Disparos registrados há mais tempo que isso saem do registro
+RETENTION_DAYS = 60
+
+# A chave é feita de dois hashes de 64 bits (hash_pandas_object com chaves
+# diferentes), escritos em 32 dígitos hexadecimais
+HASH_KEYS = ('cofrat-disparo-1', 'cofrat-disparo-2')
+HEX_DIGITS = np.array(list('0123456789abcdef'))
+NIBBLE_SHIFTS = np.arange(60, -4, -4, dtype=np.uint64)
+
+
+def dispatch_keys(df, appointment_type, load_date=None):
+    """
+    Chave de disparo de cada linha de df (Series de textos, mesmo índice): os campos
+    da chave do layout da linha mais o tipo de disparo. Linhas sem data e sem
+    horário (autorização) usam a chave da autorização com 'load_date' (padrão: hoje).
+    """
+    load_date = (load_date or datetime.date.today()).isoformat()
+    appointment = {column: text_column(df, column) for column in APPOINTMENT_KEY}
+    has_appointment = ((appointment['data'] != '') | (appointment['horario_ajustado'] != '')).to_numpy()
+    autorizacao = [text_column(df, column) for column in AUTORIZACAO_KEY] + [pd.Series(load_date, index=df.index)]
+    fields = pd.DataFrame({
+        position: first.where(has_appointment, second)
+        for position, (first, second) in enumerate(zip(appointment.values(), autorizacao))
+    }, index=df.index).assign(appointment_type=appointment_type)
+    hashes = np.column_stack([
+        pd.util.hash_pandas_object(fields, index=False, hash_key=hash_key).to_numpy() for hash_key in HASH_KEYS
+    ]).reshape(len(df), len(HASH_KEYS))
+    nibbles = (hashes[:, :, None] >> NIBBLE_SHIFTS) & np.uint64(15)
+    keys = HEX_DIGITS[nibbles.reshape(len(df), 16 * len(HASH_KEYS))].view(f'<U{16 * len(HASH_KEYS)}').ravel()
+    return pd.Series(keys, index=df.index, dtype=object)
+
+class DispatchLedger:
+    """Registro persistente (SQLite) dos contatos já enviados, compartilhado entre sessões."""
+
+    def __init__(self, path=LEDGER_PATH, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        with connect(self.path) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS dispatch_keys (
+                    chave TEXT PRIMARY KEY,
+                    appointment_type TEXT NOT NULL,
+                    sent_at REAL NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS dispatch_keys_sent_at ON dispatch_keys (sent_at);
+            """)
+            self._migrate(conn)
+            self._prune(conn)
+
+    def _migrate(self, conn):
+        """
+        Converte o registro antigo (telefone, data, horário, tipo) para chaves de
+        disparo. Registros sem data e horário (autorização) tinham uma chave só por
+        telefone e são descartados.
+        """
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'dispatches'").fetchone():
+            return
+        old = pd.read_sql_query(
+            "SELECT telefone_ajustado, data, horario_ajustado, appointment_type, sent_at FROM dispatches "
+            "WHERE data != '' OR horario_ajustado != ''", conn,
+        )
+        for appointment_type, rows in old.groupby('appointment_type'):
+            conn.executemany(
+                "INSERT OR IGNORE INTO dispatch_keys VALUES (?, ?, ?)",
+                zip(dispatch_keys(rows, appointment_type), [appointment_type] * len(rows), rows['sent_at']),
+            )
+        conn.execute("DROP TABLE dispatches")
+
+    def _prune(self, conn):
+        """Remove os registros mais antigos que o período de retenção."""
+        cutoff = time.time() - self.retention_days * 24 * 60 * 60
+        conn.execute("DELETE FROM dispatch_keys WHERE sent_at < ?", (cutoff,))
+
+    def already_sent(self, df, appointment_type, load_date=None):
+        """Máscara (mesmo índice de df) das linhas já enviadas com este tipo de disparo."""
+        keys = dispatch_keys(df, appointment_type, load_date)
+        if keys.empty:
+            return pd.Series(False, index=df.index)
+        with connect(self.path) as conn:
+            # Só as chaves da carga saem do banco
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_keys (chave TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM lookup_keys")
+            conn.executemany("INSERT OR IGNORE INTO lookup_keys VALUES (?)", ((key,) for key in keys))
+            sent = {key for key, in conn.execute("SELECT chave FROM dispatch_keys JOIN lookup_keys USING (chave)")}
+        return keys.isin(sent)
+
+    def record(self, df, appointment_type, keys=None, load_date=None):
+        """
+        Registra as linhas enviadas com sucesso. 'keys' são as chaves de disparo já
+        calculadas (ex: as guardadas no job); sem elas a chave é calculada de df.
+        """
+        keys = dispatch_keys(df, appointment_type, load_date) if keys is None else keys
+        sent_at = time.time()
+        with connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO dispatch_keys VALUES (?, ?, ?)",
+                ((key, appointment_type, sent_at) for key in keys),
+            )
+            self._prune(conn)
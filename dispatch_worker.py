@@ -0,0 +1,41 @@
+# dispatch_worker.py
+import concurrent.futures
+import os
+
+from dispatch_jobs import JOB_QUEUED, run_job
+
+# --- WORKER DE DISPARO EM SEGUNDO PLANO ---
+# O envio não roda mais na thread do script do Streamlit: a página cria o job,
+# entrega ao worker e volta na hora. O worker é um pool de threads do servidor
+# (independente das sessões), então um rerun ou uma aba fechada não abandonam o
+# envio, e vários operadores podem enfileirar envios ao mesmo tempo. A página
+# acompanha o job pelo registro de progresso do DispatchJobStore.
+# Cada job já envia seus lotes em paralelo (COFRAT_DISPATCH_PARALLELISM); este é
+# o número de jobs enviados ao mesmo tempo.
+MAX_PARALLEL_JOBS = int(os.environ.get("COFRAT_DISPATCH_WORKERS", "2"))
+
+
+class DispatchWorker:
+    """Executa jobs de disparo em threads de fundo, compartilhado entre sessões."""
+
+    def __init__(self, store, ledger=None, max_workers=MAX_PARALLEL_JOBS, **dispatch_options):
+        self.store = store
+        self.ledger = ledger
+        self.dispatch_options = dispatch_options
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="cofrat-dispatch",
+        )
+
+    def submit(self, job_id):
+        """
+        Assume o job (status 'na_fila') e o coloca na fila. Retorna False se ele já
+        está concluído/cancelado ou nas mãos de outra sessão.
+        """
+        owner = self.store.claim(job_id, status=JOB_QUEUED)
+        if owner is None:
+            return False
+        self.executor.submit(run_job, self.store, job_id, owner=owner, ledger=self.ledger, **self.dispatch_options)
+        return True
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,193 @@
+# dispatcher.py
+import concurrent.futures
+import gzip
+import json
+import os
+import random
+import time
+
+import pandas as pd
+import requests
+
+from dispatch_ledger import SENT_COLUMN
+from http_client import get_client
+
+# --- ENVIO DOS CONTATOS AO WEBHOOK EM LOTES ---
+# Os contatos selecionados são divididos em lotes de tamanho fixo, enviados em
+# paralelo (com um limite de lotes simultâneos) ao webhook da automação. Falhas
+# temporárias (5xx, 429, timeout, conexão) são repetidas com espera exponencial
+# e jitter; erros 4xx não são repetidos. O resultado é informado por lote, então
+# a interface sabe exatamente quais contatos saíram.
+WEBHOOK_URL = os.environ.get("COFRAT_WEBHOOK_URL", "https://webhook.erudieto.com.br/webhook/disparo-em-massa")
+CHUNK_SIZE = int(os.environ.get("COFRAT_DISPATCH_CHUNK_SIZE", "200"))
+MAX_PARALLEL_CHUNKS = int(os.environ.get("COFRAT_DISPATCH_PARALLELISM", "4"))
+
+# (conexão, leitura) em segundos
+REQUEST_TIMEOUT = (5, 30)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0   # segundos
+BACKOFF_MAX = 30.0   # segundos
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# --- FORMATO DO PAYLOAD ---
+# Versão 1: {"appointment_type", "contacts": [{coluna: valor, ...}, ...]} em JSON puro,
+# como o DataFrame selecionado (nomes das colunas repetidos em cada contato).
+# Versão 2: contatos em colunas ({"count", "columns": {coluna: [valores]}}), sem as
+# colunas da interface, em JSON compacto comprimido com gzip. O cabeçalho
+# X-Cofrat-Payload-Version diz a versão, para o fluxo receptor aceitar as duas.
+# O padrão é a versão 1, que o fluxo atual do n8n lê; COFRAT_DISPATCH_PAYLOAD_VERSION=2
+# liga a versão 2 depois que o fluxo aceitar os dois formatos.
+PAYLOAD_VERSION = int(os.environ.get("COFRAT_DISPATCH_PAYLOAD_VERSION", "1"))
+PAYLOAD_VERSION_HEADER = 'X-Cofrat-Payload-Version'
+# Colunas só da interface; 'telefone' é o bruto do relatório (o envio usa telefone_ajustado)
+UI_ONLY_COLUMNS = ('Selecionar', SENT_COLUMN, 'telefone')
+# Colunas que só servem à carga (identificação de pacientes, exportação): ficam
+# fora do editor e de qualquer versão do payload
+LOAD_ONLY_COLUMNS = ('prontuario',)
+GZIP_LEVEL = 6
+
+CHUNK_OK = 'enviado'
+CHUNK_FAILED = 'falhou'
+RESULT_COLUMNS = ['lote', 'inicio', 'fim', 'contatos', 'status', 'tentativas', 'http', 'erro', 'segundos']
+
+
+def split_chunks(total, chunk_size=CHUNK_SIZE):
+    """Intervalos [início, fim) de cada lote para 'total' contatos."""
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX, retry_after=None):
+    """
+    Espera antes da próxima tentativa (attempt = 1 na primeira repetição): sorteada
+    entre 0 e base * 2^(attempt - 1), limitada a 'maximum' ("full jitter"), para que
+    lotes que falharam juntos não voltem todos ao mesmo tempo. Um Retry-After do
+    servidor é respeitado como mínimo.
+    """
+    delay = random.uniform(0, min(maximum, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, maximum))
+    return delay
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def columnar_contacts(contacts):
+    """Contatos (dicts) no formato em colunas da versão 2, sem as colunas da interface."""
+    columns = [column for column in dict.fromkeys(key for contact in contacts for key in contact)
+               if column not in UI_ONLY_COLUMNS + LOAD_ONLY_COLUMNS]
+    return {
+        'count': len(contacts),
+        'columns': {column: [contact.get(column) for contact in contacts] for column in columns},
+    }
+
+def encode_payload(payload, version=PAYLOAD_VERSION):
+    """(corpo em bytes, cabeçalhos) do payload de um lote na versão indicada."""
+    headers = {'Content-Type': 'application/json', PAYLOAD_VERSION_HEADER: str(version)}
+    if version == 1:
+        return json.dumps(payload, allow_nan=False).encode(), headers
+    payload = {'version': version, **payload, 'contacts': columnar_contacts(payload['contacts'])}
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False, allow_nan=False).encode()
+    return gzip.compress(body, GZIP_LEVEL), {**headers, 'Content-Encoding': 'gzip'}
+
+def decode_payload(body, headers):
+    """
+    Lado receptor: payload de qualquer versão com 'contacts' como lista de dicts
+    ('headers' é um mapeamento dos cabeçalhos da requisição).
+    """
+    if headers.get('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    payload = json.loads(body)
+    if str(headers.get(PAYLOAD_VERSION_HEADER, '1')) != '1':
+        columns = payload['contacts']['columns']
+        payload['contacts'] = [
+            dict(zip(columns, values)) for values in zip(*columns.values())
+        ] if columns else [{} for _ in range(payload['contacts']['count'])]
+    return payload
+
+def send_chunk(url, body, headers=None, max_attempts=MAX_ATTEMPTS, timeout=REQUEST_TIMEOUT, sleep=time.sleep,
+               client=None):
+    """
+    Envia um lote já codificado (encode_payload), repetindo falhas temporárias
+    (com os mesmos cabeçalhos, então a chave de idempotência se mantém entre as
+    tentativas). 'client' é o HttpClient compartilhado (padrão: o do processo); as
+    repetições automáticas dele ficam desligadas, então 'tentativas' conta cada POST.
+    Retorna dict com status (CHUNK_OK/CHUNK_FAILED), tentativas, último código
+    HTTP e erro.
+    """
+    client = client or get_client()
+    status_code, error = None, ''
+    for attempt in range(1, max_attempts + 1):
+        retry_after = None
+        try:
+            response = client.post(url, data=body, headers=headers, timeout=timeout, retry=False)
+            status_code = response.status_code
+            if 200 <= status_code < 300:
+                return {'status': CHUNK_OK, 'tentativas': attempt, 'http': status_code, 'erro': ''}
+            error = f"{status_code} - {response.text[:200]}"
+            if status_code not in RETRY_STATUS:
+                break
+            retry_after = _retry_after(response)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            status_code, error = None, str(e)
+        except requests.exceptions.RequestException as e:
+            status_code, error = None, str(e)
+            break
+        if attempt < max_attempts:
+            sleep(backoff_delay(attempt, retry_after=retry_after))
+    return {'status': CHUNK_FAILED, 'tentativas': attempt, 'http': status_code, 'erro': error}
+
+def chunk_headers(job_id, number):
+    """Cabeçalhos de um lote de um job: a chave de idempotência é a mesma em qualquer reenvio do lote."""
+    return {'Idempotency-Key': f"{job_id}-{number}", 'X-Cofrat-Job': job_id}
+
+def dispatch_contacts(contacts, appointment_type, url=WEBHOOK_URL, chunk_size=CHUNK_SIZE,
+                      max_workers=MAX_PARALLEL_CHUNKS, on_chunk=None, job_id=None, chunk_numbers=None,
+                      payload_version=PAYLOAD_VERSION, **send_options):
+    """
+    Envia a lista de contatos (dicts) em lotes paralelos e retorna um DataFrame
+    com uma linha por lote (RESULT_COLUMNS); 'inicio'/'fim' são as posições dos
+    contatos do lote na lista. 'on_chunk(resultado, concluídos, total)' é chamado
+    na thread de quem chamou a função a cada lote concluído (ex: barra de progresso).
+
+    Com 'job_id' o payload e os cabeçalhos levam a identificação do job e a chave
+    de idempotência do lote; 'chunk_numbers' restringe o envio a esses lotes
+    (retomada), mantendo a numeração e os limites da divisão completa.
+    'payload_version' escolhe o formato do corpo (1 = registros, 2 = colunas + gzip).
+    """
+    chunks = split_chunks(len(contacts), chunk_size)
+    numbers = range(len(chunks)) if chunk_numbers is None else sorted(chunk_numbers)
+    results = []
+
+    def run(number, start, stop):
+        payload = {
+            "appointment_type": appointment_type,
+            "contacts": contacts[start:stop],
+            "chunk": {"index": number, "count": len(chunks)},
+        }
+        if job_id is not None:
+            payload["job_id"] = job_id
+        body, headers = encode_payload(payload, payload_version)
+        if job_id is not None:
+            headers.update(chunk_headers(job_id, number))
+        started = time.perf_counter()
+        outcome = send_chunk(url, body, headers, **send_options)
+        return {
+            'lote': number + 1, 'inicio': start, 'fim': stop, 'contatos': stop - start,
+            **outcome, 'segundos': round(time.perf_counter() - started, 3),
+        }
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(run, number, *chunks[number]) for number in numbers]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+            if on_chunk is not None:
+                on_chunk(results[-1], len(results), len(futures))
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS).sort_values('lote', ignore_index=True)
+
+def sent_positions(results):
+    """Posições (na lista de contatos) dos contatos dos lotes enviados com sucesso."""
+    sent = results[results['status'] == CHUNK_OK]
+    return [position for start, stop in zip(sent['inicio'], sent['fim']) for position in range(start, stop)]
@@ -0,0 +1,164 @@
+# exports.py
+import datetime
+import io
+import os
+import shutil
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from local_store import DATA_DIR
+
+# --- EXPORTAÇÃO DAS CARGAS PROCESSADAS ---
+# Os conjuntos de uma carga (válidos, inválidos, repetidos) são exportados com um
+# esquema Arrow fixo, igual para todos os layouts: colunas que o layout não tem
+# saem nulas, e os metadados do esquema dizem a versão, o conjunto, o layout e o
+# tipo de disparo. Automações e análises leem o Parquet/Arrow direto, sem
+# reprocessar a exportação do SIMAH; a equipe usa CSV ou XLSX.
+EXPORT_DIR = os.environ.get("COFRAT_EXPORT_DIR", os.path.join(DATA_DIR, "exports"))
+
+# Pastas do arquivo diário mais antigas que isso são apagadas a cada nova carga
+# (as cargas têm nomes, telefones e prontuários de pacientes)
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("COFRAT_ARCHIVE_RETENTION_DAYS", "35"))
+
+# Alterar quando o esquema mudar (colunas, tipos ou nomes)
+EXPORT_SCHEMA_VERSION = "1"
+
+BASE_FIELDS = [
+    pa.field('id_linha', pa.uint64()),
+    pa.field('data', pa.string()),
+    pa.field('horario_ajustado', pa.string()),
+    pa.field('nome_do_paciente', pa.string()),
+    pa.field('nome_do_medico', pa.string()),
+    pa.field('telefone', pa.string()),
+    pa.field('telefone_ajustado', pa.string()),
+    pa.field('prontuario', pa.string()),
+    pa.field('terapia', pa.string()),
+]
+SET_FIELDS = {
+    'validos': [pa.field('selecionado', pa.bool_()), pa.field('ja_enviado', pa.bool_())],
+    'invalidos': [pa.field('motivo', pa.string())],
+    'repetidos': [pa.field('carga', pa.string()), pa.field('confianca', pa.float64()), pa.field('id_paciente', pa.int64())],
+}
+EXPORT_SCHEMAS = {name: pa.schema(BASE_FIELDS + fields) for name, fields in SET_FIELDS.items()}
+
+# Nomes das colunas da interface que mudam no arquivo exportado
+RENAMED_COLUMNS = {'Selecionar': 'selecionado', 'Já enviado': 'ja_enviado'}
+
+EXPORT_FORMATS = {
+    'parquet': 'Parquet',
+    'arrow': 'Arrow (IPC)',
+    'csv': 'CSV',
+    'xlsx': 'Excel (XLSX)',
+}
+
+
+def _column_array(values, field):
+    """Converte uma coluna para o tipo do campo; texto misto (ex: telefone numérico do Excel) vira string."""
+    if pa.types.is_string(field.type):
+        values = values.astype(object)
+        values = values.where(values.isna(), values.astype(str))
+    return pa.array(values, type=field.type, from_pandas=True)
+
+def export_table(df, set_name, metadata=None):
+    """
+    Tabela Arrow do conjunto 'set_name' no esquema fixo. 'metadata' (layout, tipo
+    de disparo...) vai para os metadados do esquema, junto com versão e conjunto.
+    """
+    schema = EXPORT_SCHEMAS[set_name]
+    df = df.rename(columns=RENAMED_COLUMNS)
+    arrays = []
+    for field in schema:
+        if field.name == 'id_linha':
+            values = pd.Series(df.index.to_numpy(), dtype='uint64') if df.index.dtype == 'uint64' else None
+        else:
+            values = df[field.name].reset_index(drop=True) if field.name in df else None
+        arrays.append(pa.nulls(len(df), field.type) if values is None else _column_array(values, field))
+    schema = schema.with_metadata({
+        'cofrat.schema_version': EXPORT_SCHEMA_VERSION,
+        'cofrat.set': set_name,
+        **{f'cofrat.{key}': str(value) for key, value in (metadata or {}).items()},
+    })
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _parquet_bytes(table):
+    output = io.BytesIO()
+    pq.write_table(table, output, compression='zstd')
+    return output.getvalue()
+
+def _arrow_bytes(table):
+    output = io.BytesIO()
+    feather.write_feather(table, output, compression='zstd')
+    return output.getvalue()
+
+def _csv_bytes(table):
+    # Separador ';' e BOM para o Excel em português abrir acentos e colunas corretamente
+    return table.to_pandas().to_csv(sep=';', index=False).encode('utf-8-sig')
+
+def _xlsx_bytes(tables):
+    # Planilha em modo 'write_only': as linhas são gravadas em fluxo, sem montar as células em memória
+    workbook = openpyxl.Workbook(write_only=True)
+    for set_name, table in tables.items():
+        sheet = workbook.create_sheet(set_name)
+        sheet.append(table.column_names)
+        for batch in table.to_batches():
+            # O Excel guarda números com 15 dígitos de precisão; id_linha (uint64) vai como texto
+            columns = [
+                (column.cast(pa.string()) if pa.types.is_uint64(column.type) else column).to_pylist()
+                for column in batch.columns
+            ]
+            for row in zip(*columns):
+                sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+def export_files(sets, export_format, metadata=None, prefix='carga'):
+    """
+    Arquivos da carga no formato escolhido: {nome do arquivo: bytes}. 'sets' é
+    {conjunto: DataFrame}; XLSX junta os conjuntos em abas de uma só planilha.
+    """
+    tables = {name: export_table(df, name, metadata) for name, df in sets.items() if df is not None}
+    if export_format == 'xlsx':
+        return {f'{prefix}.xlsx': _xlsx_bytes(tables)}
+    writer = {'parquet': _parquet_bytes, 'arrow': _arrow_bytes, 'csv': _csv_bytes}[export_format]
+    return {f'{prefix}-{name}.{export_format}': writer(table) for name, table in tables.items()}
+
+def prune_archive(export_dir=EXPORT_DIR, retention_days=ARCHIVE_RETENTION_DAYS, today=None):
+    """Apaga as pastas do arquivo (AAAA-MM-DD) mais antigas que o período de retenção."""
+    cutoff = (today or datetime.date.today()) - datetime.timedelta(days=retention_days)
+    if not os.path.isdir(export_dir):
+        return
+    for name in os.listdir(export_dir):
+        try:
+            day = datetime.date.fromisoformat(name)
+        except ValueError:
+            continue
+        if day < cutoff:
+            shutil.rmtree(os.path.join(export_dir, name), ignore_errors=True)
+
+def archive_batch(sets, metadata=None, export_dir=EXPORT_DIR, now=None, retention_days=ARCHIVE_RETENTION_DAYS):
+    """
+    Grava os conjuntos da carga em Parquet na pasta do dia (export_dir/AAAA-MM-DD),
+    um arquivo por conjunto, e retorna os caminhos. A escrita passa por um arquivo
+    temporário para que quem lê a pasta nunca veja um Parquet pela metade. Pastas
+    mais antigas que 'retention_days' são apagadas.
+    """
+    now = now or datetime.datetime.now()
+    prune_archive(export_dir, retention_days, now.date())
+    day_dir = os.path.join(export_dir, now.strftime('%Y-%m-%d'))
+    os.makedirs(day_dir, exist_ok=True)
+    prefix = now.strftime('%H%M%S-%f')
+    if metadata and metadata.get('layout'):
+        prefix += f"-{metadata['layout']}"
+    paths = []
+    for name, data in export_files(sets, 'parquet', {**(metadata or {}), 'generated_at': now.isoformat()}, prefix).items():
+        path = os.path.join(day_dir, name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        paths.append(path)
+    return paths
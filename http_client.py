@@ -0,0 +1,125 @@
+# http_client.py
+import collections
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- CLIENTE HTTP COMPARTILHADO ---
+# Todas as integrações externas (webhooks do n8n, Chatwoot, Graph API) saem por
+# uma única requests.Session: cada host mantém um pool de conexões abertas
+# (keep-alive), então só a primeira requisição paga o handshake TCP+TLS. Timeouts
+# e repetições têm padrão configurável, e cada requisição registra sua latência
+# por host. O app cria o cliente uma vez (st.cache_resource); os scripts usam get_client().
+#
+# Repetições automáticas: falhas de conexão (a requisição nem chegou ao servidor)
+# em qualquer método, e 429/5xx só em métodos idempotentes (GET, PUT, DELETE...).
+# POST não é repetido após uma resposta, para não disparar um fluxo duas vezes.
+# Quem tem a própria política de repetição (dispatcher.send_chunk, envio pela
+# Cloud API) pede retry=False: a requisição sai por uma sessão sem repetições,
+# então cada tentativa é uma requisição real e entra na contagem de quem repete.
+CONNECT_TIMEOUT = float(os.environ.get("COFRAT_HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("COFRAT_HTTP_READ_TIMEOUT", "30"))
+RETRIES = int(os.environ.get("COFRAT_HTTP_RETRIES", "2"))
+# Hosts com pool próprio mantidos ao mesmo tempo, e conexões abertas por host
+POOL_HOSTS = int(os.environ.get("COFRAT_HTTP_POOL_HOSTS", "10"))
+POOL_SIZE = int(os.environ.get("COFRAT_HTTP_POOL_SIZE", "32"))
+
+BACKOFF_FACTOR = 0.5  # segundos: 0.5, 1, 2...
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Latências guardadas por host para os percentis (as mais recentes)
+LATENCY_WINDOW = 1000
+METRIC_COLUMNS = ['host', 'requisicoes', 'erros', 'media_ms', 'p50_ms', 'p95_ms', 'max_ms']
+
+
+class HttpClient:
+    """
+    Sessão HTTP com pools de conexão por host, timeout e repetições padrão e
+    métricas de latência. Pode ser compartilhada entre threads e sessões.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, retries=RETRIES,
+                 pool_hosts=POOL_HOSTS, pool_size=POOL_SIZE):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUS,
+            respect_retry_after_header=True, raise_on_status=False,
+        )
+        self.session = self._session(retry, pool_hosts, pool_size)
+        self.no_retry_session = self._session(Retry(0, read=False), pool_hosts, pool_size)
+        self._lock = threading.Lock()
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self._counts = collections.Counter()
+        self._errors = collections.Counter()
+
+    @staticmethod
+    def _session(retry, pool_hosts, pool_size):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def request(self, method, url, timeout=None, retry=True, **kwargs):
+        """
+        Como requests.request, pela sessão compartilhada. 'timeout' padrão é
+        (conexão, leitura) do cliente; retry=False desliga as repetições
+        automáticas. Exceções do requests são repassadas.
+        """
+        host = urlsplit(url).netloc
+        session = self.session if retry else self.no_retry_session
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            self._record(host, time.perf_counter() - started, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, host, seconds, failed):
+        with self._lock:
+            self._latencies[host].append(seconds)
+            self._counts[host] += 1
+            self._errors[host] += failed
+
+    def metrics(self):
+        """Latência por host (requisições, erros HTTP/conexão, média e percentis das mais recentes, em ms)."""
+        with self._lock:
+            rows = []
+            for host, latencies in self._latencies.items():
+                values = pd.Series(latencies) * 1000
+                rows.append({
+                    'host': host, 'requisicoes': self._counts[host], 'erros': self._errors[host],
+                    'media_ms': round(values.mean(), 1), 'p50_ms': round(values.quantile(0.5), 1),
+                    'p95_ms': round(values.quantile(0.95), 1), 'max_ms': round(values.max(), 1),
+                })
+        return pd.DataFrame(rows, columns=METRIC_COLUMNS)
+
+    def close(self):
+        self.session.close()
+        self.no_retry_session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+def get_client():
+    """Cliente padrão do processo (criado no primeiro uso), para scripts e módulos fora do app."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
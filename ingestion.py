@@ -0,0 +1,623 @@
+# ingestion.py
+import codecs
+import csv
+import functools
+import itertools
+import re
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.utils.exceptions import InvalidFileException
+
+from parse_stats import StatsAccumulator
+from patient_index import count_repeated_patients, find_repeated_patients
+from phones import normalize_phones
+
+# --- CONFIGURAÇÃO DA LEITURA EM STREAMING ---
+# O upload é lido em blocos de bytes e as linhas extraídas são acumuladas em
+# lotes de tamanho fixo antes de irem para os buffers de coluna. Assim o arquivo
+# nunca fica inteiro na memória como bytes + str + lista de linhas ao mesmo tempo.
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 5000
+
+RAW_COLUMNS = [
+    'Data', 'Especialidade', 'Hora', 'Medico', 'Convenio',
+    'Evento', 'Paciente', 'Telefone', 'Prontuario'
+]
+TIME_REGEX = re.compile(r'^\d{2}:\d{2}$')
+_PHONE_POSITION = RAW_COLUMNS.index('Telefone')
+_PATIENT_POSITION = RAW_COLUMNS.index('Paciente')
+
+# Quantos bytes do início do upload são usados para identificar o layout e a codificação
+SNIFF_SIZE = 8 * 1024
+
+# O SIMAH exporta em latin1; planilhas salvas de novo no Windows ou em outros
+# editores chegam em cp1252 ou UTF-8. Bytes de 0x80 a 0x9F são caracteres de
+# controle no latin1 e aspas/travessões no cp1252 (exceto os cinco não definidos).
+DEFAULT_ENCODING = 'latin1'
+_CP1252_ONLY_BYTES = re.compile(rb'[\x80-\x9f]')
+_CP1252_UNDEFINED_BYTES = re.compile(rb'[\x81\x8d\x8f\x90\x9d]')
+
+
+# --- FUNÇÕES DE AJUSTE ---
+# Todas as grafias 'H:M' aceitas (hora e minuto com 1 ou 2 dígitos) mapeadas para
+# minutos desde a meia-noite, e os rótulos 'HH:MM' de cada minuto do dia. Com as
+# duas tabelas a coluna de horários é convertida e arredondada sem laço por linha.
+_MINUTES_BY_TIME_TEXT = {
+    f'{hour_text}:{minute_text}': hour * 60 + minute
+    for hour in range(24) for hour_text in {str(hour), f'{hour:02d}'}
+    for minute in range(60) for minute_text in {str(minute), f'{minute:02d}'}
+}
+_TIME_LABELS = np.array([f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(24 * 60)], dtype=object)
+
+def time_to_minutes(times):
+    """Converte uma coluna de horários 'HH:MM' em minutos desde a meia-noite (NaN quando inválido)."""
+    return pd.Series(times, copy=False).map(_MINUTES_BY_TIME_TEXT)
+
+def floor_times(times, step=10):
+    """
+    Arredonda uma coluna de horários para baixo a cada 'step' minutos, no formato HH:MM.
+    Valores inválidos ou vazios são mantidos como estão.
+    """
+    times = pd.Series(times, copy=False)
+    minutes = time_to_minutes(times)
+    valid = minutes.notna().to_numpy()
+    floored = times.astype(object)
+    floored[valid] = _TIME_LABELS[minutes.to_numpy()[valid].astype(np.int64) // step * step]
+    return floored
+
+
+# --- LEITURA EM STREAMING ---
+def detect_encoding(prefix):
+    """Escolhe a codificação do CSV (UTF-8, cp1252 ou latin1) pelos primeiros bytes do arquivo."""
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if not prefix.isascii():
+        try:
+            # final=False: o prefixo pode terminar no meio de um caractere
+            codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+        if _CP1252_ONLY_BYTES.search(prefix) and not _CP1252_UNDEFINED_BYTES.search(prefix):
+            return 'cp1252'
+    return DEFAULT_ENCODING
+
+def _upload_buffer(uploaded_file):
+    """
+    Visão (memoryview) sobre o buffer interno do upload, sem cópia. O UploadedFile
+    do Streamlit é um io.BytesIO; outros objetos de arquivo retornam None.
+    """
+    getbuffer = getattr(uploaded_file, 'getbuffer', None)
+    return getbuffer() if getbuffer is not None else None
+
+def _iter_byte_chunks(uploaded_file, chunk_size):
+    """Percorre o upload em blocos de bytes, fatiando o buffer interno quando possível."""
+    buffer = _upload_buffer(uploaded_file)
+    if buffer is None:
+        uploaded_file.seek(0)
+        yield from iter(functools.partial(uploaded_file.read, chunk_size), b'')
+        return
+    # A visão é liberada no fim (ou se o gerador for fechado antes), senão o BytesIO fica travado
+    with buffer:
+        for start in range(0, len(buffer), chunk_size):
+            yield buffer[start:start + chunk_size]
+
+def iter_text_chunks(uploaded_file, encoding=None, chunk_size=CHUNK_SIZE):
+    """
+    Lê o upload em blocos de bytes e devolve o texto decodificado incrementalmente.
+    Sem 'encoding', a codificação é detectada nos primeiros SNIFF_SIZE bytes. O
+    arquivo nunca fica inteiro na memória como bytes e str ao mesmo tempo.
+    """
+    if encoding is None:
+        uploaded_file.seek(0)
+        encoding = detect_encoding(uploaded_file.read(SNIFF_SIZE))
+    # Bytes inválidos depois do prefixo viram '\ufffd' em vez de interromper a leitura
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in _iter_byte_chunks(uploaded_file, chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+    uploaded_file.seek(0)
+
+def iter_lines(text_chunks):
+    """
+    Reagrupa blocos de texto em linhas terminadas em '\\n', do mesmo jeito que a
+    iteração de um io.StringIO faria (o csv.reader cuida de '\\r' e de campos
+    com quebra de linha entre aspas).
+    """
+    pending = ''
+    for chunk in text_chunks:
+        pending += chunk
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+def _first_time_index(row):
+    """Índice do primeiro campo no formato HH:MM ou None se a linha não tiver horário."""
+    return next((i for i, field in enumerate(row) if TIME_REGEX.match(field)), None)
+
+def iter_consultas_rows(reader):
+    """Extrai as linhas de agendamento do layout de Consultas."""
+    current_date = None
+    current_specialty = None
+
+    for row in reader:
+        if not row: continue
+        if row[0] == 'Data:' and 'Especialidade: ' in row:
+            current_date, current_specialty = row[1], row[3]
+        elif 'Página :' not in row[0]:
+            continue
+        start_index = _first_time_index(row)
+        if start_index is None:
+            continue
+        # Estrutura Consultas: Data, Esp, Hora, Medico, Convenio, Evento, Paciente, Tel, Pront
+        yield [current_date, current_specialty] + row[start_index:start_index + 7]
+
+def iter_servicos_rows(reader):
+    """Extrai as linhas de agendamento do layout de Serviços (Acupuntura e RPG)."""
+    current_date = None
+    current_specialty = None
+    current_doctor = None
+
+    for row in reader:
+        if not row: continue
+
+        # 1. Captura de Contexto: Médico e Especialidade
+        if 'Médico:' in row:
+            try:
+                if 'Agenda de:' in row:
+                    spec_index = row.index('Agenda de:') + 1
+                    current_specialty = row[spec_index]
+
+                doc_index = row.index('Médico:') + 1
+                current_doctor = row[doc_index]
+            except (ValueError, IndexError):
+                pass
+
+        # 2. Captura de Contexto: Data
+        if len(row) > 1 and row[0] == 'Data:':
+            current_date = row[1]
+
+        # 3. Extração dos Dados do Paciente
+        start_index = _first_time_index(row)
+        if start_index is None:
+            continue
+        data_fields = row[start_index:]
+
+        # Mapeamento Acupuntura/RPG:
+        # [0] Hora, [2] Paciente, [4] Evento, [5] Fone, [6] Pront, [7] Convenio
+        if len(data_fields) >= 8:
+            yield [
+                current_date,       # Data
+                current_specialty,  # Especialidade
+                data_fields[0],     # Hora
+                current_doctor,     # Medico (do cabeçalho)
+                data_fields[7],     # Convenio
+                data_fields[4],     # Evento
+                data_fields[2],     # Paciente
+                data_fields[5],     # Telefone
+                data_fields[6]      # Prontuario
+            ]
+
+def iter_row_batches(rows, batch_size=BATCH_SIZE):
+    """Agrupa as linhas extraídas em lotes de tamanho fixo."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- BUFFERS DE COLUNA ---
+class ColumnBuffer:
+    """
+    Acumula lotes de linhas em uma lista por coluna (todas as células são str ou
+    None) e monta o DataFrame uma única vez no final. Linhas curtas são
+    completadas com None, como o construtor do pandas faz para listas de linhas.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self._data = {col: [] for col in self.columns}
+        self.rows = 0
+
+    def extend(self, batch):
+        for col_index, col in enumerate(self.columns):
+            values = self._data[col]
+            values.extend(row[col_index] if col_index < len(row) else None for row in batch)
+        self.rows += len(batch)
+
+    def to_frame(self):
+        df = pd.DataFrame(self._data, columns=self.columns)
+        self._data = {col: [] for col in self.columns}
+        return df
+
+
+def _batch_column(batch, position):
+    return [row[position] if position < len(row) else None for row in batch]
+
+def read_appointment_rows(uploaded_file, extract_rows, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, stats=None):
+    """
+    Lê o CSV do SIMAH em streaming e devolve o DataFrame bruto (colunas RAW_COLUMNS).
+    Com 'stats' (StatsAccumulator), telefones e nomes de cada lote são acumulados à medida que são lidos.
+    """
+    reader = csv.reader(iter_lines(iter_text_chunks(uploaded_file, chunk_size=chunk_size)))
+
+    buffer = ColumnBuffer(RAW_COLUMNS)
+    for batch in iter_row_batches(extract_rows(reader), batch_size):
+        buffer.extend(batch)
+        if stats is not None:
+            stats.add(normalize_phones(_batch_column(batch, _PHONE_POSITION)), _batch_column(batch, _PATIENT_POSITION))
+    return buffer.to_frame()
+
+
+# --- PROCESSAMENTO DO CSV ---
+APPOINTMENT_COLUMNS = [
+    'data', 'horario_ajustado', 'nome_do_paciente',
+    'nome_do_medico', 'telefone', 'telefone_ajustado', 'prontuario'
+]
+
+def row_fingerprints(df):
+    """
+    Impressão digital (uint64) de cada linha, calculada sobre o conteúdo das colunas.
+    Linhas idênticas recebem valores diferentes pela ordem em que aparecem, então a
+    mesma linha tem a mesma impressão em todas as versões do relatório.
+    """
+    row_hash = pd.util.hash_pandas_object(df, index=False)
+    occurrence = row_hash.groupby(row_hash.to_numpy()).cumcount()
+    fingerprints = pd.util.hash_pandas_object(pd.DataFrame({'hash': row_hash, 'occurrence': occurrence}), index=False)
+    return pd.Index(fingerprints.to_numpy(), name='id_linha')
+
+def normalize_appointment_rows(df, phones=None):
+    """
+    Ajusta telefone, horário e data das linhas brutas do CSV e padroniza os nomes
+    das colunas. Retorna o DataFrame (colunas APPOINTMENT_COLUMNS, mesmo índice) e
+    a máscara das linhas com telefone inválido. 'phones' são os telefones já
+    normalizados durante a leitura (mesmo índice de df), quando existirem.
+    """
+    df = df.copy()
+    if phones is None:
+        phones = normalize_phones(df['Telefone'])
+    df['Número de Telefone Ajustado'] = phones['telefone_ajustado']
+    df['Horario'] = floor_times(df['Hora'])
+
+    # Converte data para string formatada (garante consistência)
+    df['Data'] = pd.to_datetime(df['Data'], dayfirst=True, errors='coerce').dt.strftime('%d/%m/%Y')
+
+    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('ú', 'u').str.replace('é', 'e').str.replace('ç', 'c').str.replace('ã', 'a')
+    df.rename(columns={
+        'paciente': 'nome_do_paciente', 'medico': 'nome_do_medico',
+        'horario': 'horario_ajustado', 'numero_de_telefone_ajustado': 'telefone_ajustado'
+    }, inplace=True)
+
+    # Critério de qualidade de dados: telefone vazio, com tamanho inválido, DDD inexistente ou fixo
+    is_bad = phones['motivo_telefone'] != ''
+    return df[APPOINTMENT_COLUMNS], is_bad
+
+def _reuse_previous_rows(df, previous):
+    """
+    Separa as linhas do novo upload já normalizadas no upload anterior (mesma
+    impressão digital) e devolve (linhas reaproveitadas, máscara de inválidas, linhas novas).
+    """
+    previous_good, previous_bad = previous
+    previous_rows = pd.concat([previous_good[APPOINTMENT_COLUMNS], previous_bad[APPOINTMENT_COLUMNS]])
+    previous_rows = previous_rows[~previous_rows.index.duplicated()]
+    known = df.index.isin(previous_rows.index)
+    reused = previous_rows.loc[df.index[known]]
+    return reused, pd.Series(reused.index.isin(previous_bad.index), index=reused.index), df[~known]
+
+def process_appointment_csv(uploaded_file, extract_rows, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, previous=None, on_progress=None):
+    """
+    Lê um arquivo CSV com o extrator de linhas do layout, calcula estatísticas,
+    separa registros bons, ruins e repetidos (por nome), e retorna DataFrames e estatísticas.
+
+    Os DataFrames são indexados pela impressão digital da linha bruta. Com 'previous'
+    (good_df, bad_df de um upload anterior do mesmo layout), apenas as linhas novas
+    ou alteradas são normalizadas; o resultado é o mesmo do processamento completo.
+    'on_progress' recebe as estatísticas parciais enquanto o arquivo é lido.
+    """
+    accumulator = StatsAccumulator(on_progress)
+    df = read_appointment_rows(uploaded_file, extract_rows, chunk_size, batch_size, stats=accumulator)
+    if df.empty:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}
+    df.index = row_fingerprints(df)
+    phones = accumulator.phones(df.index)
+
+    # --- TRATAMENTO DE DADOS (COMUM A TODOS) ---
+    if previous is not None:
+        reused, reused_is_bad, new_rows = _reuse_previous_rows(df, previous)
+        normalized, is_bad = normalize_appointment_rows(new_rows, phones.loc[new_rows.index])
+        df = pd.concat([reused, normalized]).loc[df.index]
+        bad_data_mask = pd.concat([reused_is_bad, is_bad]).loc[df.index]
+    else:
+        df, bad_data_mask = normalize_appointment_rows(df, phones)
+
+    # Estatísticas gerais e de qualidade vêm do acumulador; só os repetidos
+    # dependem da identificação de pacientes sobre a carga inteira
+    stats = accumulator.stats(repeated=count_repeated_patients(df, accumulator.names(df.index)))
+
+    df_bad = df[bad_data_mask]
+    df_good = df[~bad_data_mask]
+
+    # Identificar pacientes com múltiplos agendamentos (nome normalizado, prontuário ou primeiro nome + telefone)
+    df_repeated = find_repeated_patients(df_good)
+
+    df_bad_final = df_bad if not df_bad.empty else pd.DataFrame(columns=APPOINTMENT_COLUMNS)
+    return df_good, df_bad_final, df_repeated, stats
+
+
+# --- PROCESSAMENTO DO EXCEL (AUTORIZAÇÃO LIBERADA) ---
+def standardize_therapy_name(therapy_name):
+    """Padroniza o nome da terapia da planilha de autorização."""
+    if pd.isna(therapy_name) or str(therapy_name).strip() == '':
+        return ''
+
+    # CORREÇÃO: Remove os dois pontos (:) e espaços extras antes de validar
+    therapy_name = str(therapy_name).replace(':', '').strip().upper()
+
+    if therapy_name == 'ACUPUNTURA':
+        return 'Acupuntura'
+    elif therapy_name == 'FISIO/ACUP':
+        return 'Fisioterapia, Acupuntura'
+    elif therapy_name == 'FISIOTERAPIA':
+        return 'Fisioterapia'
+    else:
+        return therapy_name.title()
+
+def format_full_name(full_name):
+    """Extrai e formata o nome completo do paciente (capitalizado)."""
+    if pd.isna(full_name) or str(full_name).strip() == '':
+        return ''
+    # Remove espaços extras, transforma em minúsculo e capitaliza cada parte
+    name_parts = str(full_name).strip().split()
+    return ' '.join([part.capitalize() for part in name_parts])
+
+# Colunas da planilha de autorização que o processamento usa. O nome do paciente
+# pode vir com qualquer um dos cabeçalhos de NAME_HEADERS.
+AUTORIZACAO_NAME_COLUMN = 'PACIENTE'
+NAME_HEADERS = ['PACIENTE', 'NOME', 'NOME DO PACIENTE', 'NOME_DO_PACIENTE']
+EXCEL_HEADER_SCAN_ROWS = 20
+
+def _excel_cell_value(value):
+    """Converte a célula como o pandas faz ao ler com openpyxl (float inteiro vira int)."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _find_autorizacao_header(row):
+    """Retorna {coluna: índice} se a linha for o cabeçalho da planilha de autorização."""
+    positions = {}
+    for index, cell in enumerate(row):
+        if cell is None:
+            continue
+        header = str(cell)
+        if header == 'TELEFONE':
+            positions.setdefault('TELEFONE', index)
+        elif header == 'TERAPIA ':
+            positions.setdefault('TERAPIA ', index)
+        elif header.strip().upper() in NAME_HEADERS:
+            positions.setdefault(AUTORIZACAO_NAME_COLUMN, index)
+    return positions if len(positions) == 3 else None
+
+def _iter_excel_rows(uploaded_file):
+    """
+    Percorre as linhas da primeira aba. Arquivos .xlsx são lidos pelo openpyxl em
+    modo somente leitura (streaming, sem carregar a planilha inteira); formatos que
+    o openpyxl não abre caem no pd.read_excel.
+    """
+    uploaded_file.seek(0)
+    try:
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile):
+        uploaded_file.seek(0)
+        yield from pd.read_excel(uploaded_file, header=None).astype(object) \
+            .where(lambda df: df.notna(), None).itertuples(index=False, name=None)
+        return
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def read_autorizacao_excel(uploaded_file, header_scan_rows=EXCEL_HEADER_SCAN_ROWS):
+    """
+    Lê da planilha de autorização só as colunas de telefone, terapia e paciente.
+    Procura o cabeçalho nas primeiras linhas e devolve um DataFrame com as colunas
+    'TELEFONE', 'TERAPIA ' e AUTORIZACAO_NAME_COLUMN.
+    """
+    try:
+        rows = _iter_excel_rows(uploaded_file)
+        positions = None
+        for row in itertools.islice(rows, header_scan_rows):
+            positions = _find_autorizacao_header(row)
+            if positions:
+                break
+
+        columns = {name: [] for name in positions or {}}
+        for row in rows if positions else ():
+            for name, index in positions.items():
+                columns[name].append(_excel_cell_value(row[index]) if index < len(row) else None)
+    except Exception as e:
+        raise ValueError(f"Erro ao ler o arquivo Excel: {e}") from e
+
+    if not positions:
+        raise ValueError("O arquivo Excel não contém as colunas 'TELEFONE', 'TERAPIA ' e/ou a coluna de paciente ('PACIENTE' ou 'NOME').")
+    return pd.DataFrame(columns)
+
+def process_and_clean_autorizacao(uploaded_file, on_progress=None):
+    """
+    Lê um arquivo Excel, processa os dados para 'Autorização liberada'.
+    Aplica a transformação de telefone, padronização de terapia e
+    extração do primeiro nome do paciente (Capitalizado).
+    """
+    df = read_autorizacao_excel(uploaded_file)
+    name_col = AUTORIZACAO_NAME_COLUMN
+
+    # =====================================================================
+    # TRANSFORMAÇÃO MANUAL (CLEAN & TRANSFORM)
+    # =====================================================================
+
+    # Isola as colunas de interesse e remove valores nulos
+    df_reduzido = df[['TELEFONE', 'TERAPIA ', name_col]].copy()
+    df_reduzido = df_reduzido.dropna(subset=['TELEFONE', 'TERAPIA ', name_col])
+    df_reduzido.index = row_fingerprints(df_reduzido)
+
+    # Aplica as transformações criando as colunas que o sistema espera
+    df_reduzido['telefone'] = df_reduzido['TELEFONE']
+    phones = normalize_phones(df_reduzido['TELEFONE'])
+    accumulator = StatsAccumulator(on_progress)
+    accumulator.add(phones)
+    df_reduzido['telefone_ajustado'] = phones['telefone_ajustado']
+    df_reduzido['terapia'] = df_reduzido['TERAPIA '].apply(standardize_therapy_name)
+    df_reduzido['nome_do_paciente'] = df_reduzido[name_col].apply(format_full_name)
+
+    # =====================================================================
+    # FIM DA TRANSFORMAÇÃO MANUAL
+    # =====================================================================
+
+    # Para garantir que o código não quebre no restante do sistema (UI e Webhook),
+    # criamos as colunas esperadas preenchidas com vazio caso não existam:
+    expected_columns =[
+        'nome_do_paciente',
+        'telefone_ajustado', 'terapia'
+    ]
+    for col in expected_columns:
+        if col not in df_reduzido.columns:
+            df_reduzido[col] = ''
+
+    # Máscara de dados ruins (telefone vazio, com tamanho inválido, DDD inexistente ou fixo)
+    bad_data_mask = phones['motivo_telefone'] != ''
+
+    df_bad = df_reduzido[bad_data_mask]
+    df_good = df_reduzido[~bad_data_mask]
+
+    stats = accumulator.stats(repeated=0)  # Não há validação de repetidos por nome neste layout
+
+    # DataFrame de repetidos (vazio por padrão para este fluxo)
+    df_repeated = pd.DataFrame(columns=expected_columns)
+
+    # Garantir a ordem das colunas para a interface
+    available_cols =[c for c in expected_columns if c in df_good.columns]
+
+    df_good_final = df_good[available_cols]
+    df_bad_final = df_bad[available_cols] if not df_bad.empty else pd.DataFrame(columns=available_cols)
+    df_repeated_final = df_repeated[available_cols] if not df_repeated.empty else pd.DataFrame(columns=available_cols)
+
+    return df_good_final, df_bad_final, df_repeated_final, stats
+
+
+# --- REGISTROS ESTÁTICOS PARA TESTE ---
+# Contatos da equipe incluídos no topo dos dados bons de cada carga para conferir
+# o disparo. Não vêm do arquivo nem entram nas estatísticas, e são incluídos uma
+# única vez por carga (batch.process_uploads), mesmo com vários arquivos do mesmo layout.
+APPOINTMENT_TEST_ROWS = [
+    {'data': '15/02/2026', 'horario_ajustado': '13:10', 'nome_do_paciente': 'BRANDON AGUIAR', 'nome_do_medico': 'LEANDRO TETSUO OKAMURA', 'telefone': '(11) 95904 4561', 'telefone_ajustado': '+5511959044561', 'prontuario': ''},
+    {'data': '20/03/2026', 'horario_ajustado': '08:40', 'nome_do_paciente': 'KARINE COFRAT', 'nome_do_medico': 'LEANDRO TETSUO OKAMURA', 'telefone': '(11) 97140-2433', 'telefone_ajustado': '+5511971402433', 'prontuario': ''},
+]
+AUTORIZACAO_TEST_ROWS = [
+    {'nome_do_paciente': 'Brandon', 'telefone_ajustado': '+5511959044561', 'terapia': 'Acupuntura'},
+    {'nome_do_paciente': 'Karine', 'telefone_ajustado': '+5511971402433', 'terapia': 'Fisioterapia'},
+]
+
+def test_rows_frame(test_rows):
+    """Registros de teste como DataFrame, indexados pela impressão digital como as linhas do arquivo."""
+    df = pd.DataFrame(test_rows)
+    df.index = row_fingerprints(df)
+    return df
+
+def is_test_row(index):
+    """Máscara das linhas de 'index' (impressões digitais) que são registros de teste de algum layout."""
+    test_ids = [test_rows_frame(layout.test_rows).index for layout in LAYOUTS.values() if layout.test_rows]
+    return index.isin(np.concatenate(test_ids)) if test_ids else np.zeros(len(index), dtype=bool)
+
+
+# --- REGISTRO DE LAYOUTS ---
+class Layout:
+    """
+    Descreve um layout de exportação do SIMAH: quais tipos de arquivo ele atende,
+    como reconhecê-lo pelos primeiros bytes do upload e como processá-lo.
+    Os padrões de reconhecimento são compilados uma única vez, na importação do módulo.
+    """
+
+    def __init__(self, name, label, file_types, parse, markers=(), signatures=(), extract_rows=None, test_rows=()):
+        self.name = name
+        self.label = label
+        self.file_types = list(file_types)
+        self.parse = parse
+        self.markers = [re.compile(marker, re.MULTILINE) for marker in markers]
+        self.signatures = tuple(signatures)
+        self.extract_rows = extract_rows
+        self.test_rows = list(test_rows)
+
+    def sniff(self, prefix):
+        """Pontua o quanto o início do arquivo se parece com este layout (0 = não reconhecido)."""
+        if self.signatures:
+            return len(self.markers) + 1 if prefix.startswith(self.signatures) else 0
+        text = prefix.decode('latin1')
+        return sum(1 for marker in self.markers if marker.search(text))
+
+
+LAYOUTS = {}
+
+def register_layout(layout):
+    """Registra o layout pelo nome; detect_layout e layout_for_file_type procuram entre os registrados."""
+    LAYOUTS[layout.name] = layout
+    return layout
+
+def layout_for_file_type(file_type):
+    """Retorna o layout registrado para o tipo de arquivo selecionado na interface."""
+    return next((layout for layout in LAYOUTS.values() if file_type in layout.file_types), None)
+
+def detect_layout(uploaded_file, sniff_size=SNIFF_SIZE):
+    """Identifica o layout do upload lendo apenas os primeiros bytes. Retorna None se nenhum reconhecer."""
+    uploaded_file.seek(0)
+    prefix = uploaded_file.read(sniff_size)
+    uploaded_file.seek(0)
+
+    best_layout, best_score = None, 0
+    for layout in LAYOUTS.values():
+        score = layout.sniff(prefix)
+        if score > best_score:
+            best_layout, best_score = layout, score
+    return best_layout
+
+
+# Os marcadores aceitam qualquer byte no lugar dos acentos para reconhecer o
+# arquivo tanto em latin1 quanto em UTF-8.
+register_layout(Layout(
+    name='consultas',
+    label='Consultas',
+    file_types=["Confirmação de Consultas", "Cancelamento de Consultas"],
+    parse=functools.partial(process_appointment_csv, extract_rows=iter_consultas_rows),
+    markers=[r'^"?Data:"?,.*Especialidade: ', r'^"?P.{1,2}gina :'],
+    extract_rows=iter_consultas_rows,
+    test_rows=APPOINTMENT_TEST_ROWS,
+))
+register_layout(Layout(
+    name='servicos',
+    label='Serviços (Acupuntura/RPG)',
+    file_types=["Confirmação de Acupuntura", "Confirmação de RPG", "Cancelamento de Acupuntura"],
+    parse=functools.partial(process_appointment_csv, extract_rows=iter_servicos_rows),
+    markers=[r'Agenda de:', r'M.{1,2}dico:'],
+    extract_rows=iter_servicos_rows,
+    test_rows=APPOINTMENT_TEST_ROWS,
+))
+register_layout(Layout(
+    name='autorizacao',
+    label='Autorização (Excel)',
+    file_types=["Autorização liberada"],
+    parse=process_and_clean_autorizacao,
+    signatures=[b'PK\x03\x04', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],
+    test_rows=AUTORIZACAO_TEST_ROWS,
+))
@@ -0,0 +1,30 @@
+# local_store.py
+import contextlib
+import os
+import sqlite3
+
+import numpy as np
+
+# --- BANCOS LOCAIS (SQLITE) ---
+# Índice de pacientes e registro de disparos ficam em arquivos SQLite nesta pasta.
+# Cada operação abre a própria conexão, então os objetos que usam estes bancos
+# podem ser compartilhados entre as sessões (threads) do Streamlit.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.environ.get("COFRAT_DATA_DIR", os.path.join(BASE_DIR, ".data"))
+
+
+@contextlib.contextmanager
+def connect(path):
+    """Conexão em transação: confirma no fim do bloco (ou desfaz em caso de erro) e fecha."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def signed_int64(values):
+    """uint64 -> int64 com os mesmos bits (o SQLite só guarda inteiros com sinal)."""
+    return np.asarray(values, dtype=np.uint64).view(np.int64)
@@ -0,0 +1,91 @@
+# message_templates.py
+import functools
+import os
+import re
+
+import pandas as pd
+
+from local_store import BASE_DIR
+from session_frames import text_column
+
+# --- MODELOS DE MENSAGEM ---
+# data/message_templates.csv tem um texto por área com marcadores {$nome}. Cada
+# modelo é compilado uma vez em partes fixas e marcadores; a compilação fica em
+# cache enquanto a data de modificação do arquivo não muda. A renderização é feita
+# para a carga inteira de uma vez: cada marcador vira uma coluna de texto calculada
+# a partir das colunas processadas, e as partes são concatenadas coluna a coluna.
+TEMPLATES_PATH = os.environ.get("COFRAT_MESSAGE_TEMPLATES", os.path.join(BASE_DIR, "data", "message_templates.csv"))
+PLACEHOLDER_PATTERN = re.compile(r'\{\$(\w+)\}')
+# Partículas que ficam em minúsculas nos nomes próprios ('MARIA DA SILVA' -> 'Maria da Silva')
+NAME_PARTICLES = r'\b(Da|De|Do|Das|Dos|E)\b'
+
+
+def proper_name(names):
+    """Nomes em maiúsculas do relatório com iniciais maiúsculas e partículas em minúsculas."""
+    return names.str.title().str.replace(NAME_PARTICLES, lambda match: match.group(1).lower(), regex=True)
+
+
+# --- MARCADORES ---
+# Cada marcador é uma função que recebe o DataFrame da carga e devolve uma Series
+# de texto (mesmo índice); layouts sem a coluna de origem produzem texto vazio.
+PLACEHOLDERS = {}
+
+def register_placeholder(name, values):
+    """Registra a função que calcula o marcador {$name} a partir do DataFrame da carga."""
+    PLACEHOLDERS[name] = values
+    return values
+
+register_placeholder('primeiro_nome', lambda df: text_column(df, 'nome_do_paciente').str.split(n=1).str[0].fillna('').str.capitalize())
+register_placeholder('nome', lambda df: proper_name(text_column(df, 'nome_do_paciente')))
+register_placeholder('data', lambda df: text_column(df, 'data'))
+register_placeholder('horario', lambda df: text_column(df, 'horario_ajustado'))
+register_placeholder('profissional', lambda df: proper_name(text_column(df, 'nome_do_medico')))
+register_placeholder('terapia', lambda df: text_column(df, 'terapia'))
+
+
+class MessageTemplate:
+    """Modelo compilado: 'parts' são os trechos fixos, intercalados com os marcadores de 'fields'."""
+
+    def __init__(self, area, text):
+        self.area = area
+        self.text = text
+        pieces = PLACEHOLDER_PATTERN.split(text)
+        self.parts = pieces[0::2]
+        self.fields = pieces[1::2]
+        unknown = sorted(set(self.fields) - set(PLACEHOLDERS))
+        if unknown:
+            raise ValueError(
+                f"Modelo '{area}' usa marcadores desconhecidos: {', '.join('{$' + name + '}' for name in unknown)}."
+            )
+
+    def render(self, df):
+        """Texto final de cada linha de df (Series com o mesmo índice)."""
+        values = {name: PLACEHOLDERS[name](df) for name in set(self.fields)}
+        rendered = pd.Series(self.parts[0], index=df.index, dtype=object)
+        for name, part in zip(self.fields, self.parts[1:]):
+            rendered = rendered + values[name] + part
+        return rendered
+
+
+@functools.lru_cache(maxsize=16)
+def _read_table(path, mtime_ns, build):
+    # 'mtime_ns' só faz parte da chave do cache: um arquivo alterado é lido de novo
+    return build(pd.read_csv(path, dtype=str, keep_default_na=False))
+
+def load_cached_csv(path, build):
+    """build(tabela do CSV em 'path', tudo texto), refeito só quando o arquivo muda."""
+    return _read_table(path, os.stat(path).st_mtime_ns, build)
+
+def require_columns(table, columns, description):
+    """ValueError quando a tabela lida do arquivo 'description' não tem alguma das colunas."""
+    missing = set(columns) - set(table.columns)
+    if missing:
+        raise ValueError(f"O arquivo {description} não tem as colunas: {', '.join(sorted(missing))}.")
+
+def _compile_templates(table):
+    require_columns(table, {'area', 'message'}, 'de modelos')
+    return {row.area.strip(): MessageTemplate(row.area.strip(), row.message) for row in table.itertuples()}
+
+def load_templates(path=TEMPLATES_PATH):
+    """Modelos compilados por área ({área: MessageTemplate}), recompilados só quando o arquivo muda."""
+    return load_cached_csv(path, _compile_templates)
@@ -0,0 +1,146 @@
+# name_matching.py
+import numpy as np
+import pandas as pd
+
+# --- NOMES PARECIDOS (MATCHING APROXIMADO EM BLOCOS) ---
+# Variações como "MARIA DA SILVA" x "MARIA SILVA" ou erros de digitação não batem
+# pela chave exata de nome. Para não comparar todos os pares (n²), as linhas são
+# agrupadas por uma chave barata — código fonético do primeiro nome e do último
+# sobrenome + 4 últimos dígitos do telefone — e a distância de edição só é
+# calculada dentro de cada bloco. O primeiro nome na chave também evita ligar
+# familiares que dividem sobrenome e telefone ("JOSE SILVA" x "JOAO SILVA").
+PARTICLES = {'DA', 'DE', 'DO', 'DAS', 'DOS', 'DI', 'DU', 'E'}
+PHONE_SUFFIX_DIGITS = 4
+MATCH_THRESHOLD = 0.85
+PARTICLE_MATCH_SCORE = 0.95
+
+# Blocos com mais nomes distintos que isso (ex: telefone da recepção usado para
+# vários pacientes) são comparados só com os vizinhos na ordem alfabética
+MAX_BLOCK_SIZE = 50
+NEIGHBOR_WINDOW = 5
+
+# Regras fonéticas para o português, aplicadas em ordem sobre nomes sem acento
+_PHONETIC_RULES = [
+    (r'PH', 'F'), (r'LH', 'L'), (r'NH', 'N'), (r'[CS]H', 'X'),
+    (r'C(?=[EI])', 'S'), (r'QU(?=[EI])', 'K'), (r'[CQ]', 'K'), (r'G(?=[EI])', 'J'),
+    (r'SS|Z', 'S'), (r'W', 'V'), (r'Y', 'I'), (r'H', ''),
+    (r'(?<=.)[AEIOU]', ''), (r'(.)\1+', r'\1'),
+]
+
+
+def strip_particles(names):
+    """Remove preposições ('DA', 'DOS'...) de nomes já normalizados."""
+    return [' '.join(part for part in name.split() if part not in PARTICLES) for name in names]
+
+def phonetic_keys(words):
+    """Código fonético simplificado (português) de cada palavra; calculado uma vez por palavra distinta."""
+    words = pd.Series(words, copy=False)
+    codes, uniques = pd.factorize(words.fillna(''))
+    keys = pd.Series(uniques, dtype=object)
+    for pattern, replacement in _PHONETIC_RULES:
+        keys = keys.str.replace(pattern, replacement, regex=True)
+    return pd.Series(keys.to_numpy(dtype=object)[codes], index=words.index)
+
+def blocking_keys(names, phones):
+    """
+    Chave de bloco: fonético do primeiro nome e do último sobrenome + sufixo do
+    telefone ('' quando falta algum deles ou o nome tem uma palavra só).
+    """
+    names = pd.Series(names, copy=False).fillna('')
+    words = names.str.split()
+    first_name, surname = words.str[0].fillna(''), words.str[-1].fillna('')
+    phones = pd.Series(phones, copy=False).fillna('').astype(str)
+    suffix = phones.str[-PHONE_SUFFIX_DIGITS:]
+    keys = phonetic_keys(first_name) + ' ' + phonetic_keys(surname) + '|' + suffix
+    usable = (words.str.len() > 1) & (phones.str.len() >= PHONE_SUFFIX_DIGITS)
+    return keys.where(usable, '')
+
+def levenshtein(a, b, max_distance=None):
+    """
+    Distância de edição entre duas strings (inserção, remoção e troca custam 1).
+    Com 'max_distance' o cálculo para assim que o limite não pode mais ser
+    atingido e retorna max_distance + 1 (a maioria dos pares de um bloco é
+    descartada nas primeiras letras).
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is None:
+        max_distance = len(a)
+    if len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        # O menor valor da linha nunca diminui nas linhas seguintes
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+def similarity(a, b, minimum=0.0):
+    """
+    Semelhança entre 0 e 1 (1 = iguais), baseada na distância de edição. Pares
+    abaixo de 'minimum' retornam 0.0 sem calcular a distância completa.
+    """
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    max_distance = int((1.0 - minimum) * longest + 1e-9)
+    distance = levenshtein(a, b, max_distance)
+    return 1.0 - distance / longest if distance <= max_distance else 0.0
+
+def name_similarity(a, b, minimum=0.0):
+    """
+    Semelhança entre dois nomes normalizados, comparados sem preposições. Nomes
+    que só diferem nas preposições ("MARIA DA SILVA" x "MARIA SILVA") valem
+    PARTICLE_MATCH_SCORE, abaixo de um match exato. Pares abaixo de 'minimum' valem 0.0.
+    """
+    stripped_a, stripped_b = strip_particles([a, b])
+    if stripped_a == stripped_b:
+        return 1.0 if a == b else PARTICLE_MATCH_SCORE
+    return similarity(stripped_a, stripped_b, minimum)
+
+def _candidate_pairs(names):
+    """Pares de posições a comparar dentro de um bloco (todos, ou vizinhos se o bloco for grande)."""
+    if len(names) <= MAX_BLOCK_SIZE:
+        return ((i, j) for i in range(len(names)) for j in range(i + 1, len(names)))
+    order = sorted(range(len(names)), key=names.__getitem__)
+    return (
+        (order[i], order[j])
+        for i in range(len(order)) for j in range(i + 1, min(i + 1 + NEIGHBOR_WINDOW, len(order)))
+    )
+
+def fuzzy_pairs(names, blocks, threshold=MATCH_THRESHOLD):
+    """
+    Pares de linhas (posições) com nomes normalizados parecidos no mesmo bloco e a
+    semelhança de cada par. Cada grafia distinta do bloco é comparada uma vez; o
+    par liga a primeira linha de cada grafia (linhas com a mesma grafia já são o
+    mesmo paciente pela chave exata de nome).
+    """
+    frame = pd.DataFrame({
+        'name': pd.Series(names, copy=False).to_numpy(dtype=object),
+        'block': pd.Series(blocks, copy=False).to_numpy(dtype=object),
+    })
+    frame['position'] = np.arange(len(frame))
+    frame = frame[(frame['block'] != '') & (frame['name'] != '')]
+    # Uma linha por grafia distinta em cada bloco; blocos com uma grafia só não têm o que comparar
+    spellings = frame.drop_duplicates(['block', 'name'])
+    spellings = spellings[spellings.duplicated('block', keep=False)]
+
+    left, right, scores = [], [], []
+    for _, block in spellings.groupby('block', sort=False):
+        names = block['name'].tolist()
+        positions = block['position'].tolist()
+        for i, j in _candidate_pairs(names):
+            score = name_similarity(names[i], names[j], threshold)
+            if score >= threshold:
+                left.append(positions[i])
+                right.append(positions[j])
+                scores.append(score)
+    return pd.DataFrame({
+        'left': np.array(left, dtype=np.int64),
+        'right': np.array(right, dtype=np.int64),
+        'score': np.array(scores, dtype=float),
+    })
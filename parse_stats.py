@@ -0,0 +1,91 @@
+# parse_stats.py
+import time
+from collections import Counter
+
+import pandas as pd
+
+from patient_index import normalize_names
+from phones import LENGTH_REASONS, REASON_EMPTY
+
+# --- ESTATÍSTICAS ACUMULADAS DURANTE A LEITURA ---
+# O parser entrega cada lote de linhas ao acumulador assim que ele é lido: os
+# telefones do lote são normalizados uma vez e as contagens (total, telefones
+# distintos, motivos de telefone inválido, nomes repetidos) são somadas ali
+# mesmo. As métricas da "Visão Geral" e da "Análise de Qualidade" saem do
+# acumulador no final, sem novas varreduras do DataFrame, e um retrato parcial
+# pode ser exibido enquanto um arquivo grande ainda está sendo lido.
+
+# Intervalo mínimo (segundos) entre dois avisos de progresso
+PROGRESS_INTERVAL = 0.5
+
+
+class StatsAccumulator:
+    """
+    Soma as estatísticas de uma carga lote a lote. 'on_progress', quando informado,
+    recebe o dicionário de estatísticas parciais (mesmas chaves do resultado final)
+    no máximo a cada 'progress_interval' segundos.
+    """
+
+    def __init__(self, on_progress=None, progress_interval=PROGRESS_INTERVAL):
+        self.rows = 0
+        self.reasons = Counter()
+        self._phones = set()
+        self._name_counts = Counter()
+        self._phone_frames = []
+        self._name_frames = []
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self._last_progress = time.monotonic()
+
+    def add(self, phones, names=None):
+        """
+        Acumula um lote. 'phones' é o resultado de normalize_phones para o lote e
+        'names' os nomes brutos dos pacientes (None quando o layout não conta repetidos).
+        """
+        self.rows += len(phones)
+        self.reasons.update(phones['motivo_telefone'].value_counts().to_dict())
+        adjusted = phones['telefone_ajustado']
+        self._phones.update(adjusted[adjusted != ''].unique())
+        self._phone_frames.append(phones)
+        if names is not None:
+            normalized = normalize_names(names)
+            self._name_counts.update(normalized[normalized != ''].value_counts().to_dict())
+            self._name_frames.append(normalized)
+
+        if self.on_progress is not None and time.monotonic() - self._last_progress >= self.progress_interval:
+            self._last_progress = time.monotonic()
+            self.on_progress(self.stats())
+
+    def phones(self, index=None):
+        """Telefones normalizados de todas as linhas, na ordem de leitura (para não normalizar de novo)."""
+        frame = pd.concat(self._phone_frames, ignore_index=True) if self._phone_frames \
+            else pd.DataFrame({'telefone_ajustado': [], 'motivo_telefone': []}, dtype=object)
+        if index is not None:
+            frame.index = index
+        return frame
+
+    def names(self, index=None):
+        """Nomes normalizados de todas as linhas, na ordem de leitura."""
+        names = pd.concat(self._name_frames, ignore_index=True) if self._name_frames else pd.Series(dtype=object)
+        if index is not None:
+            names.index = index
+        return names
+
+    def stats(self, repeated=None):
+        """
+        Estatísticas da carga até aqui. 'repeated' substitui a contagem parcial de
+        repetidos (nomes idênticos) pelo resultado da identificação de pacientes.
+        """
+        bad_empty = self.reasons[REASON_EMPTY]
+        bad_length = sum(self.reasons[reason] for reason in LENGTH_REASONS)
+        bad_total = self.rows - self.reasons['']
+        if repeated is None:
+            repeated = sum(1 for count in self._name_counts.values() if count > 1)
+        return {
+            'total': self.rows,
+            'unique': len(self._phones),
+            'repeated': repeated,
+            'bad_total': bad_total,
+            'bad_empty': bad_empty,
+            'bad_length': bad_length,
+        }
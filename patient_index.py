@@ -0,0 +1,322 @@
+# patient_index.py
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from local_store import DATA_DIR, connect, signed_int64
+from name_matching import blocking_keys, fuzzy_pairs
+from session_frames import text_column
+
+# --- ÍNDICE DE IDENTIDADE DE PACIENTES ---
+# Cada agendamento gera até três chaves de identidade (hash de 64 bits):
+#   - prontuário do SIMAH;
+#   - nome normalizado (sem acentos, pontuação, caixa e espaços extras);
+#   - primeiro nome + telefone canônico (o mesmo paciente com o sobrenome
+#     abreviado ou escrito de outro jeito, sem juntar familiares que dividem o número).
+# Linhas que compartilham qualquer chave são o mesmo paciente; nomes parecidos
+# (name_matching) no mesmo bloco também são ligados, com a confiança do match. O índice fica em
+# SQLite e é atualizado a cada upload, então os agendamentos da semana inteira
+# (vários arquivos) entram na detecção de pacientes com múltiplos agendamentos.
+INDEX_PATH = os.path.join(DATA_DIR, "patients.sqlite3")
+
+# Agendamentos recebidos há mais tempo que isso saem do índice
+RETENTION_DAYS = 35
+
+APPOINTMENT_FIELDS = ['data', 'horario_ajustado', 'nome_do_paciente', 'nome_do_medico', 'telefone_ajustado']
+KEY_PREFIXES = ('P:', 'N:', 'F:')
+
+
+def normalize_names(names):
+    """Nome em caixa alta, sem acentos, sem pontuação e com espaços simples."""
+    names = pd.Series(names, copy=False)
+    # Os nomes se repetem muito entre agendamentos: normaliza cada grafia uma vez só
+    codes, uniques = pd.factorize(names.fillna('').astype(str))
+    ascii_names = pd.Series(uniques, dtype=object).str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    normalized = ascii_names.str.upper().str.replace(r'[^A-Z ]+', ' ', regex=True).str.split().str.join(' ')
+    return pd.Series(normalized.to_numpy(dtype=object)[codes], index=names.index)
+
+def _normalized_names(df):
+    if 'nome_do_paciente' not in df:
+        return pd.Series('', index=df.index)
+    return normalize_names(df['nome_do_paciente'])
+
+def identity_keys(df, names=None):
+    """
+    Matriz (linhas x 3) de hashes uint64 com as chaves de identidade de cada
+    agendamento: prontuário, nome normalizado e primeiro nome + telefone. 0 = chave ausente.
+    'names' são os nomes já normalizados, quando o chamador já os tem.
+    """
+    name = _normalized_names(df) if names is None else names
+    phone = text_column(df, 'telefone_ajustado')
+    record = text_column(df, 'prontuario')
+    first_name = name.str.partition(' ')[0]
+
+    values = [record, name, first_name + '|' + phone]
+    present = [record != '', name != '', (first_name != '') & (phone != '')]
+    keys = np.zeros((len(df), len(KEY_PREFIXES)), dtype=np.uint64)
+    for column, (prefix, value, mask) in enumerate(zip(KEY_PREFIXES, values, present)):
+        hashes = pd.util.hash_array((prefix + value).to_numpy(dtype=object))
+        # 0 é reservado para "sem chave"
+        keys[:, column] = np.where(mask.to_numpy(), np.maximum(hashes, 1), 0)
+    return keys
+
+def link_rows(keys, labels, pairs=None):
+    """
+    Une as linhas que compartilham alguma chave (ou que formam um dos 'pairs'
+    left/right de fuzzy_pairs): cada linha fica com o menor rótulo do seu grupo.
+    O rótulo inicial de cada linha vem em 'labels' (int64). Cada rodada é um
+    groupby por chave e outro por linha; o número de rodadas é o tamanho da maior
+    cadeia de chaves, na prática 2 ou 3.
+    """
+    rows, columns = np.nonzero(keys)
+    key_codes, uniques = pd.factorize(keys[rows, columns])
+    if pairs is not None and len(pairs):
+        # Cada par vira uma chave própria compartilhada pelas suas duas linhas
+        pair_codes = len(uniques) + np.arange(len(pairs))
+        rows = np.concatenate([rows, pairs['left'].to_numpy(), pairs['right'].to_numpy()])
+        key_codes = np.concatenate([key_codes, pair_codes, pair_codes])
+    labels = np.asarray(labels, dtype=np.int64).copy()
+    if not len(rows):
+        return labels
+    while True:
+        key_label = pd.Series(labels[rows]).groupby(key_codes).min().to_numpy()
+        row_label = pd.Series(key_label[key_codes]).groupby(rows).min()
+        updated = labels.copy()
+        updated[row_label.index.to_numpy()] = np.minimum(labels[row_label.index.to_numpy()], row_label.to_numpy())
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def match_confidence(exact_labels, pairs):
+    """
+    Confiança de que cada linha é do mesmo paciente que as outras do seu grupo:
+    1.0 quando ela bate por chave exata com outra linha; senão a maior semelhança
+    dos pares aproximados que a ligam ao grupo; NaN quando não há ligação.
+    """
+    exact_labels = np.asarray(exact_labels)
+    confidence = pd.Series(np.nan, index=range(len(exact_labels)))
+    if len(pairs):
+        endpoints = np.concatenate([exact_labels[pairs['left']], exact_labels[pairs['right']]])
+        best = pd.Series(np.tile(pairs['score'].to_numpy(), 2)).groupby(endpoints).max()
+        confidence[:] = pd.Series(exact_labels).map(best).to_numpy()
+    _, inverse, counts = np.unique(exact_labels, return_inverse=True, return_counts=True)
+    confidence[counts[inverse] > 1] = 1.0
+    return confidence.to_numpy()
+
+def identify_patients(df, names=None):
+    """
+    Identifica os pacientes considerando só as linhas do DataFrame. Retorna o
+    identificador de cada linha e a confiança do match (match_confidence).
+    'names' são os nomes já normalizados, quando o chamador já os tem.
+    """
+    names = _normalized_names(df) if names is None else names
+    keys = identity_keys(df, names)
+    exact = link_rows(keys, np.arange(len(df)))
+    pairs = fuzzy_pairs(names, blocking_keys(names, text_column(df, 'telefone_ajustado')))
+    return link_rows(keys, exact, pairs), match_confidence(exact, pairs)
+
+def patient_ids(df, names=None):
+    """Identificador de paciente de cada linha, considerando só as linhas do DataFrame."""
+    return identify_patients(df, names)[0]
+
+def count_repeated_patients(df, names=None):
+    """Quantos pacientes têm mais de um agendamento no DataFrame."""
+    if df.empty or 'nome_do_paciente' not in df:
+        return 0
+    counts = np.bincount(patient_ids(df, names))
+    return int((counts > 1).sum())
+
+def find_repeated_patients(df_good):
+    """
+    Retorna os agendamentos de pacientes que aparecem mais de uma vez, ordenados
+    por nome, data e horário, com a confiança do match na coluna 'confianca'.
+    """
+    if df_good.empty:
+        return df_good.assign(confianca=pd.Series(dtype=float))
+    ids, confidence = identify_patients(df_good)
+    repeated = np.bincount(ids)[ids] > 1
+    return df_good[repeated].assign(confianca=confidence[repeated].round(2)) \
+        .sort_values(by=['nome_do_paciente', 'data', 'horario_ajustado'])
+
+
+class PatientIndex:
+    """
+    Índice persistente (SQLite) das chaves de identidade e dos agendamentos
+    recebidos nos uploads.
+    """
+
+    def __init__(self, path=INDEX_PATH, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        with connect(self.path) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS patient_keys (
+                    key_hash INTEGER PRIMARY KEY,
+                    patient_id INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS patient_keys_patient ON patient_keys (patient_id);
+                CREATE TABLE IF NOT EXISTS appointments (
+                    row_id INTEGER PRIMARY KEY,
+                    patient_id INTEGER NOT NULL,
+                    appointment_date TEXT,
+                    data TEXT,
+                    horario_ajustado TEXT,
+                    nome_do_paciente TEXT,
+                    nome_do_medico TEXT,
+                    telefone_ajustado TEXT,
+                    registered_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS appointments_patient ON appointments (patient_id);
+                CREATE INDEX IF NOT EXISTS appointments_registered ON appointments (registered_at);
+            """)
+            # Colunas do matching aproximado (bancos criados antes delas ganham as colunas aqui)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(appointments)")}
+            for column, column_type in (('name_block', 'TEXT'), ('confianca', 'REAL')):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE appointments ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS appointments_block ON appointments (name_block)")
+
+    def _known_patients(self, conn, keys):
+        """patient_id de cada chave já indexada (-1 quando a chave é nova), com o formato de 'keys'."""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_keys (key_hash INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM lookup_keys")
+        present = np.unique(keys[keys != 0])
+        conn.executemany("INSERT INTO lookup_keys VALUES (?)", ((int(k),) for k in signed_int64(present)))
+        found = pd.read_sql_query(
+            "SELECT k.key_hash, k.patient_id FROM patient_keys k JOIN lookup_keys USING (key_hash)", conn
+        )
+        known = pd.Series(found['patient_id'].to_numpy(), index=found['key_hash'].to_numpy())
+        flat = pd.Series(signed_int64(keys.ravel())).map(known)
+        return flat.fillna(-1).to_numpy(dtype=np.int64).reshape(keys.shape)
+
+    def _stored_in_blocks(self, conn, blocks, row_ids):
+        """Agendamentos já indexados nos blocos de nome informados (exceto as linhas 'row_ids')."""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_blocks (name_block TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM lookup_blocks")
+        conn.executemany("INSERT INTO lookup_blocks VALUES (?)", ((block,) for block in blocks if block))
+        stored = pd.read_sql_query(
+            "SELECT a.row_id, a.patient_id, a.nome_do_paciente, a.name_block "
+            "FROM appointments a JOIN lookup_blocks USING (name_block)", conn
+        )
+        return stored[~stored['row_id'].isin(row_ids)].reset_index(drop=True)
+
+    def register(self, df):
+        """
+        Indexa os agendamentos do DataFrame (índice = impressão digital da linha) e
+        retorna o patient_id de cada linha. Linhas ligadas a pacientes já conhecidos
+        (por chave exata ou nome parecido no mesmo bloco) herdam o identificador;
+        pacientes que esta carga mostra serem o mesmo são unidos.
+        """
+        if df.empty:
+            return pd.Series(dtype=np.int64)
+        names = _normalized_names(df)
+        keys = identity_keys(df, names)
+        blocks = blocking_keys(names, text_column(df, 'telefone_ajustado'))
+        row_ids = signed_int64(df.index.to_numpy())
+        with connect(self.path) as conn:
+            known = self._known_patients(conn, keys)
+            next_id = (conn.execute("SELECT MAX(patient_id) FROM patient_keys").fetchone()[0] or 0) + 1
+
+            # Linhas novas recebem identificadores provisórios maiores que todos os
+            # existentes, então o menor rótulo do grupo é sempre o paciente mais antigo
+            row_known = np.where(known >= 0, known, np.iinfo(np.int64).max).min(axis=1)
+            initial = np.where(row_known < np.iinfo(np.int64).max, row_known, next_id + np.arange(len(df)))
+            exact = link_rows(keys, initial)
+
+            # Nomes parecidos: a carga atual é comparada com ela mesma e com os
+            # agendamentos já indexados nos mesmos blocos, que entram com o próprio patient_id
+            stored = self._stored_in_blocks(conn, blocks.unique(), row_ids)
+            stored_ids = stored['patient_id'].to_numpy(dtype=np.int64)
+            pairs = fuzzy_pairs(
+                pd.concat([names, normalize_names(stored['nome_do_paciente'])], ignore_index=True),
+                pd.concat([blocks, stored['name_block'].fillna('')], ignore_index=True),
+            )
+            pairs = pairs[(pairs['left'] < len(df)) | (pairs['right'] < len(df))]
+            all_keys = np.vstack([keys, np.zeros((len(stored), keys.shape[1]), dtype=np.uint64)])
+            all_exact = np.concatenate([exact, stored_ids])
+            all_labels = link_rows(all_keys, all_exact, pairs)
+            labels = all_labels[:len(df)]
+            confidence = match_confidence(all_exact, pairs)[:len(df)]
+            confidence[(known >= 0).any(axis=1)] = 1.0
+
+            # Pacientes existentes que passaram a fazer parte de outro grupo são unidos
+            old_ids = np.concatenate([known.ravel(), stored_ids])
+            new_ids = np.concatenate([np.repeat(labels, keys.shape[1]), all_labels[len(df):]])
+            is_merged = (old_ids >= 0) & (old_ids != new_ids)
+            merged = np.unique(np.column_stack([old_ids[is_merged], new_ids[is_merged]]), axis=0)
+            for old, new in merged.tolist():
+                conn.execute("UPDATE patient_keys SET patient_id = ? WHERE patient_id = ?", (new, old))
+                conn.execute("UPDATE appointments SET patient_id = ? WHERE patient_id = ?", (new, old))
+
+            rows, columns = np.nonzero(keys)
+            conn.executemany(
+                "INSERT OR REPLACE INTO patient_keys VALUES (?, ?)",
+                zip(signed_int64(keys[rows, columns]).tolist(), labels[rows].tolist()),
+            )
+            self._store_appointments(conn, df, labels, blocks, confidence)
+            self._prune(conn)
+        return pd.Series(labels, index=df.index)
+
+    def _store_appointments(self, conn, df, labels, blocks, confidence):
+        fields = pd.DataFrame({field: text_column(df, field) for field in APPOINTMENT_FIELDS})
+        appointment_date = pd.to_datetime(fields['data'], format='%d/%m/%Y', errors='coerce').dt.strftime('%Y-%m-%d')
+        records = pd.DataFrame({
+            'row_id': signed_int64(df.index.to_numpy()),
+            'patient_id': labels,
+            'appointment_date': appointment_date.to_numpy(dtype=object),
+            **{field: fields[field].to_numpy() for field in APPOINTMENT_FIELDS},
+            'registered_at': time.time(),
+            'name_block': blocks.to_numpy(dtype=object),
+            'confianca': confidence,
+        })
+        conn.executemany(
+            f"INSERT OR REPLACE INTO appointments ({', '.join(records.columns)}) "
+            f"VALUES ({', '.join('?' * len(records.columns))})",
+            records.astype(object).where(records.notna(), None).itertuples(index=False, name=None),
+        )
+
+    def _prune(self, conn):
+        """Remove agendamentos antigos e as chaves de pacientes que ficaram sem agendamento."""
+        cutoff = time.time() - self.retention_days * 24 * 60 * 60
+        conn.execute("DELETE FROM appointments WHERE registered_at < ?", (cutoff,))
+        conn.execute("DELETE FROM patient_keys WHERE patient_id NOT IN (SELECT patient_id FROM appointments)")
+
+    def forget(self, row_ids):
+        """Remove agendamentos que saíram do relatório (nova versão do mesmo dia)."""
+        row_ids = signed_int64(np.asarray(list(row_ids), dtype=np.uint64))
+        if not len(row_ids):
+            return
+        with connect(self.path) as conn:
+            conn.executemany("DELETE FROM appointments WHERE row_id = ?", ((int(r),) for r in row_ids))
+
+    def weekly_repeated(self, df, ids):
+        """
+        Agendamentos (de qualquer upload) dos pacientes da carga atual que têm mais
+        de um agendamento na mesma semana (segunda a domingo). A coluna 'carga'
+        indica se o agendamento é da carga atual ou de um upload anterior e
+        'confianca' a confiança do match; 'ids' é o retorno de register() para a carga atual.
+        """
+        columns = APPOINTMENT_FIELDS + ['carga', 'confianca', 'id_paciente']
+        if df.empty or 'data' not in df:
+            return pd.DataFrame(columns=columns)
+        with connect(self.path) as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_patients (patient_id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM lookup_patients")
+            conn.executemany("INSERT INTO lookup_patients VALUES (?)", ((int(p),) for p in np.unique(ids)))
+            stored = pd.read_sql_query(
+                "SELECT a.* FROM appointments a JOIN lookup_patients USING (patient_id)", conn
+            )
+
+        week = pd.to_datetime(stored['appointment_date'], errors='coerce').dt.to_period('W')
+        is_current = stored['row_id'].isin(signed_int64(df.index.to_numpy()))
+        groups = is_current.groupby([stored['patient_id'], week], dropna=False)
+        repeated = stored[(groups.transform('size') > 1) & groups.transform('max') & week.notna()].copy()
+        repeated['carga'] = np.where(is_current[repeated.index], 'atual', 'anterior')
+        repeated['id_paciente'] = repeated['patient_id']
+        # Agendamentos indexados antes do match (sem confiança própria) recebem a do grupo
+        group_confidence = repeated.groupby(['patient_id', week[repeated.index]])['confianca'].transform('max')
+        repeated['confianca'] = repeated['confianca'].fillna(group_confidence).round(2)
+        return repeated.sort_values(['nome_do_paciente', 'appointment_date', 'horario_ajustado'])[columns] \
+            .reset_index(drop=True)
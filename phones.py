@@ -0,0 +1,181 @@
+# phones.py
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- NORMALIZAÇÃO VETORIZADA DE TELEFONES ---
+# Todos os caminhos de ingestão (CSV do SIMAH e Excel de autorização) usam este
+# módulo. A coluna inteira é convertida em uma matriz NumPy de códigos de
+# caractere (uma linha por telefone) e limpa com poucas operações em bloco,
+# devolvendo o número no formato E.164 (+55 + DDD + número).
+COUNTRY_CODE = '55'
+
+# DDDs em uso no Brasil (plano de numeração da Anatel)
+VALID_DDDS = frozenset({
+    '11', '12', '13', '14', '15', '16', '17', '18', '19',
+    '21', '22', '24', '27', '28',
+    '31', '32', '33', '34', '35', '37', '38',
+    '41', '42', '43', '44', '45', '46', '47', '48', '49',
+    '51', '53', '54', '55',
+    '61', '62', '63', '64', '65', '66', '67', '68', '69',
+    '71', '73', '74', '75', '77', '79',
+    '81', '82', '83', '84', '85', '86', '87', '88', '89',
+    '91', '92', '93', '94', '95', '96', '97', '98', '99',
+})
+
+# DDD aplicado a números sem DDD; cada unidade da clínica configura o seu. Um valor
+# inválido não derruba o aplicativo: gera um aviso no log e vale o DDD padrão
+BUILTIN_DEFAULT_DDD = '11'
+DEFAULT_DDD = os.environ.get("COFRAT_DEFAULT_DDD", BUILTIN_DEFAULT_DDD)
+if DEFAULT_DDD not in VALID_DDDS:
+    logging.getLogger(__name__).warning(
+        "COFRAT_DEFAULT_DDD inválido: %r não é um DDD brasileiro; usando %s.", DEFAULT_DDD, BUILTIN_DEFAULT_DDD,
+    )
+    DEFAULT_DDD = BUILTIN_DEFAULT_DDD
+
+# Tabelas de consulta indexadas por dois dígitos (00-99), montadas uma vez na
+# importação: DDDs válidos e os dois primeiros dígitos de um celular (9 + 1-9).
+# A validação de uma coluna inteira vira indexação de array, sem laço por linha.
+DDD_TABLE = np.zeros(100, dtype=bool)
+DDD_TABLE[[int(ddd) for ddd in VALID_DDDS]] = True
+MOBILE_PREFIX_TABLE = np.zeros(100, dtype=bool)
+MOBILE_PREFIX_TABLE[91:100] = True
+
+# Códigos de motivo para números inválidos ('' = número válido)
+REASON_EMPTY = 'vazio'
+REASON_TOO_SHORT = 'curto'
+REASON_TOO_LONG = 'longo'
+REASON_INVALID_DDD = 'ddd'
+REASON_NOT_MOBILE = 'fixo'
+
+PHONE_REASON_LABELS = {
+    REASON_EMPTY: 'Telefone Nulo/Vazio',
+    REASON_TOO_SHORT: 'Telefone com poucos dígitos',
+    REASON_TOO_LONG: 'Telefone com dígitos demais',
+    REASON_INVALID_DDD: 'DDD inexistente',
+    REASON_NOT_MOBILE: 'Telefone não é celular',
+}
+LENGTH_REASONS = [REASON_TOO_SHORT, REASON_TOO_LONG]
+
+_ZERO = ord('0')
+_SEPARATOR = '\x00'
+_NON_DIGITS = bytes(b for b in range(256) if not (ord('0') <= b <= ord('9') or b == 0))
+_REASONS = np.array(
+    ['', REASON_EMPTY, REASON_TOO_SHORT, REASON_TOO_LONG, REASON_INVALID_DDD, REASON_NOT_MOBILE], dtype=object
+)
+
+
+def _digit_matrix(phones):
+    """
+    Reduz a coluna aos dígitos de cada telefone, alinhados à esquerda em uma
+    matriz uint8 (linhas x maior quantidade de dígitos; 0 = posição vazia).
+
+    A coluna é juntada em um único buffer de bytes para que a remoção do sufixo
+    '.0' (células numéricas do Excel) e dos caracteres não numéricos aconteça em
+    uma só passada em C, sem laço por linha. NaN vira ''.
+    """
+    text = pd.Series(phones, copy=False)
+    if len(text) == 0:
+        return np.zeros((0, 1), dtype=np.uint8)
+    try:
+        joined = _SEPARATOR.join(text)
+    except TypeError:
+        # Células vazias (None/NaN) ou numéricas, comuns nas planilhas do Excel
+        joined = _SEPARATOR.join(text.fillna('').astype(str))
+    separator = _SEPARATOR.encode()
+    joined = (joined + _SEPARATOR).encode('utf-8', 'replace').replace(b'.0' + separator, separator)
+    buffer = np.frombuffer(joined.translate(None, _NON_DIGITS), dtype=np.uint8)
+
+    # Distribui os dígitos de cada linha à esquerda da matriz
+    is_separator = buffer == 0
+    ends = np.flatnonzero(is_separator)
+    lengths = np.diff(ends, prepend=-1) - 1
+    width = max(int(lengths.max()), 1)
+    matrix = np.zeros((len(lengths), width), dtype=np.uint8)
+    matrix[np.arange(width) < lengths[:, None]] = buffer[~is_separator]
+    return matrix
+
+def _reason_codes(national, length):
+    """
+    Índice em _REASONS de cada número nacional. 'national' é a matriz uint8 de
+    códigos de caractere (DDD + número, alinhado à esquerda) e 'length' a
+    quantidade de dígitos. DDD (10 ou 11 dígitos) e prefixo de celular são
+    conferidos nas tabelas pré-calculadas.
+    """
+    digits = np.pad(national, ((0, 0), (0, max(4 - national.shape[1], 0))))[:, :4].astype(np.int64) - _ZERO
+    digits = np.clip(digits, 0, 9)
+    ddd = digits[:, 0] * 10 + digits[:, 1]
+    mobile_prefix = digits[:, 2] * 10 + digits[:, 3]
+    is_mobile = (length == 11) & MOBILE_PREFIX_TABLE[mobile_prefix]
+    return np.select(
+        [length == 0, length < 10, length > 11, ~DDD_TABLE[ddd], ~is_mobile],
+        [1, 2, 3, 4, 5], default=0,
+    )
+
+def phone_reasons(e164_phones):
+    """Motivo de cada telefone já normalizado (+55...), '' quando é um celular válido."""
+    index = e164_phones.index if isinstance(e164_phones, pd.Series) else None
+    digits = _digit_matrix(e164_phones)
+    length = np.maximum(np.count_nonzero(digits, axis=1) - len(COUNTRY_CODE), 0)
+    reasons = _reason_codes(digits[:, len(COUNTRY_CODE):], length)
+    return pd.Series(_REASONS[reasons], index=index, copy=False)
+
+def normalize_phones(phones, default_ddd=DEFAULT_DDD):
+    """
+    Normaliza uma coluna de telefones.
+
+    Retorna um DataFrame com o mesmo índice e as colunas 'telefone_ajustado'
+    (E.164, ex: +5511959044561) e 'motivo_telefone' ('' quando o número é válido).
+    Zeros à esquerda (prefixo de tronco/operadora) são descartados, números sem DDD
+    recebem o DDD padrão da clínica e o código do país só é removido quando o
+    número tem 12 ou 13 dígitos, para não confundir com o DDD 55. Números com DDD
+    inexistente ou que não são celular recebem motivo, mas mantêm o E.164.
+    """
+    index = phones.index if isinstance(phones, pd.Series) else None
+    digits = _digit_matrix(phones)
+    rows = np.arange(digits.shape[0])
+    width = digits.shape[1]
+    lookup = np.pad(digits, ((0, 0), (0, 2)))
+
+    # Onde o número nacional começa em cada linha: depois dos zeros à esquerda e,
+    # para números de 12 ou 13 dígitos, depois do código do país
+    start = np.zeros(len(rows), dtype=np.int64)
+    with_zero = np.flatnonzero(digits[:, 0] == _ZERO)
+    start[with_zero] = np.logical_and.accumulate(digits[with_zero] == _ZERO, axis=1).sum(axis=1)
+    length = np.count_nonzero(digits, axis=1) - start
+    has_country_code = np.isin(length, [12, 13]) \
+        & (lookup[rows, start] == ord(COUNTRY_CODE[0])) & (lookup[rows, start + 1] == ord(COUNTRY_CODE[1]))
+    start = start + np.where(has_country_code, len(COUNTRY_CODE), 0)
+    length = length - np.where(has_country_code, len(COUNTRY_CODE), 0)
+
+    # DDD padrão para números só com 8 ou 9 dígitos
+    without_ddd = np.isin(length, [8, 9])
+    ddd_width = np.where(without_ddd, len(default_ddd), 0)
+
+    # Monta '+55' + DDD (se faltar) + número nacional; as linhas são copiadas em
+    # bloco para cada combinação (início, DDD), que na prática são poucas
+    prefix = '+' + COUNTRY_CODE
+    output = np.zeros((len(rows), len(prefix) + len(default_ddd) + width + 1), dtype=np.uint8)
+    output[:, :len(prefix)] = np.frombuffer(prefix.encode(), dtype=np.uint8)
+    output[without_ddd, len(prefix):len(prefix) + len(default_ddd)] = np.frombuffer(default_ddd.encode(), dtype=np.uint8)
+    group_key = start * (len(default_ddd) + 1) + ddd_width
+    for key in np.flatnonzero(np.bincount(group_key)):
+        first, ddd = divmod(int(key), len(default_ddd) + 1)
+        group = group_key == key
+        target = len(prefix) + ddd
+        output[group, target:target + width - first] = digits[group, first:]
+    length = length + ddd_width
+
+    # Cada linha termina em '\n'; linhas sem número ficam só com o separador
+    output_length = np.where(length > 0, len(prefix) + length, 0)
+    output[rows, output_length] = ord('\n')
+    flat = output[np.arange(output.shape[1]) <= output_length[:, None]]
+    e164 = flat.tobytes().decode('ascii').split('\n')[:-1]
+    reason = _reason_codes(output[:, len(prefix):], length)
+
+    return pd.DataFrame({
+        'telefone_ajustado': pd.Series(np.array(e164, dtype=object), index=index, copy=False),
+        'motivo_telefone': pd.Series(_REASONS[reason], index=index, copy=False),
+    })
@@ -0,0 +1,194 @@
+# quality_rules.py
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from ingestion import is_test_row, time_to_minutes
+from phones import (
+    LENGTH_REASONS, PHONE_REASON_LABELS, REASON_EMPTY, REASON_INVALID_DDD, REASON_NOT_MOBILE, phone_reasons,
+)
+from session_frames import text_column
+
+# --- REGRAS DE QUALIDADE DOS DADOS ---
+# Cada regra é declarada uma única vez com as colunas de que precisa e uma função
+# que recebe o DataFrame inteiro e devolve a máscara booleana das linhas com o
+# problema, usando só operações em bloco do pandas/NumPy. Regras que bloqueiam
+# tiram a linha da lista de envio; alertas só são contados e exibidos. Regras
+# cujas colunas não existem no layout (ex: autorização sem data) são ignoradas, e
+# numa carga com vários layouts as linhas sem valor (nulo) em alguma coluna da
+# regra não são avaliadas por ela: a coluna não faz parte do layout da linha.
+BLOCK = 'bloqueia'
+WARN = 'alerta'
+REASON_COLUMN = 'motivo'
+REASON_SEPARATOR = '; '
+
+SEVERITY_LABELS = {
+    BLOCK: 'Removido do envio',
+    WARN: 'Alerta',
+}
+
+
+class QualityRule:
+    """
+    Regra de qualidade: 'check(df, today)' devolve a máscara das linhas com o
+    problema. 'layouts' restringe a regra a cargas só desses layouts (None: todos).
+    """
+
+    def __init__(self, name, label, check, columns=(), severity=BLOCK, layouts=None):
+        self.name = name
+        self.label = label
+        self.check = check
+        self.columns = list(columns)
+        self.severity = severity
+        self.layouts = None if layouts is None else set(layouts)
+
+    def applies_to(self, df, layouts=None):
+        if self.layouts is not None and layouts is not None and not set(layouts) <= self.layouts:
+            return False
+        return all(column in df.columns for column in self.columns)
+
+    def applicable_rows(self, df):
+        """Máscara das linhas que têm todas as colunas da regra (as nulas vêm de outro layout)."""
+        return df[self.columns].notna().all(axis=1).to_numpy()
+
+    def evaluate(self, df, today):
+        """Máscara booleana das linhas com o problema, só entre as linhas em que a regra se aplica."""
+        return np.asarray(self.check(df, today), dtype=bool) & self.applicable_rows(df)
+
+
+QUALITY_RULES = {}
+
+def register_rule(rule):
+    """Registra a regra pelo nome; apply_quality_rules avalia todas as registradas."""
+    QUALITY_RULES[rule.name] = rule
+    return rule
+
+
+# --- FUNÇÕES AUXILIARES DAS REGRAS ---
+def _phone_reason_is(*reasons):
+    """Regra de telefone: motivo (tabelas de DDD e de celular de phones.py) entre 'reasons'."""
+    return lambda df, today: phone_reasons(text_column(df, 'telefone_ajustado')).isin(reasons)
+
+
+# --- REGRAS ---
+register_rule(QualityRule(
+    name='telefone_vazio',
+    label=PHONE_REASON_LABELS[REASON_EMPTY],
+    columns=['telefone_ajustado'],
+    check=_phone_reason_is(REASON_EMPTY),
+))
+register_rule(QualityRule(
+    name='telefone_comprimento',
+    label='Comprimento Inválido',
+    columns=['telefone_ajustado'],
+    check=_phone_reason_is(*LENGTH_REASONS),
+))
+register_rule(QualityRule(
+    name='ddd_invalido',
+    label=PHONE_REASON_LABELS[REASON_INVALID_DDD],
+    columns=['telefone_ajustado'],
+    check=_phone_reason_is(REASON_INVALID_DDD),
+))
+register_rule(QualityRule(
+    name='nao_celular',
+    label=PHONE_REASON_LABELS[REASON_NOT_MOBILE],
+    columns=['telefone_ajustado'],
+    check=_phone_reason_is(REASON_NOT_MOBILE),
+))
+register_rule(QualityRule(
+    name='horario_invalido',
+    label='Horário ilegível',
+    columns=['horario_ajustado'],
+    check=lambda df, today: time_to_minutes(df['horario_ajustado']).isna(),
+))
+# Os registros de teste têm datas fixas, já passadas
+register_rule(QualityRule(
+    name='data_passada',
+    label='Data já passou',
+    columns=['data'],
+    check=lambda df, today: (pd.to_datetime(df['data'], format='%d/%m/%Y', errors='coerce') < pd.Timestamp(today))
+        & ~is_test_row(df.index),
+    severity=WARN,
+))
+register_rule(QualityRule(
+    name='medico_ausente',
+    label='Sem profissional',
+    columns=['nome_do_medico'],
+    check=lambda df, today: text_column(df, 'nome_do_medico') == '',
+    severity=WARN,
+))
+# Só nas consultas: nas agendas de serviços (Acupuntura/RPG) o mesmo profissional
+# atende vários pacientes no mesmo horário
+register_rule(QualityRule(
+    name='horario_duplicado',
+    label='Horário duplicado para o profissional',
+    columns=['data', 'horario_ajustado', 'nome_do_medico'],
+    check=lambda df, today: (text_column(df, 'nome_do_medico') != '')
+        & df.duplicated(['data', 'horario_ajustado', 'nome_do_medico'], keep=False),
+    severity=WARN,
+    layouts=['consultas'],
+))
+
+
+# --- AVALIAÇÃO ---
+def evaluate_rules(df, rules=None, today=None, layouts=None):
+    """
+    DataFrame de máscaras (uma coluna por regra aplicável, mesmo índice de df).
+    'layouts' são os nomes dos layouts da carga (None: desconhecidos, todas as regras valem).
+    """
+    rules = QUALITY_RULES.values() if rules is None else rules
+    today = today or datetime.date.today()
+    return pd.DataFrame({
+        rule.name: rule.evaluate(df, today)
+        for rule in rules if rule.applies_to(df, layouts)
+    }, index=df.index)
+
+def describe_problems(masks):
+    """Motivos de cada linha ('Telefone Nulo/Vazio; DDD inexistente'...), '' quando não há problema."""
+    reasons = pd.Series('', index=masks.index, dtype=object)
+    for name in masks.columns:
+        flagged = masks[name].to_numpy()
+        separator = np.where(reasons != '', REASON_SEPARATOR, '')
+        reasons = reasons.where(~flagged, reasons + separator + QUALITY_RULES[name].label)
+    return reasons
+
+def rule_counts(masks):
+    """Quantidade de linhas por regra, com o efeito de cada uma, para exibição."""
+    return pd.DataFrame({
+        'regra': [QUALITY_RULES[name].label for name in masks.columns],
+        'efeito': [SEVERITY_LABELS[QUALITY_RULES[name].severity] for name in masks.columns],
+        'registros': masks.sum().to_numpy(dtype=np.int64),
+    })
+
+def apply_quality_rules(good_df, bad_df, rules=None, today=None, layouts=None):
+    """
+    Avalia as regras sobre todas as linhas da carga (válidas e inválidas juntas,
+    para que duplicidades entre elas apareçam) e refaz a separação: linhas com
+    alguma regra que bloqueia vão para bad_df, com a coluna REASON_COLUMN. Linhas
+    que já estavam em bad_df continuam lá mesmo sem regra que bloqueie. 'layouts'
+    são os nomes dos layouts da carga (evaluate_rules).
+
+    Retorna (good_df, bad_df, warnings_df, counts): warnings_df são as linhas que
+    seguem para envio com algum alerta, também com REASON_COLUMN.
+    """
+    frames = [df for df in (good_df, bad_df) if not df.empty]
+    if not frames:
+        return good_df, bad_df, pd.DataFrame(columns=[REASON_COLUMN]), rule_counts(pd.DataFrame())
+    rows = pd.concat(frames)
+    masks = evaluate_rules(rows, rules, today, layouts)
+    blocking = [name for name in masks.columns if QUALITY_RULES[name].severity == BLOCK]
+    warning = [name for name in masks.columns if QUALITY_RULES[name].severity == WARN]
+    is_blocked = masks[blocking].any(axis=1).to_numpy()
+    was_bad = np.arange(len(rows)) >= len(good_df)
+    is_bad = is_blocked | was_bad
+    is_warned = masks[warning].any(axis=1).to_numpy() & ~is_bad
+
+    reasons = describe_problems(masks)
+    if REASON_COLUMN in rows:
+        # Sem regra que bloqueie, a linha inválida mantém o motivo que já tinha
+        reasons = reasons.where(is_blocked | ~was_bad, rows[REASON_COLUMN].fillna(''))
+    new_good = good_df[~is_blocked[:len(good_df)]] if not good_df.empty else good_df
+    new_bad = rows[is_bad].assign(**{REASON_COLUMN: reasons[is_bad].to_numpy()})
+    warnings = rows[is_warned].assign(**{REASON_COLUMN: reasons[is_warned].to_numpy()})
+    return new_good, new_bad, warnings, rule_counts(masks)
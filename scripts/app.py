@@ -2,8 +2,12 @@
 import requests
 import pandas as pd
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import get_client
+
 def test_baserow_connection():
     """
     Função para testar a conexão com o Baserow e a transformação dos dados.
@@ -20,7 +24,7 @@ def test_baserow_connection():
 
     try:
         print("Fazendo a requisição para a API do Baserow...")
-        response = requests.get(url, headers=headers)
+        response = get_client().get(url, headers=headers)
         response.raise_for_status()
         print("Requisição bem-sucedida!")
 
@@ -0,0 +1,188 @@
+# scripts/benchmark_ingestion.py
+# Mede a ingestão de ponta a ponta (layout.parse) e por etapa em exportações
+# sintéticas de cada layout, de 1 mil a 1 milhão de agendamentos. Cada caso roda
+# em um processo novo, para que o pico de memória (RSS) seja só daquele caso. Os
+# resultados são acrescentados a um arquivo JSON Lines e comparados com a última
+# execução do mesmo caso.
+#
+# Uso: python scripts/benchmark_ingestion.py [--layouts consultas,servicos,autorizacao]
+#                                            [--sizes 1000,10000,100000,1000000]
+#                                            [--repeat 3] [--output arquivo.jsonl] [--no-save]
+import argparse
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+from synthetic_reports import GENERATORS, LAYOUT_EXTENSIONS, generate_report
+
+BENCHMARK_DIR = os.path.join(BASE_DIR, ".cache", "benchmarks")
+REPORTS_DIR = os.path.join(BENCHMARK_DIR, "reports")
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "ingestion.jsonl")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+STAGES = ['parse', 'phone', 'time', 'stats']
+
+
+# --- ARQUIVOS SINTÉTICOS ---
+def report_path(layout_name, appointments, seed):
+    """Gera (uma única vez) a exportação sintética do caso e devolve o caminho."""
+    path = os.path.join(REPORTS_DIR, f"{layout_name}-{appointments}-{seed}.{LAYOUT_EXTENSIONS[layout_name]}")
+    if not os.path.exists(path):
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        data = generate_report(layout_name, appointments, seed)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+# --- MEDIÇÃO (EXECUTADA EM UM PROCESSO SEPARADO POR CASO) ---
+def peak_rss_mb():
+    """Pico de memória residente do processo atual, em MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS em bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def best_of(repeat, func, *args, **kwargs):
+    """Executa 'repeat' vezes e retorna (melhor tempo em segundos, último resultado)."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def measure_case(layout_name, path, repeat):
+    """
+    Mede um caso: tempo de ponta a ponta, pico de RSS e tempo por etapa.
+    'stats' é o que sobra do tempo total depois de leitura e normalização
+    (separação bons/ruins, estatísticas, repetidos e registros fixos).
+    """
+    from ingestion import LAYOUTS, floor_times, normalize_appointment_rows, read_appointment_rows, read_autorizacao_excel
+    from phones import normalize_phones
+
+    with open(path, "rb") as f:
+        data = f.read()
+    layout = LAYOUTS[layout_name]
+    baseline_rss = peak_rss_mb()
+
+    total, result = best_of(repeat, lambda: layout.parse(io.BytesIO(data)))
+    peak_rss = peak_rss_mb()
+    rows = int(result[3].get('total', 0))
+
+    stages = {}
+    if layout.extract_rows is not None:
+        stages['parse'], raw = best_of(repeat, read_appointment_rows, io.BytesIO(data), layout.extract_rows)
+        stages['phone'], _ = best_of(repeat, normalize_phones, raw['Telefone'])
+        stages['time'], _ = best_of(repeat, floor_times, raw['Hora'])
+        normalize, _ = best_of(repeat, normalize_appointment_rows, raw)
+    else:
+        stages['parse'], raw = best_of(repeat, read_autorizacao_excel, io.BytesIO(data))
+        stages['phone'], _ = best_of(repeat, normalize_phones, raw['TELEFONE'])
+        stages['time'] = None
+        normalize = stages['phone']
+    stages['stats'] = max(total - stages['parse'] - normalize, 0.0)
+
+    return {
+        'rows': rows,
+        'file_bytes': len(data),
+        'total_s': total,
+        'rows_per_s': rows / total if total else None,
+        'stages_s': stages,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss,
+    }
+
+def run_isolated(layout_name, path, repeat):
+    """Roda measure_case em um processo novo (spawn) e devolve o resultado."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(measure_case, (layout_name, path, repeat))
+
+
+# --- RESULTADOS ---
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous(path):
+    """Última medição registrada de cada caso (layout, agendamentos)."""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[(record['layout'], record['appointments'])] = record
+    return previous
+
+def format_stages(stages):
+    return "  ".join(
+        f"{stage} {stages[stage] * 1000:8.1f}ms" if stages.get(stage) is not None else f"{stage} {'-':>10}"
+        for stage in STAGES
+    )
+
+def print_result(record, previous):
+    line = (
+        f"{record['layout']:<12} {record['appointments']:>9,}  {record['total_s'] * 1000:10.1f} ms"
+        f"  {record['rows_per_s']:12,.0f} linhas/s  RSS {record['peak_rss_mb']:8.1f} MiB  {format_stages(record['stages_s'])}"
+    )
+    if previous is not None:
+        change = (record['total_s'] / previous['total_s'] - 1) * 100
+        line += f"  ({change:+.1f}% vs {previous.get('revision') or 'anterior'})"
+    print(line, flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark da ingestão dos relatórios do SIMAH.")
+    parser.add_argument("--layouts", default=",".join(GENERATORS), help="layouts separados por vírgula")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="quantidades de agendamentos")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções por medição (vale a melhor)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=RESULTS_FILE, help="arquivo JSON Lines com o histórico")
+    parser.add_argument("--no-save", action="store_true", help="não grava os resultados")
+    args = parser.parse_args()
+
+    layouts = args.layouts.split(",")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    previous = load_previous(args.output)
+    revision = git_revision()
+    environment = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+    print(f"Revisão {revision or '?'} — melhor de {args.repeat} execuções por caso")
+    for layout_name in layouts:
+        for appointments in sizes:
+            path = report_path(layout_name, appointments, args.seed)
+            record = {
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'revision': revision,
+                'layout': layout_name,
+                'appointments': appointments,
+                'seed': args.seed,
+                'repeat': args.repeat,
+                **environment,
+                **run_isolated(layout_name, path, args.repeat),
+            }
+            print_result(record, previous.get((layout_name, appointments)))
+            if not args.no_save:
+                os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
@@ -0,0 +1,100 @@
+# scripts/benchmark_phones.py
+# Compara a normalização vetorizada de telefones (phones.normalize_phones) com as
+# funções antigas aplicadas linha a linha via .apply().
+#
+# Uso: python scripts/benchmark_phones.py [quantidade_de_linhas]
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from phones import normalize_phones
+
+
+# --- VERSÕES ANTIGAS (REFERÊNCIA) ---
+def adjust_phone_number(phone_number):
+    """Versão antiga do caminho CSV: 13 dígitos, sem '+'."""
+    digits_only = re.sub(r'\D', '', str(phone_number))
+    if len(digits_only) > 10:
+        if not digits_only.startswith('55'):
+            return '55' + digits_only
+        return digits_only
+    elif len(digits_only) == 10:
+        return '55' + digits_only
+    elif len(digits_only) >= 8:
+        return '5511' + digits_only
+    else:
+        return ''
+
+def format_phone_number(phone_number):
+    """Versão antiga do caminho Excel: prefixo '+55'."""
+    if pd.isna(phone_number) or str(phone_number).strip() == '':
+        return ''
+    phone_str = str(phone_number).strip()
+    if phone_str.endswith('.0'):
+        phone_str = phone_str[:-2]
+    cleaned_number = phone_str.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+    prefix = ''
+    if cleaned_number.startswith('+'):
+        prefix = '+'
+        cleaned_number = cleaned_number[1:]
+    if cleaned_number.startswith('55'):
+        cleaned_number = cleaned_number[2:]
+        prefix = '+55'
+    if cleaned_number.startswith('11') or cleaned_number.startswith('19'):
+        return prefix + '55' + cleaned_number
+    if len(cleaned_number) == 9:
+        return prefix + '5511' + cleaned_number
+    return prefix + '55' + cleaned_number
+
+
+# --- GERAÇÃO DE DADOS ---
+def sample_phones(rows, seed=42):
+    """Gera telefones nos formatos encontrados nos relatórios (com máscara, sem DDD, com +55, inválidos)."""
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(10_000_000, 99_999_999, size=rows).astype(str)
+    ddds = rng.choice(['11', '19', '21', '41', '85'], size=rows)
+    formats = rng.integers(0, 6, size=rows)
+    phones = np.empty(rows, dtype=object)
+    for kind in range(6):
+        mask = formats == kind
+        n, d = numbers[mask], ddds[mask]
+        if kind == 0:
+            phones[mask] = [f'({a}) 9{b[:4]}-{b[4:]}' for a, b in zip(d, n)]
+        elif kind == 1:
+            phones[mask] = ['9' + b for b in n]
+        elif kind == 2:
+            phones[mask] = [f'+55 {a} 9{b}' for a, b in zip(d, n)]
+        elif kind == 3:
+            phones[mask] = [f'{a}{b}' for a, b in zip(d, n)]
+        elif kind == 4:
+            phones[mask] = [b[:3] for b in n]
+        else:
+            phones[mask] = ''
+    return pd.Series(phones)
+
+def timed(label, rows, func, *args, repeat=3):
+    """Mede o melhor de 'repeat' execuções."""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed.append(time.perf_counter() - start)
+    best = min(elapsed)
+    print(f"{label:<45} {best * 1000:10.1f} ms  {rows / best:12,.0f} linhas/s")
+    return best
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    phones = sample_phones(rows)
+    print(f"Normalização de {rows:,} telefones")
+    legacy_csv = timed("CSV antigo (.apply adjust_phone_number)", rows, phones.apply, adjust_phone_number)
+    legacy_excel = timed("Excel antigo (.apply format_phone_number)", rows, phones.apply, format_phone_number)
+    vectorized = timed("Vetorizado (normalize_phones)", rows, normalize_phones, phones)
+    print(f"Ganho sobre o CSV antigo:   {legacy_csv / vectorized:.1f}x")
+    print(f"Ganho sobre o Excel antigo: {legacy_excel / vectorized:.1f}x")
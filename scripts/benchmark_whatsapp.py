@@ -0,0 +1,79 @@
+# scripts/benchmark_whatsapp.py
+# Teste de carga do envio direto pela Cloud API (whatsapp_cloud.WhatsAppSender)
+# contra a Graph API local (mock_graph_api.py): vazão alcançada, respostas 429 do
+# limite por número e latência por mensagem, sem enviar nada à Meta.
+#
+# Uso: python scripts/benchmark_whatsapp.py [--messages 2000] [--numbers 1] [--server-mps 80]
+#                                           [--sender-mps 80] [--latency 0.15] [--in-flight 32]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+sys.path.insert(0, SCRIPTS_DIR)
+from mock_graph_api import start_mock_graph_api
+from whatsapp_cloud import MESSAGE_SENT, WhatsAppSender, template_message
+
+# Template só do teste: a Graph API local aceita qualquer nome
+BENCHMARK_TEMPLATES = {
+    "Confirmação de Consultas": ("teste_benchmark", ['primeiro_nome', 'data', 'horario_ajustado', 'nome_do_medico']),
+}
+
+
+def sample_contacts(count):
+    return [
+        {
+            'nome_do_paciente': f"PACIENTE {position}",
+            'telefone_ajustado': f"+55119{position:08d}",
+            'data': '20/10/2026',
+            'horario_ajustado': '08:00',
+            'nome_do_medico': 'DR TESTE',
+        }
+        for position in range(count)
+    ]
+
+async def send_all(sender, messages, numbers):
+    """Divide as mensagens entre os números remetentes e envia tudo ao mesmo tempo."""
+    batches = [messages[index::numbers] for index in range(numbers)]
+    return await asyncio.gather(*(
+        sender.send_batch(batch, phone_number_id=f"10000000000000{index}") for index, batch in enumerate(batches)
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Teste de carga do envio direto pela Cloud API (servidor local).")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--numbers", type=int, default=1, help="números remetentes (phone_number_id)")
+    parser.add_argument("--server-mps", type=int, default=80, help="limite do servidor por número")
+    parser.add_argument("--sender-mps", type=float, default=80, help="balde de fichas do cliente por número")
+    parser.add_argument("--latency", type=float, default=0.15, help="latência simulada da Graph API (s)")
+    parser.add_argument("--in-flight", type=int, default=32, help="mensagens aguardando resposta ao mesmo tempo")
+    args = parser.parse_args()
+
+    server, state, url = start_mock_graph_api(mps=args.server_mps, latency=args.latency)
+    sender = WhatsAppSender(
+        token="teste", api_url=url, messages_per_second=args.sender_mps,
+        max_in_flight=args.in_flight, backoff_base=0.5,
+    )
+    messages = [
+        template_message(contact, "Confirmação de Consultas", BENCHMARK_TEMPLATES)
+        for contact in sample_contacts(args.messages)
+    ]
+
+    started = time.perf_counter()
+    results = pd.concat(asyncio.run(send_all(sender, messages, args.numbers)), ignore_index=True)
+    elapsed = time.perf_counter() - started
+    sender.close()
+    server.shutdown()
+
+    sent = int((results['status'] == MESSAGE_SENT).sum())
+    print(f"{args.messages:,} mensagens, {args.numbers} número(s), limite {args.server_mps}/s, cliente {args.sender_mps}/s")
+    print(f"Enviadas: {sent:,} em {elapsed:.1f}s ({sent / elapsed:.0f} msg/s)")
+    print(f"Respostas do servidor: {dict(state.responses)}")
+    print(f"Tentativas por mensagem: média {results['tentativas'].mean():.2f}, máx {results['tentativas'].max()}")
+    print(f"Latência (s): p50 {results['segundos'].quantile(0.5):.3f}, p95 {results['segundos'].quantile(0.95):.3f}")
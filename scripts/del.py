@@ -1,4 +1,8 @@
-import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import get_client
 
 # Dados da API
 url = 'https://graph.facebook.com/v22.0/801077859762875/messages'  # Substitua pelo seu phone_number_id
@@ -24,7 +28,7 @@ headers = {
 }
 
 # Envio da requisição
-response = requests.post(url, json=payload, headers=headers)
+response = get_client().post(url, json=payload, headers=headers)
 
 # Resultado
 if response.status_code == 200:
@@ -1,4 +1,8 @@
-import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import get_client
 
 # Substitua pelos seus dados reais
 waba_id = '1345055953751400'
@@ -13,7 +17,7 @@ headers = {
 }
 
 # Envio da requisição
-response = requests.get(url, headers=headers)
+response = get_client().get(url, headers=headers)
 
 # Resultado
 if response.status_code == 200:
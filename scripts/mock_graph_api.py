@@ -0,0 +1,137 @@
+# scripts/mock_graph_api.py
+# Servidor local que imita o endpoint de mensagens da Cloud API do WhatsApp
+# (POST /{versão}/{phone_number_id}/messages), para testar e medir o envio direto
+# (whatsapp_cloud.py) sem a Meta. Aplica um limite de mensagens por segundo por
+# phone_number_id (janela de 1 s), respondendo como a Graph API quando ele é
+# excedido (429, erro 130429), e pode simular latência e erros 5xx.
+#
+# Uso: python scripts/mock_graph_api.py [--port 8788] [--mps 80] [--latency 0.1] [--fail-rate 0.01]
+# No app: COFRAT_WHATSAPP_API_URL=http://127.0.0.1:8788 COFRAT_WHATSAPP_TOKEN=teste ...
+import argparse
+import collections
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MESSAGES_PATH = re.compile(r'^/v[\d.]+/(?P<phone_number_id>[^/]+)/messages$')
+
+
+class MockGraphState:
+    """Contadores e janelas de limite do servidor, compartilhados entre as threads das requisições."""
+
+    def __init__(self, mps=80, latency=0.0, fail_rate=0.0, seed=None):
+        self.mps = mps
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.windows = collections.defaultdict(collections.deque)
+        self.accepted = collections.Counter()
+        self.responses = collections.Counter()
+        self.messages = []
+
+    def allow(self, phone_number_id):
+        """True se o número ainda tem espaço no último segundo (e conta esta mensagem)."""
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows[phone_number_id]
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= self.mps:
+                return False
+            window.append(now)
+            return True
+
+    def fails(self):
+        with self.lock:
+            return self.random.random() < self.fail_rate
+
+    def record(self, status, phone_number_id=None, message=None):
+        with self.lock:
+            self.responses[status] += 1
+            if message is not None:
+                self.accepted[phone_number_id] += 1
+                self.messages.append(message)
+
+
+def graph_error(code, message, error_type='OAuthException'):
+    return {'error': {'message': message, 'type': error_type, 'code': code, 'fbtrace_id': uuid.uuid4().hex[:16]}}
+
+def make_handler(state):
+    class MockGraphHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            match = MESSAGES_PATH.match(self.path)
+            if match is None:
+                return self._reply(404, graph_error(803, 'Unknown path'))
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                return self._reply(401, graph_error(190, 'Invalid OAuth access token'))
+            phone_number_id = match.group('phone_number_id')
+            time.sleep(state.latency)
+            if not state.allow(phone_number_id):
+                return self._reply(429, graph_error(130429, '(#130429) Rate limit hit'))
+            if state.fails():
+                return self._reply(503, graph_error(2, 'Service temporarily unavailable'))
+            try:
+                message = json.loads(body)
+                recipient = message['to']
+            except (ValueError, KeyError, TypeError):
+                return self._reply(400, graph_error(100, 'Invalid parameter'))
+            self._reply(200, {
+                'messaging_product': 'whatsapp',
+                'contacts': [{'input': recipient, 'wa_id': recipient}],
+                'messages': [{'id': f"wamid.{uuid.uuid4().hex}"}],
+            }, phone_number_id, message)
+
+        def _reply(self, status, body, phone_number_id=None, message=None):
+            state.record(status, phone_number_id, message)
+            data = json.dumps(body).encode()
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # o cliente desistiu (timeout) antes da resposta
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockGraphHandler
+
+def start_mock_graph_api(host='127.0.0.1', port=0, **options):
+    """
+    Sobe o servidor em uma thread e retorna (servidor, estado, url base para
+    COFRAT_WHATSAPP_API_URL). port=0 escolhe uma porta livre. Encerrar com servidor.shutdown().
+    """
+    state = MockGraphState(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Graph API (mensagens do WhatsApp) local para testes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--mps", type=int, default=80, help="limite de mensagens por segundo por número")
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por requisição")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de respostas 503")
+    args = parser.parse_args()
+
+    server, state, url = start_mock_graph_api(
+        args.host, args.port, mps=args.mps, latency=args.latency, fail_rate=args.fail_rate,
+    )
+    print(f"Graph API de teste em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"aceitas por número {dict(state.accepted)}, respostas {dict(state.responses)}", flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
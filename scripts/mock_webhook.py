@@ -0,0 +1,154 @@
+# scripts/mock_webhook.py
+# Servidor local que faz o papel do webhook de disparo em massa, para testar o
+# envio em lotes sem acionar a automação real. Aceita POST em qualquer caminho,
+# conta os contatos recebidos e pode simular latência, erros 5xx, 429 e timeouts.
+# Lotes repetidos (mesmo cabeçalho Idempotency-Key) são aceitos sem contar de novo.
+# Aceita as duas versões do payload (registros ou colunas + gzip) e conta os bytes recebidos.
+#
+# Uso: python scripts/mock_webhook.py [--port 8787] [--latency 0.2] [--fail-rate 0.1]
+#                                     [--throttle-rate 0.05] [--timeout-rate 0.02]
+# No app: COFRAT_WEBHOOK_URL=http://127.0.0.1:8787/webhook/disparo-em-massa streamlit run main.py
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dispatcher import PAYLOAD_VERSION_HEADER, decode_payload
+
+
+class MockWebhookState:
+    """Contadores do servidor, compartilhados entre as threads das requisições."""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, throttle_rate=0.0, timeout_rate=0.0, hang_seconds=60.0, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.accepted_contacts = 0
+        self.responses = {}
+        self.payloads = []
+        self.duplicates = 0
+        self.received_bytes = 0
+        self.versions = {}
+        self._seen_keys = set()
+
+    def outcome(self):
+        """Sorteia o que a próxima requisição recebe: 'ok', 'erro', 'limite' ou 'timeout'."""
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.timeout_rate:
+            return 'timeout'
+        if draw < self.timeout_rate + self.throttle_rate:
+            return 'limite'
+        if draw < self.timeout_rate + self.throttle_rate + self.fail_rate:
+            return 'erro'
+        return 'ok'
+
+    def is_duplicate(self, key):
+        """Registra a chave de idempotência do lote; True se ela já foi aceita antes."""
+        if key is None:
+            return False
+        with self.lock:
+            if key in self._seen_keys:
+                self.duplicates += 1
+                return True
+            self._seen_keys.add(key)
+            return False
+
+    def record(self, status, payload=None, size=0, version=None):
+        with self.lock:
+            self.requests += 1
+            self.received_bytes += size
+            if version is not None:
+                self.versions[version] = self.versions.get(version, 0) + 1
+            self.responses[status] = self.responses.get(status, 0) + 1
+            if payload is not None:
+                self.accepted_contacts += len(payload.get('contacts', []))
+                self.payloads.append(payload)
+
+
+def make_handler(state):
+    class MockWebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(state.latency)
+            outcome = state.outcome()
+            if outcome == 'timeout':
+                time.sleep(state.hang_seconds)
+            if outcome in ('erro', 'timeout'):
+                return self._reply(503, {'message': 'indisponível'})
+            if outcome == 'limite':
+                return self._reply(429, {'message': 'muitas requisições'}, {'Retry-After': '1'})
+            try:
+                payload = decode_payload(body, self.headers)
+            except (ValueError, OSError, KeyError, TypeError):
+                return self._reply(400, {'message': 'payload inválido'})
+            if state.is_duplicate(self.headers.get('Idempotency-Key')):
+                return self._reply(200, {'message': 'Lote já recebido'})
+            self._reply(
+                200, {'message': 'Workflow was started'}, payload=payload,
+                size=len(body), version=self.headers.get(PAYLOAD_VERSION_HEADER, '1'),
+            )
+
+        def _reply(self, status, body, headers=None, payload=None, size=0, version=None):
+            state.record(status, payload, size, version)
+            data = json.dumps(body).encode()
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # o cliente desistiu (timeout) antes da resposta
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockWebhookHandler
+
+def start_mock_webhook(host='127.0.0.1', port=0, **options):
+    """
+    Sobe o servidor em uma thread e retorna (servidor, estado, url). port=0 escolhe
+    uma porta livre. Encerrar com servidor.shutdown().
+    """
+    state = MockWebhookState(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}/webhook/disparo-em-massa"
+    return server, state, url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Webhook local de disparo em massa para testes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="segundos por requisição")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de respostas 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fração de respostas 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fração de requisições que travam")
+    args = parser.parse_args()
+
+    server, state, url = start_mock_webhook(
+        args.host, args.port, latency=args.latency, fail_rate=args.fail_rate,
+        throttle_rate=args.throttle_rate, timeout_rate=args.timeout_rate,
+    )
+    print(f"Webhook de teste em {url} (Ctrl+C para encerrar)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{state.requests} requisições, {state.accepted_contacts} contatos aceitos, respostas {state.responses}, {state.duplicates} lotes repetidos, {state.received_bytes} bytes aceitos", flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,168 @@
+# scripts/synthetic_reports.py
+# Gera exportações sintéticas do SIMAH em cada layout suportado, com a mesma
+# estrutura dos arquivos reais (linhas de cabeçalho, quebras de página, rodapés,
+# telefones em vários formatos), para benchmarks e testes manuais da ingestão.
+#
+# Uso: python scripts/synthetic_reports.py <layout> <agendamentos> <arquivo_de_saida>
+#      layout: consultas | servicos | autorizacao
+import csv
+import io
+import sys
+
+import numpy as np
+import openpyxl
+
+FIRST_NAMES = [
+    'MARIA', 'JOSÉ', 'ANA', 'JOÃO', 'ANTÔNIO', 'FRANCISCA', 'CARLOS', 'PAULO', 'LÚCIA',
+    'PEDRO', 'MÁRCIA', 'LUCAS', 'LUIZ', 'ADRIANA', 'JULIANA', 'CONCEIÇÃO', 'RAFAEL', 'SÔNIA',
+]
+LAST_NAMES = [
+    'SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA',
+    'LIMA', 'GOMES', 'RIBEIRO', 'CARVALHO', 'ARAÚJO', 'MENDONÇA', 'CONCEIÇÃO', 'GONÇALVES',
+]
+DOCTORS = [
+    'LEANDRO TETSUO OKAMURA', 'RENATA DE ASSIS', 'MARCOS VINÍCIUS PRADO', 'HELENA KOBAYASHI',
+    'FÁBIO GUIMARÃES', 'CLÁUDIA REZENDE',
+]
+SPECIALTIES = ['ORTOPEDIA', 'FISIATRIA', 'TRAUMATOLOGIA']
+SERVICES = ['ACUPUNTURA', 'RPG']
+INSURERS = ['UNIMED', 'BRADESCO SAÚDE', 'SULAMÉRICA', 'PARTICULAR', 'AMIL', 'SUS']
+EVENTS = ['CONSULTA', 'RETORNO', 'SESSÃO', 'AVALIAÇÃO']
+THERAPIES = ['ACUPUNTURA', 'FISIOTERAPIA', 'FISIO/ACUP', 'RPG', 'PILATES']
+
+# Agendamentos por página do relatório e por agenda (médico/dia)
+ROWS_PER_PAGE = 40
+ROWS_PER_AGENDA = 25
+
+LAYOUT_EXTENSIONS = {'consultas': 'csv', 'servicos': 'csv', 'autorizacao': 'xlsx'}
+
+# Formatos de telefone e a proporção com que aparecem nas exportações
+PHONE_FORMATS = [
+    ('({ddd}) 9{a}-{b}', 0.45),
+    ('{ddd}9{a}{b}', 0.15),
+    ('9{a}-{b}', 0.10),       # sem DDD
+    ('+55 {ddd} 9{a} {b}', 0.10),
+    ('({ddd}) {a}-{b}', 0.10),  # fixo
+    ('', 0.05),
+    ('{a}', 0.05),            # incompleto
+]
+DDDS = ['11', '11', '11', '19', '21', '41', '85']
+
+
+def sample_report_phones(rows, seed=42):
+    """Sorteia telefones nos formatos e proporções vistos nos relatórios do SIMAH."""
+    rng = np.random.default_rng(seed)
+    formats = rng.choice(len(PHONE_FORMATS), size=rows, p=[share for _, share in PHONE_FORMATS])
+    ddds = rng.choice(DDDS, size=rows)
+    numbers = rng.integers(10_000_000, 99_999_999, size=rows).astype(str)
+    return [
+        PHONE_FORMATS[kind][0].format(ddd=ddd, a=number[:4], b=number[4:])
+        for kind, ddd, number in zip(formats, ddds, numbers)
+    ]
+
+def sample_appointments(rows, seed=42):
+    """Sorteia as colunas dos agendamentos (nomes, horários, telefones, médicos...)."""
+    rng = np.random.default_rng(seed)
+    first = rng.choice(FIRST_NAMES, size=rows)
+    middle = rng.choice(LAST_NAMES, size=rows)
+    last = rng.choice(LAST_NAMES, size=rows)
+    minutes = rng.integers(7 * 60, 19 * 60, size=rows)
+    # A maior parte dos horários cai em múltiplos de 10 minutos, como nas agendas reais
+    minutes = np.where(rng.random(rows) < 0.8, minutes // 10 * 10, minutes)
+    return {
+        'paciente': [f'{a} {b} {c}' for a, b, c in zip(first, middle, last)],
+        'hora': [f'{m // 60:02d}:{m % 60:02d}' for m in minutes],
+        'telefone': sample_report_phones(rows, seed=seed),
+        'prontuario': rng.integers(1, 999_999, size=rows).astype(str).tolist(),
+        'medico': rng.choice(DOCTORS, size=rows).tolist(),
+        'convenio': rng.choice(INSURERS, size=rows).tolist(),
+        'evento': rng.choice(EVENTS, size=rows).tolist(),
+        'terapia': rng.choice(THERAPIES, size=rows).tolist(),
+        'dia': (rng.integers(0, 5, size=rows) + 16).tolist(),
+    }
+
+def _encode_csv(rows):
+    """Escreve as linhas como o SIMAH exporta: CSV em latin1 com CRLF."""
+    output = io.StringIO()
+    csv.writer(output, lineterminator='\r\n').writerows(rows)
+    return output.getvalue().encode('latin1')
+
+def consultas_report(appointments, seed=42):
+    """Relatório de Consultas: 'Data:' abre cada agenda e as demais linhas começam com 'Página :'."""
+    data = sample_appointments(appointments, seed)
+    rows = [['SIMAH - Sistema de Gestão Hospitalar'], ['Relatório de Agendamentos'], []]
+    page = 1
+    for i in range(appointments):
+        appointment = [
+            data['hora'][i], data['medico'][i], data['convenio'][i], data['evento'][i],
+            data['paciente'][i], data['telefone'][i], data['prontuario'][i],
+        ]
+        if i % ROWS_PER_AGENDA == 0:
+            date = f"{data['dia'][i]:02d}/03/2026"
+            specialty = SPECIALTIES[(i // ROWS_PER_AGENDA) % len(SPECIALTIES)]
+            rows.append(['Data:', date, 'Especialidade: ', specialty, ''] + appointment)
+        else:
+            rows.append([f'Página : {page}', ''] + appointment)
+        if i % ROWS_PER_PAGE == ROWS_PER_PAGE - 1:
+            page += 1
+            rows += [[], ['Emitido em 15/03/2026', '', f'Página {page - 1}'], ['Hora', 'Médico', 'Convênio', 'Evento', 'Paciente', 'Fone', 'Pront.']]
+    return _encode_csv(rows)
+
+def servicos_report(appointments, seed=42):
+    """Relatório de Serviços (Acupuntura/RPG): cabeçalho 'Agenda de:'/'Médico:' e 'Data:' por agenda."""
+    data = sample_appointments(appointments, seed)
+    rows = [['SIMAH - Sistema de Gestão Hospitalar'], []]
+    for i in range(appointments):
+        if i % ROWS_PER_AGENDA == 0:
+            if i:
+                rows.append(['Sub - Total', str(ROWS_PER_AGENDA)])
+            service = SERVICES[(i // ROWS_PER_AGENDA) % len(SERVICES)]
+            rows.append(['Agenda de:', service, '', 'Médico:', data['medico'][i]])
+            rows.append(['Data:', f"{data['dia'][i]:02d}/04/2026"])
+            rows.append(['', 'Hora', '', 'Paciente', '', 'Evento', 'Fone', 'Pront.', 'Convênio'])
+        rows.append([
+            '', data['hora'][i], '', data['paciente'][i], '', data['evento'][i],
+            data['telefone'][i], data['prontuario'][i], data['convenio'][i],
+        ])
+    rows.append(['Sub - Total', str(appointments % ROWS_PER_AGENDA or ROWS_PER_AGENDA)])
+    return _encode_csv(rows)
+
+def autorizacao_report(appointments, seed=42):
+    """Planilha de autorizações liberadas: título, cabeçalho na 3ª linha e colunas extras."""
+    data = sample_appointments(appointments, seed)
+    rng = np.random.default_rng(seed + 1)
+    # Parte dos telefones chega como número (célula numérica do Excel)
+    numeric_phone = rng.random(appointments) < 0.3
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Autorizações')
+    sheet.append(['AUTORIZAÇÕES LIBERADAS'])
+    sheet.append([])
+    sheet.append(['GUIA', 'CONVÊNIO', 'PACIENTE', 'TELEFONE', 'TERAPIA ', 'SESSÕES', 'STATUS'])
+    for i in range(appointments):
+        phone = data['telefone'][i]
+        digits = ''.join(c for c in phone if c.isdigit())
+        if numeric_phone[i] and digits:
+            phone = float(digits)
+        name = data['paciente'][i].lower() if i % 7 == 0 else data['paciente'][i]
+        sheet.append([i + 1, data['convenio'][i], name, phone or None, data['terapia'][i], 10, 'LIBERADA'])
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+GENERATORS = {
+    'consultas': consultas_report,
+    'servicos': servicos_report,
+    'autorizacao': autorizacao_report,
+}
+
+def generate_report(layout_name, appointments, seed=42):
+    """Retorna os bytes de uma exportação sintética do layout com 'appointments' agendamentos."""
+    return GENERATORS[layout_name](appointments, seed)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in GENERATORS:
+        sys.exit(f"Uso: python {sys.argv[0]} <{'|'.join(GENERATORS)}> <agendamentos> <arquivo_de_saida>")
+    with open(sys.argv[3], 'wb') as f:
+        f.write(generate_report(sys.argv[1], int(sys.argv[2])))
@@ -1,4 +1,8 @@
-import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import get_client
 
 url = "https://dev-chatwoot.vldzc8.easypanel.host/api/v1/accounts/2/conversations/10/labels"
 
@@ -8,6 +12,6 @@ headers = {
     "Content-Type": "application/json"
 }
 
-response = requests.post(url, json=payload, headers=headers)
+response = get_client().post(url, json=payload, headers=headers)
 
 print(response.json())
\ No newline at end of file
@@ -0,0 +1,50 @@
+# session_frames.py
+import pandas as pd
+
+# --- REPRESENTAÇÃO COMPACTA DAS CARGAS NA SESSÃO ---
+# Cada operador logado mantém as cargas processadas em st.session_state. Médicos,
+# datas, horários, terapias e convênios se repetem milhares de vezes; guardados
+# como categoria, cada célula vira um código inteiro (int8/int16) apontando para
+# uma única cópia do texto. Colunas de texto quase únicas (nomes, telefones) vão
+# para arrays de string do Arrow, sem um objeto Python por célula. As tabelas só
+# voltam a 'object' nas bordas: montagem do payload e reaproveitamento da carga.
+
+# Colunas com até esta proporção de valores distintos viram categoria
+CATEGORY_MAX_RATIO = 0.5
+ARROW_STRING = "string[pyarrow]"
+
+
+def compact_frame(df):
+    """Cópia de df com colunas de texto em categoria ou string do Arrow (índice e demais colunas intactos)."""
+    if df is None or df.empty:
+        return df
+    converted = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object:
+            continue
+        if values.nunique(dropna=False) <= len(values) * CATEGORY_MAX_RATIO:
+            converted[column] = values.astype('category')
+        elif values.notna().all() and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+            # Só colunas sem vazios: a volta para 'object' devolve exatamente os mesmos valores
+            converted[column] = values.astype(ARROW_STRING)
+    return df.assign(**converted) if converted else df
+
+def expand_frame(df):
+    """Cópia de df com as colunas compactadas de volta a 'object', como saíram do processamento."""
+    if df is None or df.empty:
+        return df
+    converted = {
+        column: df[column].astype(object)
+        for column in df.columns
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or df[column].dtype == ARROW_STRING
+    }
+    return df.assign(**converted) if converted else df
+
+
+# --- COLUNAS COMO TEXTO ---
+def text_column(df, column):
+    """Coluna como texto sem espaços nas pontas ('' nos nulos e quando a coluna não existe)."""
+    if column not in df:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[column].fillna('').astype(str).str.strip()
@@ -0,0 +1,135 @@
+# upload_cache.py
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+# --- CACHE DE UPLOADS PROCESSADOS ---
+# Cada upload processado é guardado em disco, em uma pasta identificada pelo hash
+# do conteúdo do arquivo + layout usado na leitura. O mesmo arquivo enviado de novo
+# (refresh do navegador, troca do tipo de arquivo e volta, outro operador) é
+# recuperado sem reprocessar. Os DataFrames ficam em Parquet e as estatísticas em JSON.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("COFRAT_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "uploads"))
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+MAX_ENTRY_AGE = 7 * 24 * 60 * 60  # segundos
+
+# Alterar quando o processamento mudar, para invalidar resultados antigos
+CACHE_VERSION = "9"
+
+FRAME_NAMES = ("good", "bad", "repeated")
+STATS_FILE = "stats.json"
+STAGING_PREFIX = ".tmp-"
+STAGING_MAX_AGE = 60 * 60  # pastas temporárias abandonadas por processos interrompidos
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_upload(uploaded_file, block_size=HASH_BLOCK_SIZE):
+    """Calcula o SHA-256 do upload lendo em blocos, sem copiar o arquivo inteiro."""
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    while True:
+        block = uploaded_file.read(block_size)
+        if not block:
+            break
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    Cache em disco, compartilhado entre sessões, dos resultados de processamento
+    (good_df, bad_df, repeated_df, stats). A remoção segue LRU: entradas mais
+    antigas que max_age saem primeiro e, se o total passar de max_bytes, as menos
+    usadas recentemente são removidas até caber.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, max_age=MAX_ENTRY_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key_for(self, uploaded_file, layout_name):
+        """Chave do upload: hash do conteúdo + layout + versão do processamento."""
+        content_hash = hash_upload(uploaded_file)
+        return hashlib.sha256(f"{content_hash}:{layout_name}:{CACHE_VERSION}".encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Retorna (good_df, bad_df, repeated_df, stats) ou None se não estiver no cache."""
+        path = self._entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            frames = [pd.read_parquet(os.path.join(path, f"{name}.parquet")) for name in FRAME_NAMES]
+            with open(os.path.join(path, STATS_FILE), encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            # Entrada incompleta ou corrompida: descarta e trata como ausente
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # Marca o uso para a política LRU
+        os.utime(path)
+        return (*frames, stats)
+
+    def put(self, key, result):
+        """Guarda o resultado do processamento e aplica a política de remoção."""
+        *frames, stats = result
+        # Uploads sem dados não são guardados: o usuário provavelmente trocou o arquivo
+        if frames[0].empty and frames[1].empty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=self.cache_dir)
+        try:
+            for name, df in zip(FRAME_NAMES, frames):
+                df.to_parquet(os.path.join(staging, f"{name}.parquet"))
+            with open(os.path.join(staging, STATS_FILE), "w", encoding="utf-8") as f:
+                json.dump({k: int(v) for k, v in stats.items()}, f)
+            # A troca de nome é atômica: outra sessão nunca vê uma entrada pela metade
+            os.replace(staging, self._entry_path(key))
+        except OSError:
+            # Outra sessão gravou a mesma chave primeiro (ou o disco falhou)
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def _entries(self):
+        """Lista (caminho, último uso, tamanho em bytes, é temporária) de cada pasta do cache."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((path, os.stat(path).st_mtime, size, name.startswith(STAGING_PREFIX)))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Remove entradas expiradas e, depois, as menos usadas até respeitar max_bytes."""
+        now = time.time()
+        entries = []
+        for path, last_used, size, is_staging in self._entries():
+            if is_staging:
+                if now - last_used > STAGING_MAX_AGE:
+                    shutil.rmtree(path, ignore_errors=True)
+            elif now - last_used > self.max_age:
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                entries.append((path, last_used, size))
+
+        total = sum(size for _, _, size in entries)
+        for path, _, size in sorted(entries, key=lambda entry: entry[1]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -4,9 +4,20 @@ import streamlit_antd_components as sac
 import pandas as pd
 import requests
 import base64
-import csv
-import re
-import io
+import sqlite3
+from batch import create_process_pool, process_uploads
+from ingestion import LAYOUTS, is_test_row
+from dispatch_ledger import SENT_COLUMN, DispatchLedger
+from patient_index import PatientIndex
+from quality_rules import REASON_COLUMN, apply_quality_rules
+from session_frames import compact_frame, expand_frame
+from exports import EXPORT_FORMATS, archive_batch, export_files
+from dispatcher import CHUNK_OK, LOAD_ONLY_COLUMNS
+from dispatch_jobs import JOB_CANCELLED, JOB_DONE, JOB_INTERRUPTED, JOB_QUEUED, DispatchJobStore
+from dispatch_worker import DispatchWorker
+from message_templates import load_templates
+from upload_cache import UploadCache
+from http_client import HttpClient
 
 # --- FUNÇÃO PARA CARREGAR IMAGEM ---
 def load_image_as_base64(image_path):
@@ -83,353 +94,180 @@ def login_form(logo_path):
                 except Exception:
                     st.error("Arquivo de segredos (secrets.toml) não encontrado ou mal configurado.")
 
-# --- PÁGINA DE CONFIRMAÇÃO DE AGENDAMENTOS (CONTEÚDO COMPLETO) ---
-def confirmation_page():
-    # As funções de ajuda do Colab foram movidas para cá
-    def adjust_phone_number(phone_number):
-        """Ajusta o número de telefone para o formato com código do país (55) e DDD."""
-        digits_only = re.sub(r'\D', '', str(phone_number))
-        if len(digits_only) > 10:
-            if not digits_only.startswith('55'):
-                return '55' + digits_only
-            return digits_only
-        elif len(digits_only) == 10:
-            return '55' + digits_only
-        elif len(digits_only) >= 8:
-            return '5511' + digits_only
-        else:
-            return '' # Retorna vazio se o número for inválido
-
-    def adjust_time(time_str):
-        """Ajusta a string de horário para o formato HH:MM e arredonda para baixo a cada 10 minutos."""
-        if pd.isna(time_str):
-            return time_str
-        try:
-            time_obj = pd.to_datetime(time_str, format='%H:%M').time()
-            full_datetime = pd.to_datetime(f"1970-01-01 {time_obj}")
-            rounded_time = full_datetime.floor('10min')
-            return rounded_time.strftime('%H:%M')
-        except (ValueError, TypeError):
-            return time_str
-
-    def process_and_clean_csv(uploaded_file, file_type):
-        """
-        Lê um arquivo CSV, processa os dados com base no TIPO DE ARQUIVO, calcula estatísticas, 
-        separa registros bons, ruins e repetidos (por nome), e retorna DataFrames e estatísticas.
-        """
-        file_content = uploaded_file.getvalue().decode('latin1')
-        csv_file = io.StringIO(file_content)
-
-        columns =[
-            'Data', 'Especialidade', 'Hora', 'Medico', 'Convenio',
-            'Evento', 'Paciente', 'Telefone', 'Prontuario'
-        ]
-        processed_rows =[]
-        time_regex = re.compile(r'^\d{2}:\d{2}$')
-        
-        reader = csv.reader(csv_file)
-
-        # --- LÓGICA DE EXTRAÇÃO BASEADA NO TIPO DE ARQUIVO ---
-        
-        if file_type in ["Confirmação de Consultas", "Cancelamento de Consultas"]:
-            # Lógica Original para Consultas
-            current_date = None
-            current_specialty = None
-            
-            for row in reader:
-                if not row: continue
-                if row[0] == 'Data:' and 'Especialidade: ' in row:
-                    current_date, current_specialty = row[1], row[3]
-                    try:
-                        start_index = next(i for i, field in enumerate(row) if time_regex.match(field))
-                        data_fields = row[start_index:]
-                        # Estrutura Consultas: Data, Esp, Hora, Medico, Convenio, Evento, Paciente, Tel, Pront
-                        processed_rows.append([current_date, current_specialty] + data_fields[:7])
-                    except StopIteration: continue
-                elif 'Página :' in row[0]:
-                    try:
-                        start_index = next(i for i, field in enumerate(row) if time_regex.match(field))
-                        data_fields = row[start_index:]
-                        processed_rows.append([current_date, current_specialty] + data_fields[:7])
-                    except StopIteration: continue
-
-        elif file_type in ["Confirmação de Acupuntura", "Confirmação de RPG", "Cancelamento de Acupuntura"]:
-            # Nova Lógica para Acupuntura e RPG (Layout de Serviços)
-            current_date = None
-            current_specialty = None
-            current_doctor = None
-
-            for row in reader:
-                if not row: continue
-
-                # 1. Captura de Contexto: Médico e Especialidade
-                if 'Médico:' in row:
-                    try:
-                        if 'Agenda de:' in row:
-                            spec_index = row.index('Agenda de:') + 1
-                            current_specialty = row[spec_index]
-                        
-                        doc_index = row.index('Médico:') + 1
-                        current_doctor = row[doc_index]
-                    except (ValueError, IndexError):
-                        pass
-                
-                # 2. Captura de Contexto: Data
-                if len(row) > 1 and row[0] == 'Data:':
-                    current_date = row[1]
-                
-                # 3. Extração dos Dados do Paciente
-                try:
-                    start_index = next(i for i, field in enumerate(row) if time_regex.match(field))
-                    data_fields = row[start_index:]
-                    
-                    # Mapeamento Acupuntura/RPG:
-                    # [0] Hora, [2] Paciente, [4] Evento, [5] Fone, [6] Pront, [7] Convenio
-                    if len(data_fields) >= 8:
-                        new_row =[
-                            current_date,       # Data
-                            current_specialty,  # Especialidade
-                            data_fields[0],     # Hora
-                            current_doctor,     # Medico (do cabeçalho)
-                            data_fields[7],     # Convenio
-                            data_fields[4],     # Evento
-                            data_fields[2],     # Paciente
-                            data_fields[5],     # Telefone
-                            data_fields[6]      # Prontuario
-                        ]
-                        processed_rows.append(new_row)
-                except StopIteration:
-                    continue
-
-        # --- FIM DA LÓGICA DE EXTRAÇÃO ---
-
-        df = pd.DataFrame(processed_rows, columns=columns)
-        if df.empty:
-            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}
-
-        # --- TRATAMENTO DE DADOS (COMUM A TODOS) ---
-        df['Número de Telefone Ajustado'] = df['Telefone'].apply(adjust_phone_number)
-        df['Horario'] = df['Hora'].apply(adjust_time)
-        
-        # Converte data para string formatada (garante consistência)
-        df['Data'] = pd.to_datetime(df['Data'], dayfirst=True, errors='coerce').dt.strftime('%d/%m/%Y')
-
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('ú', 'u').str.replace('é', 'e').str.replace('ç', 'c').str.replace('ã', 'a')
-        df.rename(columns={
-            'paciente': 'nome_do_paciente', 'medico': 'nome_do_medico',
-            'horario': 'horario_ajustado', 'numero_de_telefone_ajustado': 'telefone_ajustado'
-        }, inplace=True)
-
-        # Estatísticas gerais
-        total_records = len(df)
-        phone_counts = df['telefone_ajustado'].value_counts()
-        unique_appointments = len(phone_counts[phone_counts.index != ''])
-        
-        patient_name_counts = df['nome_do_paciente'].value_counts()
-        repeated_appointments = len(patient_name_counts[patient_name_counts > 1])
+# --- CACHE DE UPLOADS (COMPARTILHADO ENTRE SESSÕES) ---
+@st.cache_resource
+def get_upload_cache():
+    """Instância única do cache de uploads processados para todo o servidor."""
+    return UploadCache()
+
+@st.cache_resource
+def get_patient_index():
+    """Índice de identidade de pacientes, compartilhado entre sessões e uploads."""
+    return PatientIndex()
+
+@st.cache_resource
+def get_dispatch_ledger():
+    """Registro dos contatos já enviados, compartilhado entre sessões."""
+    return DispatchLedger()
+
+@st.cache_resource
+def get_dispatch_jobs():
+    """Jobs de disparo persistidos (retomáveis), compartilhados entre sessões."""
+    return DispatchJobStore()
+
+@st.cache_resource
+def get_http_client():
+    """Cliente HTTP (conexões reaproveitadas por host) de todas as integrações, compartilhado entre sessões."""
+    return HttpClient()
+
+@st.cache_resource
+def get_dispatch_worker():
+    """Worker que envia os jobs em segundo plano, independente das sessões."""
+    try:
+        ledger = get_dispatch_ledger()
+    except sqlite3.Error:
+        ledger = None  # o envio segue sem registro; as chaves de idempotência evitam duplicatas
+    return DispatchWorker(get_dispatch_jobs(), ledger, client=get_http_client())
+
+@st.cache_resource
+def get_process_pool():
+    """Pool de processos (um por núcleo) para processar vários arquivos em paralelo."""
+    return create_process_pool()
+
+# --- NOVA VERSÃO DO MESMO RELATÓRIO ---
+def carry_over_selection(good_df, previous_df, dispatched_ids):
+    """
+    Copia a seleção da carga anterior para a nova (linhas casadas pela impressão
+    digital do índice). Linhas já enviadas ficam desmarcadas. Altera good_df e
+    retorna o resumo das mudanças.
+    """
+    previously_selected = previous_df.index[previous_df['Selecionar'].astype(bool)]
+    is_dispatched = good_df.index.isin(list(dispatched_ids))
+    good_df['Selecionar'] = good_df.index.isin(previously_selected) & ~is_dispatched
+    return {
+        'changed': good_df[~good_df.index.isin(previous_df.index)],
+        'removed': previous_df.index[~previous_df.index.isin(good_df.index)],
+        'kept_selected': int(good_df['Selecionar'].sum()),
+        'dispatched': int(is_dispatched.sum()),
+    }
+
+# --- PRÉ-VISUALIZAÇÃO DAS MENSAGENS ---
+# Linhas mostradas na pré-visualização (a renderização é em bloco, mas a tabela não precisa da carga toda)
+PREVIEW_ROWS = 500
+
+def show_message_preview(selected_df):
+    """Texto final de cada contato selecionado com o modelo de mensagem escolhido."""
+    try:
+        templates = load_templates()
+    except (OSError, ValueError) as e:
+        st.warning(f"Modelos de mensagem indisponíveis: {e}")
+        return
+    if not templates:
+        st.caption("Nenhum modelo de mensagem cadastrado.")
+        return
+    area = st.selectbox("Modelo de mensagem (área)", options=list(templates))
+    if selected_df.empty:
+        st.caption("Selecione pacientes para ver as mensagens.")
+        return
+    preview_df = expand_frame(selected_df.head(PREVIEW_ROWS))
+    messages = templates[area].render(preview_df)
+    if len(selected_df) > PREVIEW_ROWS:
+        st.caption(f"Mostrando os primeiros {PREVIEW_ROWS} de {len(selected_df)} contatos selecionados.")
+    st.dataframe(
+        pd.DataFrame({
+            'Paciente': preview_df['nome_do_paciente'],
+            'Telefone': preview_df['telefone_ajustado'],
+            'Mensagem': messages,
+        }),
+        use_container_width=True, hide_index=True,
+    )
+    position = st.selectbox(
+        "Texto completo", options=range(len(preview_df)),
+        format_func=lambda i: f"{preview_df['nome_do_paciente'].iloc[i]} · {preview_df['telefone_ajustado'].iloc[i]}",
+    )
+    st.text(messages.iloc[position])
+
+# --- ENVIOS EM SEGUNDO PLANO ---
+# Intervalo (segundos) em que a página consulta o progresso dos envios em andamento
+DISPATCH_POLL_SECONDS = 2
+FINISHED_JOB_STATUSES = (JOB_DONE, JOB_INTERRUPTED, JOB_CANCELLED)
+
+def queue_dispatch_job(job_id):
+    """Entrega o job ao worker de disparo e passa a acompanhá-lo nesta sessão."""
+    if not get_dispatch_worker().submit(job_id):
+        st.warning("Este envio já está em andamento em outra sessão (ou foi concluído/descartado).")
+        return
+    if job_id not in st.session_state.dispatch_jobs:
+        st.session_state.dispatch_jobs.append(job_id)
+    st.session_state.dispatch_applied.discard(job_id)  # retomado: as linhas enviadas serão marcadas de novo no fim
+
+def mark_sent_rows(job_id):
+    """Marca como enviadas (e desmarca da seleção futura) as linhas da carga atual que o job enviou."""
+    if st.session_state.edited_df is None:
+        return
+    sent_ids = st.session_state.edited_df.index.intersection(get_dispatch_jobs().sent_row_ids(job_id))
+    st.session_state.dispatched_ids.update(sent_ids)
+    st.session_state.edited_df.loc[sent_ids, SENT_COLUMN] = True
+    st.session_state.edited_df.loc[sent_ids, 'Selecionar'] = False
+
+def show_job_result(job_id, job):
+    """Resultado de um envio encerrado, com o estado de cada lote."""
+    if job.status == JOB_CANCELLED:
+        st.info(f"Envio descartado: {job.enviados} de {job.total} contatos enviados.")
+        return
+    chunk_results = get_dispatch_jobs().chunk_results(job_id)
+    failed_chunks = chunk_results[chunk_results['status'] != CHUNK_OK]
+    if failed_chunks.empty:
+        st.success(f"✅ Sucesso! Automação acionada para {job.total} contatos.")
+    elif job.enviados == 0:
+        st.error(f"❌ Falha ao enviar: {failed_chunks['erro'].iloc[0]}")
+    else:
+        st.warning(
+            f"Envio parcial: {job.enviados} de {job.total} contatos enviados. "
+            "O envio pode ser retomado em \"Envios interrompidos\"; só os lotes com falha serão reenviados."
+        )
+    if len(chunk_results) > 1 or not failed_chunks.empty:
+        with st.expander("Resultado por lote", expanded=not failed_chunks.empty):
+            st.dataframe(chunk_results.drop(columns=['inicio', 'fim']), use_container_width=True, hide_index=True)
 
-        # Critérios e contagem de qualidade de dados
-        is_phone_empty = df['telefone_ajustado'] == ''
-        is_phone_length_wrong = (~is_phone_empty) & (df['telefone_ajustado'].str.len() != 13)
-        
-        bad_data_mask = is_phone_empty | is_phone_length_wrong
-        
-        stats = {
-            'total': total_records,
-            'unique': unique_appointments,
-            'repeated': repeated_appointments,
-            'bad_total': bad_data_mask.sum(),
-            'bad_empty': is_phone_empty.sum(),
-            'bad_length': is_phone_length_wrong.sum()
-        }
-
-        df_bad = df[bad_data_mask]
-        df_good = df[~bad_data_mask]
-
-        # Adicionar registros estáticos ao DataFrame de dados bons
-        static_data =[
-            {'data': '15/02/2026', 'horario_ajustado': '13:10', 'nome_do_paciente': 'BRANDON AGUIAR', 'nome_do_medico': 'LEANDRO TETSUO OKAMURA', 'telefone': '(11) 95904 4561', 'telefone_ajustado': '5511959044561'},
-            {'data': '20/03/2026', 'horario_ajustado': '08:40', 'nome_do_paciente': 'KARINE COFRAT', 'nome_do_medico': 'LEANDRO TETSUO OKAMURA', 'telefone': '(11) 97140-2433', 'telefone_ajustado': '5511971402433'}
-        ]
-        df_static = pd.DataFrame(static_data)
-        df_good = pd.concat([df_static, df_good], ignore_index=True)
-
-        # Identificar pacientes com múltiplos agendamentos pelo NOME
-        good_name_counts = df_good['nome_do_paciente'].value_counts()
-        repeated_names = good_name_counts[good_name_counts > 1].index
-        df_repeated = df_good[df_good['nome_do_paciente'].isin(repeated_names)].sort_values(by=['nome_do_paciente', 'data', 'horario_ajustado'])
-
-        final_columns_order =[
-            'data', 'horario_ajustado', 'nome_do_paciente',
-            'nome_do_medico', 'telefone', 'telefone_ajustado'
-        ]
-        
-        # Garante que todos os dataframes tenham as colunas na ordem correta
-        available_cols =[c for c in final_columns_order if c in df_good.columns]
-        
-        df_good_final = df_good[available_cols]
-        df_bad_final = df_bad[available_cols] if not df_bad.empty else pd.DataFrame(columns=available_cols)
-        df_repeated_final = df_repeated[available_cols] if not df_repeated.empty else pd.DataFrame(columns=available_cols)
-
-        return df_good_final, df_bad_final, df_repeated_final, stats
-
-    def process_and_clean_autorizacao(uploaded_file):
-        """
-        Lê um arquivo Excel, processa os dados para 'Autorização liberada'.
-        Aplica a transformação de telefone, padronização de terapia e 
-        extração do primeiro nome do paciente (Capitalizado).
-        Adiciona registros estáticos de teste no topo da lista.
-        """
-        try:
-            # Lê o arquivo Excel
-            df = pd.read_excel(uploaded_file)
-        except Exception as e:
-            st.error(f"Erro ao ler o arquivo Excel: {e}")
-            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}
-
-        # Tenta identificar a coluna de nome do paciente dinamicamente
-        name_col = None
-        for col in df.columns:
-            if str(col).strip().upper() in['PACIENTE', 'NOME', 'NOME DO PACIENTE', 'NOME_DO_PACIENTE']:
-                name_col = col
-                break
-
-        # Verifica se as colunas esperadas existem no arquivo
-        if 'TELEFONE' not in df.columns or 'TERAPIA ' not in df.columns or not name_col:
-            st.error("O arquivo Excel não contém as colunas 'TELEFONE', 'TERAPIA ' e/ou a coluna de paciente ('PACIENTE' ou 'NOME').")
-            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}
-
-        # =====================================================================
-        # TRANSFORMAÇÃO MANUAL (CLEAN & TRANSFORM)
-        # =====================================================================
-        
-        # Isola as colunas de interesse e remove valores nulos
-        df_reduzido = df[['TELEFONE', 'TERAPIA ', name_col]].copy()
-        df_reduzido = df_reduzido.dropna(subset=['TELEFONE', 'TERAPIA ', name_col])
-
-        # Função de formatação de telefone adaptada para o pipeline
-        def format_phone_number(phone_number):
-            if pd.isna(phone_number) or str(phone_number).strip() == '':
-                return ''
-            phone_str = str(phone_number).strip()
-            if phone_str.endswith('.0'):
-                phone_str = phone_str[:-2]
-            cleaned_number = phone_str.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-            # Remove o prefixo + se existir para facilitar a análise
-            prefix = ''
-            if cleaned_number.startswith('+'):
-                prefix = '+'
-                cleaned_number = cleaned_number[1:]
-            # Remove o prefixo 55 se existir para facilitar a análise
-            if cleaned_number.startswith('55'):
-                cleaned_number = cleaned_number[2:]
-                prefix = '+55'
-            # Verifica se já tem DDD válido (11 ou 19)
-            if cleaned_number.startswith('11') or cleaned_number.startswith('19'):
-                return prefix + '55' + cleaned_number
-            # Se não tem DDD, adiciona 11p
-            if len(cleaned_number) == 9:  # Ex: 959044561
-                return prefix + '5511' + cleaned_number
-            # Se tem outro formato, retorna com +55
-            return prefix + '55' + cleaned_number
-
-        # Função de padronização do nome da terapia
-        def standardize_therapy_name(therapy_name):
-            if pd.isna(therapy_name) or str(therapy_name).strip() == '':
-                return ''
-                
-            # CORREÇÃO: Remove os dois pontos (:) e espaços extras antes de validar
-            therapy_name = str(therapy_name).replace(':', '').strip().upper()
-            
-            if therapy_name == 'ACUPUNTURA':
-                return 'Acupuntura'
-            elif therapy_name == 'FISIO/ACUP':
-                return 'Fisioterapia, Acupuntura'
-            elif therapy_name == 'FISIOTERAPIA':
-                return 'Fisioterapia'
-            else:
-                return therapy_name.title()
-
-        # NOVA FUNÇÃO: Extrair e formatar o nome completo (capitalizado)
-        def format_full_name(full_name):
-            if pd.isna(full_name) or str(full_name).strip() == '':
-                return ''
-            # Remove espaços extras, transforma em minúsculo e capitaliza cada parte
-            name_parts = str(full_name).strip().split()
-            return ' '.join([part.capitalize() for part in name_parts])
-
-        # Aplica as transformações criando as colunas que o sistema espera
-        df_reduzido['telefone'] = df_reduzido['TELEFONE']
-        df_reduzido['telefone_ajustado'] = df_reduzido['TELEFONE'].apply(format_phone_number)
-        df_reduzido['terapia'] = df_reduzido['TERAPIA '].apply(standardize_therapy_name)
-        df_reduzido['nome_do_paciente'] = df_reduzido[name_col].apply(format_full_name)
-
-        # =====================================================================
-        # FIM DA TRANSFORMAÇÃO MANUAL
-        # =====================================================================
-
-        # Para garantir que o código não quebre no restante do sistema (UI e Webhook),
-        # criamos as colunas esperadas preenchidas com vazio caso não existam:
-        expected_columns =[
-            'nome_do_paciente',
-            'telefone_ajustado', 'terapia'
-        ]
-        for col in expected_columns:
-            if col not in df_reduzido.columns:
-                df_reduzido[col] = ''
-
-        # Estatísticas gerais
-        total_records = len(df_reduzido)
-        
-        # Máscara de dados ruins (telefone vazio ou com tamanho inválido)
-        is_phone_empty = df_reduzido['telefone_ajustado'] == ''
-        # Considera ruim se tiver menos de 13 caracteres (ex: +551199999999 tem 14 caracteres)
-        is_phone_length_wrong = (~is_phone_empty) & (df_reduzido['telefone_ajustado'].str.len() < 13)
-        
-        bad_data_mask = is_phone_empty | is_phone_length_wrong
-        
-        df_bad = df_reduzido[bad_data_mask]
-        df_good = df_reduzido[~bad_data_mask]
-
-        # =====================================================================
-        # ADIÇÃO DOS REGISTROS ESTÁTICOS PARA TESTE
-        # =====================================================================
-        static_data =[
-            {'telefone': '(11) 95904-4561', 'telefone_ajustado': '+5511959044561', 'terapia': 'Acupuntura', 'nome_do_paciente': 'Brandon'},
-            {'telefone': '(11) 97140-2433', 'telefone_ajustado': '+5511971402433', 'terapia': 'Fisioterapia', 'nome_do_paciente': 'Karine'}
-        ]
-        df_static = pd.DataFrame(static_data)
-        
-        # Preenche as colunas faltantes no df_static com vazio para evitar NaN
-        for col in expected_columns:
-            if col not in df_static.columns:
-                df_static[col] = ''
-                
-        # Concatena os dados estáticos no topo dos dados bons
-        df_good = pd.concat([df_static, df_good], ignore_index=True)
-        # =====================================================================
-
-        stats = {
-            'total': total_records,
-            'unique': len(df_good['telefone_ajustado'].unique()) if not df_good.empty else 0,
-            'repeated': 0, # Não há validação de repetidos por nome neste layout
-            'bad_total': bad_data_mask.sum(),
-            'bad_empty': is_phone_empty.sum(),
-            'bad_length': is_phone_length_wrong.sum()
-        }
-
-        # DataFrame de repetidos (vazio por padrão para este fluxo)
-        df_repeated = pd.DataFrame(columns=expected_columns)
-
-        # Garantir a ordem das colunas para a interface
-        available_cols =[c for c in expected_columns if c in df_good.columns]
-        
-        df_good_final = df_good[available_cols]
-        df_bad_final = df_bad[available_cols] if not df_bad.empty else pd.DataFrame(columns=available_cols)
-        df_repeated_final = df_repeated[available_cols] if not df_repeated.empty else pd.DataFrame(columns=available_cols)
+def show_dispatch_progress():
+    """
+    Envios desta sessão: os encerrados mostram o resultado (e suas linhas são
+    marcadas como enviadas); os em andamento são acompanhados por um fragmento que
+    consulta o registro de progresso a cada DISPATCH_POLL_SECONDS, sem travar a página.
+    """
+    jobs = get_dispatch_jobs()
+    progress = jobs.progress(st.session_state.dispatch_jobs)
+    finished = progress['status'].isin(FINISHED_JOB_STATUSES)
+    for job_id in progress.loc[finished, 'job_id']:
+        if job_id not in st.session_state.dispatch_applied:
+            mark_sent_rows(job_id)
+            st.session_state.dispatch_applied.add(job_id)
+    running_ids = progress.loc[~finished, 'job_id'].tolist()
+
+    @st.fragment(run_every=DISPATCH_POLL_SECONDS if running_ids else None)
+    def running_jobs():
+        current = jobs.progress(running_ids)
+        if current['status'].isin(FINISHED_JOB_STATUSES).any():
+            st.rerun()  # a página inteira volta a ser montada com as linhas enviadas marcadas
+        for job in current.itertuples():
+            done = job.enviados + job.falhas
+            label = "Na fila" if job.status == JOB_QUEUED else f"{done} de {job.total} processados"
+            st.progress(
+                done / job.total if job.total else 1.0,
+                text=f"{label} · ✅ {job.enviados} enviados · ❌ {job.falhas} com falha · ⏳ {job.pendentes} pendentes",
+            )
 
-        return df_good_final, df_bad_final, df_repeated_final, stats
+    for job in progress[finished].itertuples():
+        show_job_result(job.job_id, job)
+    if running_ids:
+        running_jobs()
+    if finished.any() and st.button("Limpar envios encerrados", use_container_width=True):
+        st.session_state.dispatch_jobs = running_ids
+        st.rerun()
 
+# --- PÁGINA DE CONFIRMAÇÃO DE AGENDAMENTOS (CONTEÚDO COMPLETO) ---
+def confirmation_page():
     # --- Interface do Streamlit ---
 
     if 'edited_df' not in st.session_state:
@@ -442,6 +280,26 @@ def confirmation_page():
         st.session_state.stats = None
     if 'repeated_df' not in st.session_state:
         st.session_state.repeated_df = None
+    if 'layout_name' not in st.session_state:
+        st.session_state.layout_name = None
+    if 'file_stats' not in st.session_state:
+        st.session_state.file_stats = None
+    if 'previous_load' not in st.session_state:
+        st.session_state.previous_load = None
+    if 'reload_summary' not in st.session_state:
+        st.session_state.reload_summary = None
+    if 'dispatched_ids' not in st.session_state:
+        st.session_state.dispatched_ids = set()
+    if 'quality_counts' not in st.session_state:
+        st.session_state.quality_counts = None
+    if 'quality_warnings' not in st.session_state:
+        st.session_state.quality_warnings = None
+    if 'export_files' not in st.session_state:
+        st.session_state.export_files = None
+    if 'dispatch_jobs' not in st.session_state:
+        st.session_state.dispatch_jobs = []
+    if 'dispatch_applied' not in st.session_state:
+        st.session_state.dispatch_applied = set()
 
     st.title("Central de Disparos")
     st.caption("Clínica de Ortopedia e Terapia")
@@ -458,49 +316,150 @@ def confirmation_page():
     )
     # -------------------------------------------------------
 
-    # --- Uploader atualizado para aceitar Excel ---
-    uploaded_file = st.file_uploader("Selecione o arquivo (CSV ou Excel)", type=["csv", "xlsx", "xls"], key="csv_uploader")
+    # --- Uploader aceita vários arquivos (CSV ou Excel) de uma vez ---
+    uploaded_files = st.file_uploader("Selecione os arquivos (CSV ou Excel)", type=["csv", "xlsx", "xls"], accept_multiple_files=True, key="csv_uploader")
 
-    if uploaded_file is not None:
-        # Reseta o estado se mudar o arquivo OU o tipo de arquivo
-        current_file_key = f"{uploaded_file.name}_{file_type_option}"
+    if uploaded_files:
+        # Reseta o estado se mudar algum arquivo OU o tipo de arquivo
+        current_file_key = "|".join(f.name for f in uploaded_files) + f"_{file_type_option}"
         
         if current_file_key != st.session_state.uploaded_file_name:
+            # Guarda a carga atual: uma nova versão do mesmo relatório reaproveita linhas e seleção
+            if st.session_state.edited_df is not None and st.session_state.layout_name is not None:
+                st.session_state.previous_load = (
+                    st.session_state.layout_name,
+                    expand_frame(st.session_state.edited_df),
+                    expand_frame(st.session_state.bad_df),
+                )
+            st.session_state.reload_summary = None
             st.session_state.edited_df = None
             st.session_state.bad_df = None
             st.session_state.stats = None
             st.session_state.repeated_df = None
+            st.session_state.layout_name = None
+            st.session_state.file_stats = None
+            st.session_state.quality_counts = None
+            st.session_state.quality_warnings = None
+            st.session_state.export_files = None
             st.session_state.uploaded_file_name = current_file_key
         
-        if st.session_state.edited_df is None and st.button("⚙️ Processar Arquivo", use_container_width=True, type="primary"):
+        button_label = "⚙️ Processar Arquivo" if len(uploaded_files) == 1 else f"⚙️ Processar {len(uploaded_files)} Arquivos"
+        if st.session_state.edited_df is None and st.button(button_label, use_container_width=True, type="primary"):
             with st.spinner("Processando e analisando a qualidade dos dados..."):
                 try:
-                    # --- Direcionamento para a função correta ---
-                    if file_type_option == "Autorização liberada":
-                        good_df, bad_df, repeated_df, stats = process_and_clean_autorizacao(uploaded_file)
-                    else:
-                        good_df, bad_df, repeated_df, stats = process_and_clean_csv(uploaded_file, file_type_option)
+                    # Estatísticas parciais enquanto arquivos grandes ainda estão sendo lidos
+                    progress = st.empty()
+                    def show_progress(file_name, partial):
+                        progress.caption(
+                            f"{file_name}: {partial['total']:,} registros lidos · {partial['unique']:,} telefones únicos · "
+                            f"{partial['bad_total']:,} com problema".replace(',', '.')
+                        )
+
+                    # --- Cada arquivo é direcionado ao layout detectado e processado em paralelo ---
+                    good_df, bad_df, repeated_df, stats, file_stats = process_uploads(
+                        uploaded_files, file_type_option, cache=get_upload_cache(), pool=get_process_pool(),
+                        previous=st.session_state.previous_load, on_progress=show_progress
+                    )
+                    progress.empty()
                     
+                    for _, failed in file_stats[file_stats['erro'] != ''].iterrows():
+                        st.warning(f"O arquivo {failed['arquivo']} não foi processado: {failed['erro']}")
                     if good_df.empty and bad_df.empty:
                         st.warning("Nenhum dado foi encontrado. Verifique se selecionou o 'Tipo de Arquivo' correto.")
                     else:
+                        # Regras de qualidade: as que bloqueiam tiram a linha do envio, alertas só são exibidos
+                        layout_labels = {layout.label: name for name, layout in LAYOUTS.items()}
+                        detected = file_stats.loc[file_stats['erro'] == '', 'layout'].unique()
+                        good_df, bad_df, quality_warnings, quality_counts = apply_quality_rules(
+                            good_df, bad_df, layouts=[layout_labels[label] for label in detected]
+                        )
+                        # bad_empty e bad_length seguem os da leitura; só o total muda com as regras
+                        stats['bad_total'] = len(bad_df)
+
                         good_df.insert(0, 'Selecionar', False)
-                        st.session_state.edited_df = good_df
-                        st.session_state.bad_df = bad_df
-                        st.session_state.repeated_df = repeated_df
+                        # Nova versão do mesmo relatório: mantém a seleção e identifica o que mudou
+                        layout_name = layout_labels[detected[0]] if len(detected) == 1 else None
+                        previous_load = st.session_state.previous_load
+                        if previous_load is not None and previous_load[0] == layout_name:
+                            st.session_state.reload_summary = carry_over_selection(good_df, previous_load[1], st.session_state.dispatched_ids)
+                            st.session_state.reload_summary['changed'] = compact_frame(st.session_state.reload_summary['changed'])
+                        st.session_state.previous_load = None
+
+                        # Pacientes com múltiplos agendamentos na semana, considerando uploads anteriores
+                        try:
+                            patient_index = get_patient_index()
+                            if st.session_state.reload_summary is not None:
+                                patient_index.forget(st.session_state.reload_summary['removed'])
+                            patient_ids = patient_index.register(good_df.drop(columns='Selecionar'))
+                            if 'data' in good_df:
+                                repeated_df = patient_index.weekly_repeated(good_df, patient_ids)
+                                stats['repeated'] = repeated_df['id_paciente'].nunique()
+                        except sqlite3.Error as e:
+                            st.warning(f"Índice de pacientes indisponível; repetidos calculados só neste arquivo: {e}")
+
+                        # Contatos já enviados (em qualquer sessão) aparecem marcados e desmarcados para envio
+                        try:
+                            already_sent = get_dispatch_ledger().already_sent(good_df, file_type_option)
+                        except sqlite3.Error as e:
+                            already_sent = pd.Series(False, index=good_df.index)
+                            st.warning(f"Registro de disparos indisponível: {e}")
+                        # Os registros de teste podem ser enviados quantas vezes for preciso
+                        already_sent &= ~is_test_row(good_df.index)
+                        good_df.insert(1, SENT_COLUMN, already_sent)
+                        good_df['Selecionar'] &= ~already_sent
+
+                        # Na sessão as cargas ficam compactadas (categorias e strings do Arrow)
+                        st.session_state.edited_df = compact_frame(good_df)
+                        st.session_state.bad_df = compact_frame(bad_df)
+                        st.session_state.repeated_df = compact_frame(repeated_df)
                         st.session_state.stats = stats
-                        st.success("Arquivo processado!")
+                        st.session_state.file_stats = file_stats
+                        st.session_state.quality_counts = quality_counts
+                        st.session_state.quality_warnings = compact_frame(quality_warnings)
+                        # O layout só é exibido quando todos os arquivos têm o mesmo
+                        st.session_state.layout_name = layout_name
+
+                        # Arquivo da carga em Parquet, na pasta do dia, para as automações e análises
+                        try:
+                            archive_batch(
+                                {'validos': good_df, 'invalidos': bad_df, 'repetidos': repeated_df},
+                                {'layout': layout_name or 'misto', 'appointment_type': file_type_option},
+                            )
+                        except OSError as e:
+                            st.warning(f"Não foi possível arquivar a carga: {e}")
+                        st.success("Arquivo processado!" if len(uploaded_files) == 1 else "Arquivos processados!")
                         st.rerun()
                 except Exception as e:
                     st.error(f"Erro ao processar o arquivo: {e}")
 
     if st.session_state.edited_df is not None:
         st.header("Visão Geral dos Agendamentos")
+        detected_layout = LAYOUTS.get(st.session_state.layout_name)
+        if detected_layout is not None:
+            st.caption(f"Layout identificado no arquivo: **{detected_layout.label}**")
+            if file_type_option not in detected_layout.file_types:
+                st.info("O layout identificado é diferente do tipo selecionado. A leitura usou o layout detectado; confira o tipo antes de enviar.")
         col1, col2, col3 = st.columns(3)
         col1.metric("Total de Registros Carregados", st.session_state.stats.get('total', 0))
         col2.metric("Pacientes Únicos (por telefone)", st.session_state.stats.get('unique', 0))
         col3.metric("Pacientes com Múltiplos Agendamentos", st.session_state.stats.get('repeated', 0))
+
+        # Estatísticas de cada arquivo quando a carga tem mais de um
+        if st.session_state.file_stats is not None and len(st.session_state.file_stats) > 1:
+            with st.expander("Detalhes por arquivo"):
+                st.dataframe(st.session_state.file_stats, use_container_width=True, hide_index=True)
         
+        reload_summary = st.session_state.reload_summary
+        if reload_summary is not None:
+            st.info(
+                f"Nova versão do relatório: {len(reload_summary['changed'])} agendamentos novos ou alterados, "
+                f"{len(reload_summary['removed'])} removidos. {reload_summary['kept_selected']} seleções mantidas e "
+                f"{reload_summary['dispatched']} já enviados nesta sessão ficaram desmarcados."
+            )
+            if not reload_summary['changed'].empty:
+                with st.expander("Agendamentos novos ou alterados"):
+                    st.dataframe(reload_summary['changed'].drop(columns='Selecionar'), use_container_width=True, hide_index=True)
+
         st.header("Agendamentos Válidos para Envio")
         st.subheader("2. Selecione os Pacientes")
         
@@ -519,21 +478,23 @@ def confirmation_page():
             st.session_state.edited_df,
             use_container_width=True,
             hide_index=True,
-            disabled=st.session_state.edited_df.columns.drop('Selecionar')
+            disabled=st.session_state.edited_df.columns.drop('Selecionar'),
+            column_config={column: None for column in LOAD_ONLY_COLUMNS}
         )
         st.write("\n")
         # Botão para salvar seleção
         if st.button("Salvar seleção de pacientes", use_container_width=True, type="secondary"):
             st.session_state.edited_df = edited_df_output
+            st.session_state.export_files = None
             st.success("Seleção salva! Você pode agora enviar mensagens.")
 
         # --- SEÇÃO: TABELA DE PACIENTES COM MÚLTIPLOS AGENDAMENTOS ---
         if st.session_state.repeated_df is not None and not st.session_state.repeated_df.empty:
-            st.subheader("Pacientes com Múltiplos Agendamentos na Mesma Carga")
-            st.write("A tabela abaixo destaca os pacientes que possuem mais de um agendamento no arquivo carregado, para facilitar a verificação.")
+            st.subheader("Pacientes com Múltiplos Agendamentos na Semana")
+            st.write("A tabela abaixo destaca os pacientes que possuem mais de um agendamento na mesma semana, neste arquivo ou em uploads anteriores, para facilitar a verificação.")
             
             # Seleciona colunas relevantes para exibição
-            display_cols_repeated =['data', 'horario_ajustado', 'nome_do_paciente', 'nome_do_medico', 'telefone_ajustado']
+            display_cols_repeated =['data', 'horario_ajustado', 'nome_do_paciente', 'nome_do_medico', 'telefone_ajustado', 'carga', 'confianca']
             # Filtra colunas que realmente existem
             display_cols_repeated =[c for c in display_cols_repeated if c in st.session_state.repeated_df.columns]
             
@@ -547,7 +508,10 @@ def confirmation_page():
         st.divider()
 
         # Estatísticas de Qualidade e Tabela de Dados Ruins
-        if st.session_state.bad_df is not None and not st.session_state.bad_df.empty:
+        quality_warnings = st.session_state.quality_warnings
+        has_bad = st.session_state.bad_df is not None and not st.session_state.bad_df.empty
+        has_warnings = quality_warnings is not None and not quality_warnings.empty
+        if has_bad or has_warnings:
             st.subheader("Análise de Qualidade dos Dados")
             total_records = st.session_state.stats.get('total', 0)
             bad_records = st.session_state.stats.get('bad_total', 0)
@@ -557,41 +521,101 @@ def confirmation_page():
             col_dq1.metric("Total de Registros com Problemas", f"{bad_records}")
             col_dq2.metric("Percentual de Problemas", f"{percentage_bad:.2f}%")
 
-            col_dq3, col_dq4 = st.columns(2)
-            col_dq3.metric("Problema: Telefone Nulo/Vazio", f"{st.session_state.stats.get('bad_empty', 0)}")
-            col_dq4.metric("Problema: Comprimento Inválido", f"{st.session_state.stats.get('bad_length', 0)}")
-
-            st.write("Os registros abaixo foram removidos da lista de envio devido aos problemas de dados identificados.")
-            st.dataframe(st.session_state.bad_df, use_container_width=True, hide_index=True)
+            # Quantidade de registros por regra de qualidade
+            quality_counts = st.session_state.quality_counts
+            if quality_counts is not None:
+                st.dataframe(quality_counts[quality_counts['registros'] > 0], use_container_width=True, hide_index=True)
+
+            if has_bad:
+                st.write("Os registros abaixo foram removidos da lista de envio devido aos problemas de dados identificados.")
+                bad_columns = [REASON_COLUMN] + [c for c in st.session_state.bad_df.columns if c != REASON_COLUMN]
+                st.dataframe(st.session_state.bad_df[bad_columns], use_container_width=True, hide_index=True)
+            if has_warnings:
+                with st.expander(f"Agendamentos válidos com alertas ({len(quality_warnings)})"):
+                    warning_columns = [REASON_COLUMN] + [c for c in quality_warnings.columns if c != REASON_COLUMN]
+                    st.dataframe(quality_warnings[warning_columns], use_container_width=True, hide_index=True)
             st.divider()
 
+        # --- SEÇÃO: EXPORTAÇÃO DA CARGA ---
+        with st.expander("Exportar carga (válidos, inválidos e repetidos)"):
+            export_format = st.selectbox(
+                "Formato", options=list(EXPORT_FORMATS), format_func=EXPORT_FORMATS.get,
+                help="Parquet/Arrow para automações e análises; CSV ou Excel para a equipe.",
+            )
+            if st.button("Gerar arquivos", use_container_width=True):
+                with st.spinner("Gerando arquivos..."):
+                    sets = {
+                        'validos': expand_frame(st.session_state.edited_df),
+                        'invalidos': expand_frame(st.session_state.bad_df),
+                        'repetidos': expand_frame(st.session_state.repeated_df),
+                    }
+                    metadata = {'layout': st.session_state.layout_name or 'misto', 'appointment_type': file_type_option}
+                    st.session_state.export_files = (export_format, export_files(sets, export_format, metadata))
+            if st.session_state.export_files is not None and st.session_state.export_files[0] == export_format:
+                for file_name, data in st.session_state.export_files[1].items():
+                    st.download_button(f"⬇️ {file_name}", data=data, file_name=file_name, use_container_width=True, key=f"export_{file_name}")
+        # --- FIM DA SEÇÃO ---
+
         # --- ALTERAÇÃO AQUI: Removida a seleção de template ---
         st.subheader("3. Enviar Mensagens")
         st.write(f"O disparo será realizado considerando o tipo: **{file_type_option}**.")
         
+        with st.expander("Pré-visualizar mensagens"):
+            show_message_preview(st.session_state.edited_df[st.session_state.edited_df['Selecionar']])
+
         # Usa o DataFrame do session state (após salvar seleção)
         selected_count = int(st.session_state.edited_df['Selecionar'].sum())
         if st.button(f"✉️ Enviar Mensagens ({selected_count})", use_container_width=True, type="primary"):
-            if selected_count > 0:
-                selected_rows_df = st.session_state.edited_df[st.session_state.edited_df['Selecionar']].copy().fillna('')
-                contacts_payload = selected_rows_df.to_dict(orient='records')
-                final_payload = {
-                    "appointment_type": file_type_option,
-                    "contacts": contacts_payload
-                }
-                WEBHOOK_URL = "https://webhook.erudieto.com.br/webhook/disparo-em-massa"
-                with st.spinner(f"Enviando {len(contacts_payload)} mensagens..."):
-                    try:
-                        response = requests.post(WEBHOOK_URL, json=final_payload, timeout=30)
-                        if 200 <= response.status_code < 300:
-                            st.success(f"✅ Sucesso! Automação acionada para {len(contacts_payload)} contatos.")
-                        else:
-                            st.error(f"❌ Falha ao enviar: {response.status_code} - {response.text}")
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"❌ Erro de conexão: {e}")
-            else:
+            selected_rows_df = expand_frame(st.session_state.edited_df[st.session_state.edited_df['Selecionar']]).fillna('')
+            # Confere no registro logo antes do envio: outra sessão pode ter enviado nesse meio-tempo
+            try:
+                already_sent = get_dispatch_ledger().already_sent(selected_rows_df, file_type_option)
+            except sqlite3.Error as e:
+                already_sent = pd.Series(False, index=selected_rows_df.index)
+                st.warning(f"Registro de disparos indisponível; não foi possível conferir envios anteriores: {e}")
+            already_sent &= ~is_test_row(selected_rows_df.index)
+            if already_sent.any():
+                st.session_state.edited_df.loc[already_sent[already_sent].index, SENT_COLUMN] = True
+                st.session_state.edited_df.loc[already_sent[already_sent].index, 'Selecionar'] = False
+                st.info(f"{int(already_sent.sum())} contato(s) já enviado(s) com este tipo de disparo ficaram fora do envio.")
+                selected_rows_df = selected_rows_df[~already_sent]
+
+            if not selected_rows_df.empty:
+                contacts_payload = selected_rows_df.drop(columns=[SENT_COLUMN, *LOAD_ONLY_COLUMNS], errors='ignore').to_dict(orient='records')
+                # O envio vira um job persistido e segue em segundo plano; a página só acompanha
+                try:
+                    job_id = get_dispatch_jobs().create_job(contacts_payload, file_type_option, row_ids=selected_rows_df.index)
+                except sqlite3.Error as e:
+                    st.error(f"❌ Não foi possível registrar o envio: {e}")
+                else:
+                    queue_dispatch_job(job_id)
+            elif not already_sent.any():
                 st.warning("Nenhum paciente selecionado.")
         # ------------------------------------------------------
+
+    # Envios desta sessão (em andamento no worker ou já encerrados)
+    show_dispatch_progress()
+
+    # Jobs pendentes, interrompidos ou abandonados (de qualquer sessão) podem ser retomados
+    resumable = get_dispatch_jobs().resumable_jobs()
+    if not resumable.empty:
+        with st.expander(f"Envios interrompidos ({len(resumable)})"):
+            labels = {
+                row.job_id: (
+                    f"{pd.Timestamp.fromtimestamp(row.created_at):%d/%m %H:%M} · "
+                    f"{row.appointment_type} · {row.enviados} de {row.total} enviados"
+                )
+                for row in resumable.itertuples()
+            }
+            job_id = st.selectbox("Envio", options=list(labels), format_func=labels.get)
+            resume_col, cancel_col = st.columns(2)
+            if resume_col.button("▶️ Retomar envio", use_container_width=True):
+                queue_dispatch_job(job_id)
+                st.rerun()
+            if cancel_col.button("Descartar", use_container_width=True):
+                get_dispatch_jobs().cancel(job_id)
+                st.rerun()
+    # ------------------------------------------------------
                 
 # --- PÁGINA DE AUTOMAÇÕES (CONTEÚDO COMPLETO) ---
 def automations_page():
@@ -604,7 +628,7 @@ def automations_page():
         WEBHOOK_URL_CHATWOOT = "https://webhook.erudieto.com.br/webhook/mark-all-as-read"
         with st.spinner("Acionando o fluxo..."):
             try:
-                response = requests.post(WEBHOOK_URL_CHATWOOT, timeout=30)
+                response = get_http_client().post(WEBHOOK_URL_CHATWOOT)
                 if 200 <= response.status_code < 300:
                     st.success("✅ Fluxo acionado com sucesso!")
                 else:
@@ -612,6 +636,14 @@ def automations_page():
             except requests.exceptions.RequestException as e:
                 st.error(f"❌ Erro de conexão: {e}")
 
+    st.divider()
+    with st.expander("Latência das integrações"):
+        metrics = get_http_client().metrics()
+        if metrics.empty:
+            st.caption("Nenhuma requisição feita desde que o servidor iniciou.")
+        else:
+            st.dataframe(metrics, use_container_width=True, hide_index=True)
+
 # --- LÓGICA PRINCIPAL DO APLICATIVO COM MENU LATERAL ---
 def main_app(logo_path):
     """
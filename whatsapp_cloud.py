@@ -0,0 +1,266 @@
+# whatsapp_cloud.py
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from dispatcher import backoff_delay
+from http_client import HttpClient
+from local_store import BASE_DIR
+from message_templates import load_cached_csv, require_columns
+
+# --- ENVIO DIRETO PELA API DO WHATSAPP (CLOUD API) ---
+# Alternativa ao webhook do n8n: os contatos selecionados viram mensagens de
+# template enviadas direto ao endpoint /{phone_number_id}/messages da Graph API.
+# O envio é coordenado com asyncio: cada mensagem espera uma ficha do balde do
+# seu número remetente (limite de mensagens por segundo da Meta) e as requisições
+# saem pelo HttpClient (conexões reaproveitadas), em um pool de threads do
+# tamanho do número de mensagens em voo. Respostas de limite (429 ou códigos de
+# throughput da Meta) pausam o balde do número e a mensagem é repetida com espera
+# exponencial; demais erros 4xx não são repetidos.
+GRAPH_API_URL = os.environ.get("COFRAT_WHATSAPP_API_URL", "https://graph.facebook.com")
+GRAPH_API_VERSION = os.environ.get("COFRAT_WHATSAPP_API_VERSION", "v22.0")
+ACCESS_TOKEN = os.environ.get("COFRAT_WHATSAPP_TOKEN", "")
+PHONE_NUMBER_ID = os.environ.get("COFRAT_WHATSAPP_PHONE_NUMBER_ID", "")
+# A Meta libera 80 mensagens/s por número remetente por padrão; o balde fica um
+# pouco abaixo para que a variação de tempo na rede não ultrapasse o limite
+MESSAGES_PER_SECOND = float(os.environ.get("COFRAT_WHATSAPP_MPS", "72"))
+MAX_IN_FLIGHT = int(os.environ.get("COFRAT_WHATSAPP_CONCURRENCY", "32"))
+
+TEMPLATE_LANGUAGE = "pt_BR"
+REQUEST_TIMEOUT = (5, 30)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0   # segundos
+BACKOFF_MAX = 60.0   # segundos
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Códigos de erro da Graph API para limite de envio (número, par remetente/destinatário, conta, app)
+RATE_LIMIT_CODES = {4, 80007, 130429, 131056}
+
+MESSAGE_SENT = 'enviado'
+MESSAGE_FAILED = 'falhou'
+RESULT_COLUMNS = ['posicao', 'telefone', 'status', 'tentativas', 'http', 'message_id', 'erro', 'segundos']
+
+# Templates aprovados na Meta: arquivo CSV com as colunas appointment_type (tipo de
+# disparo), template (nome do template aprovado) e parameters (colunas do contato
+# separadas por espaço, na ordem das variáveis {{1}}, {{2}}... do corpo; use
+# primeiro_nome para o primeiro nome do paciente). Sem o arquivo, ou sem a linha do
+# tipo de disparo, o envio falha antes da primeira mensagem.
+TEMPLATES_PATH = os.environ.get("COFRAT_WHATSAPP_TEMPLATES", os.path.join(BASE_DIR, "data", "whatsapp_templates.csv"))
+TEMPLATE_COLUMNS = {'appointment_type', 'template', 'parameters'}
+
+
+def _read_templates(table):
+    require_columns(table, TEMPLATE_COLUMNS, 'de templates do WhatsApp')
+    return {
+        row.appointment_type.strip(): (row.template.strip(), row.parameters.split())
+        for row in table.itertuples() if row.template.strip()
+    }
+
+def load_whatsapp_templates(path=TEMPLATES_PATH):
+    """Template de cada tipo de disparo ({tipo: (nome do template, colunas dos parâmetros)}); vazio sem o arquivo."""
+    if not os.path.exists(path):
+        return {}
+    return load_cached_csv(path, _read_templates)
+
+def first_name(full_name):
+    """Primeiro nome com inicial maiúscula ('MARIA DA SILVA' -> 'Maria')."""
+    parts = str(full_name or '').split()
+    return parts[0].capitalize() if parts else ''
+
+def template_message(contact, appointment_type, templates, language=TEMPLATE_LANGUAGE):
+    """
+    Corpo da requisição /messages com o template do tipo de disparo preenchido com
+    os dados do contato. 'templates' vem de load_whatsapp_templates(); um tipo de
+    disparo sem template aprovado gera ValueError.
+    """
+    if appointment_type not in templates:
+        raise ValueError(
+            f"Nenhum template aprovado na Meta configurado para '{appointment_type}' "
+            f"(arquivo {TEMPLATES_PATH}, variável COFRAT_WHATSAPP_TEMPLATES)."
+        )
+    name, columns = templates[appointment_type]
+    values = [
+        first_name(contact.get('nome_do_paciente')) if column == 'primeiro_nome' else str(contact.get(column) or '')
+        for column in columns
+    ]
+    return {
+        "messaging_product": "whatsapp",
+        "to": str(contact.get('telefone_ajustado', '')).lstrip('+'),
+        "type": "template",
+        "template": {
+            "name": name,
+            "language": {"code": language},
+            "components": [{"type": "body", "parameters": [{"type": "text", "text": value} for value in values]}],
+        },
+    }
+
+
+class TokenBucket:
+    """
+    Balde de fichas de um número remetente: 'rate' fichas por segundo, até
+    'capacity' acumuladas. reserve() retira uma ficha e diz quanto esperar por
+    ela (o saldo pode ficar negativo: as reservas seguintes esperam em fila).
+    Seguro entre threads e entre loops do asyncio, então o mesmo balde vale para
+    todos os envios do processo.
+    """
+
+    def __init__(self, rate, capacity=1.0, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Segundos até a ficha reservada ficar disponível (0 se já está)."""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds):
+        """
+        Nenhuma nova ficha pelos próximos 'seconds' (resposta de limite da Meta para
+        este número). Pausas simultâneas não se somam: vale a mais longa.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _error_details(response):
+    """(código de erro da Graph API, mensagem) da resposta; (None, texto) se não for JSON."""
+    try:
+        error = response.json().get('error', {})
+        return error.get('code'), error.get('message', '') or response.text[:200]
+    except ValueError:
+        return None, response.text[:200]
+
+
+class WhatsAppSender:
+    """
+    Cliente da Cloud API com conexões reaproveitadas (HttpClient compartilhado ou
+    próprio) e um balde de fichas por phone_number_id. Uma instância pode ser
+    compartilhada por todo o servidor.
+    """
+
+    def __init__(self, token=ACCESS_TOKEN, api_url=GRAPH_API_URL, api_version=GRAPH_API_VERSION,
+                 messages_per_second=MESSAGES_PER_SECOND, max_in_flight=MAX_IN_FLIGHT,
+                 max_attempts=MAX_ATTEMPTS, timeout=REQUEST_TIMEOUT, backoff_base=BACKOFF_BASE, client=None):
+        self.base_url = f"{api_url.rstrip('/')}/{api_version}"
+        self.messages_per_second = messages_per_second
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.headers = {'Authorization': f"Bearer {token}"}
+        # Sem cliente compartilhado, um próprio com uma conexão por mensagem em voo
+        self._owns_client = client is None
+        self.client = client or HttpClient(pool_size=self.max_in_flight)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="cofrat-whatsapp",
+        )
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def bucket(self, phone_number_id):
+        """Balde de fichas do número remetente (criado no primeiro uso)."""
+        with self._buckets_lock:
+            if phone_number_id not in self._buckets:
+                self._buckets[phone_number_id] = TokenBucket(self.messages_per_second)
+            return self._buckets[phone_number_id]
+
+    def _post(self, phone_number_id, message):
+        return self.client.post(
+            f"{self.base_url}/{phone_number_id}/messages", json=message, headers=self.headers, timeout=self.timeout,
+            retry=False,
+        )
+
+    async def send_message(self, phone_number_id, message):
+        """Envia uma mensagem respeitando o balde do número; retorna dict com status, tentativas, http, message_id e erro."""
+        loop = asyncio.get_running_loop()
+        bucket = self.bucket(phone_number_id)
+        status_code, error = None, ''
+        for attempt in range(1, self.max_attempts + 1):
+            await bucket.acquire()
+            rate_limited = False
+            try:
+                response = await loop.run_in_executor(self.executor, self._post, phone_number_id, message)
+                status_code = response.status_code
+                if 200 <= status_code < 300:
+                    message_id = (response.json().get('messages') or [{}])[0].get('id', '')
+                    return {'status': MESSAGE_SENT, 'tentativas': attempt, 'http': status_code, 'message_id': message_id, 'erro': ''}
+                code, detail = _error_details(response)
+                error = f"{status_code} - {code}: {detail}" if code is not None else f"{status_code} - {detail}"
+                rate_limited = status_code == 429 or code in RATE_LIMIT_CODES
+                if not rate_limited and status_code not in RETRY_STATUS:
+                    break
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                status_code, error = None, str(e)
+            except requests.exceptions.RequestException as e:
+                status_code, error = None, str(e)
+                break
+            if attempt < self.max_attempts:
+                delay = backoff_delay(attempt, base=self.backoff_base, maximum=BACKOFF_MAX)
+                if rate_limited:
+                    # O limite é do número: segura todas as mensagens dele (esta espera no próximo acquire)
+                    bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+        return {'status': MESSAGE_FAILED, 'tentativas': attempt, 'http': status_code, 'message_id': '', 'erro': error}
+
+    async def send_batch(self, messages, phone_number_id=PHONE_NUMBER_ID, on_result=None):
+        """
+        Envia as mensagens (no máximo max_in_flight esperando resposta ao mesmo
+        tempo) e retorna o DataFrame de resultados (RESULT_COLUMNS), na ordem das
+        mensagens. 'on_result(resultado, concluídas, total)' é chamado a cada mensagem.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        results = [None] * len(messages)
+        done = 0
+
+        async def run(position, message):
+            nonlocal done
+            async with semaphore:
+                started = time.perf_counter()
+                outcome = await self.send_message(phone_number_id, message)
+            results[position] = {
+                'posicao': position, 'telefone': message.get('to', ''), **outcome,
+                'segundos': round(time.perf_counter() - started, 3),
+            }
+            done += 1
+            if on_result is not None:
+                on_result(results[position], done, len(messages))
+
+        await asyncio.gather(*(run(position, message) for position, message in enumerate(messages)))
+        return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+    def send_template_messages(self, contacts, appointment_type, phone_number_id=PHONE_NUMBER_ID, on_result=None,
+                               templates=None):
+        """
+        Versão síncrona para o app: monta as mensagens de template dos contatos
+        (dicts) e envia todas. 'templates' padrão: load_whatsapp_templates().
+        """
+        templates = load_whatsapp_templates() if templates is None else templates
+        messages = [template_message(contact, appointment_type, templates) for contact in contacts]
+        return asyncio.run(self.send_batch(messages, phone_number_id, on_result))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self._owns_client:
+            self.client.close()